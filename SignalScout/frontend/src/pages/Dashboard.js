@@ -41,7 +41,7 @@ const Dashboard = () => {
       // Load analytics and trends in parallel
       const [analyticsData, trendsData] = await Promise.all([
         getViralityAnalytics(7),
-        getTrends(10)
+        getTrends(10, { fields: 'id,platform,topic_cluster,title,score,engagement_rate,virality_score' })
       ]);
       
       setAnalytics(analyticsData.analytics || analyticsData);
@@ -11,7 +11,7 @@ import {
   Calendar,
   Tag
 } from 'lucide-react';
-import { fetchRedditTrends, fetchYouTubeTrends, getTrends } from '../services/api';
+import { fetchRedditTrends, fetchYouTubeTrends, getTrends, waitForJob } from '../services/api';
 import toast from 'react-hot-toast';
 
 const Trends = () => {
@@ -20,8 +20,12 @@ const Trends = () => {
   const [filters, setFilters] = useState({
     platform: 'all',
     topic: 'all',
+    sentiment: 'all',
     sortBy: 'virality_score'
   });
+  const [knownTopics, setKnownTopics] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [subredditInput, setSubredditInput] = useState('technology');
 
@@ -29,17 +33,38 @@ const Trends = () => {
     loadTrends();
   }, [filters]);
 
-  const loadTrends = async () => {
+  // With a cursor the next page is appended to the loaded trends
+  const loadTrends = async (cursor = null) => {
     try {
-      setLoading(true);
-      const platform = filters.platform === 'all' ? null : filters.platform;
-      const data = await getTrends(100, platform);
-      setTrends(data.trends || []);
+      if (cursor) setLoadingMore(true);
+      else setLoading(true);
+      // Filtering and sorting happen on the server
+      const selected = (value) => (value === 'all' ? null : value);
+      const data = await getTrends(100, {
+        platform: selected(filters.platform),
+        topic: selected(filters.topic),
+        sentiment: selected(filters.sentiment),
+        sort: filters.sortBy,
+        cursor
+      });
+      const loaded = data.trends || [];
+      // An item re-scored while paging can show up on two pages
+      setTrends(previous => {
+        if (!cursor) return loaded;
+        const shown = new Set(previous.map(trend => trend.id));
+        return [...previous, ...loaded.filter(trend => !shown.has(trend.id))];
+      });
+      setNextCursor(data.next_cursor || null);
+      // Topics seen so far stay selectable once a topic filter narrows the list
+      setKnownTopics(previous => [...new Set([...previous, ...loaded.map(trend => trend.topic_cluster)])]
+        .filter(topic => topic)
+        .sort());
     } catch (error) {
       toast.error('Failed to load trends');
       console.error('Error loading trends:', error);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -47,11 +72,16 @@ const Trends = () => {
     try {
       setLoading(true);
       toast.loading('Fetching Reddit trends...');
-      await fetchRedditTrends(subredditInput, 25);
+      const { job_id: jobId } = await fetchRedditTrends(subredditInput, 25);
+      // Reload once the ingestion job has stored what it fetched
+      const job = await waitForJob(jobId);
       toast.dismiss();
-      toast.success(`Fetching trends from r/${subredditInput}`);
-      // Reload trends after a short delay
-      setTimeout(loadTrends, 2000);
+      if (job.state === 'failed') {
+        toast.error(`Failed to fetch trends from r/${subredditInput}`);
+      } else {
+        toast.success(`Fetched trends from r/${subredditInput}`);
+      }
+      loadTrends();
     } catch (error) {
       toast.dismiss();
       toast.error('Failed to fetch Reddit trends');
@@ -64,11 +94,16 @@ const Trends = () => {
     try {
       setLoading(true);
       toast.loading('Fetching YouTube trends...');
-      await fetchYouTubeTrends();
+      const { job_id: jobId } = await fetchYouTubeTrends();
+      // Reload once the ingestion job has stored what it fetched
+      const job = await waitForJob(jobId);
       toast.dismiss();
-      toast.success('Fetching YouTube trends');
-      // Reload trends after a short delay
-      setTimeout(loadTrends, 2000);
+      if (job.state === 'failed') {
+        toast.error('Failed to fetch YouTube trends');
+      } else {
+        toast.success('Fetched YouTube trends');
+      }
+      loadTrends();
     } catch (error) {
       toast.dismiss();
       toast.error('Failed to fetch YouTube trends');
@@ -77,26 +112,10 @@ const Trends = () => {
     }
   };
 
-  const filteredTrends = trends.filter(trend => {
-    const matchesSearch = trend.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                         trend.description?.toLowerCase().includes(searchTerm.toLowerCase());
-    const matchesTopicFilter = filters.topic === 'all' || trend.topic_cluster === filters.topic;
-    
-    return matchesSearch && matchesTopicFilter;
-  }).sort((a, b) => {
-    switch (filters.sortBy) {
-      case 'virality_score':
-        return b.virality_score - a.virality_score;
-      case 'engagement_rate':
-        return b.engagement_rate - a.engagement_rate;
-      case 'score':
-        return b.score - a.score;
-      case 'created_at':
-        return new Date(b.created_at) - new Date(a.created_at);
-      default:
-        return 0;
-    }
-  });
+  const filteredTrends = trends.filter(trend => 
+    trend.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
+    trend.description?.toLowerCase().includes(searchTerm.toLowerCase())
+  );
 
   const getUniqueTopics = () => {
     const topics = [...new Set(trends.map(trend => trend.topic_cluster))];
@@ -206,7 +225,7 @@ const Trends = () => {
           <p className="text-gray-600 mt-1">Discover viral content across platforms</p>
         </div>
         <button
-          onClick={loadTrends}
+          onClick={() => loadTrends()}
           disabled={loading}
           className="btn-primary flex items-center space-x-2"
         >
@@ -251,7 +270,7 @@ const Trends = () => {
 
       {/* Filters and Search */}
       <div className="card">
-        <div className="grid grid-cols-1 md:grid-cols-4 gap-4">
+        <div className="grid grid-cols-1 md:grid-cols-5 gap-4">
           <div className="relative">
             <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400 w-4 h-4" />
             <input
@@ -279,11 +298,22 @@ const Trends = () => {
             className="input-field"
           >
             <option value="all">All Topics</option>
-            {getUniqueTopics().map(topic => (
+            {knownTopics.map(topic => (
               <option key={topic} value={topic}>{topic}</option>
             ))}
           </select>
 
+          <select
+            value={filters.sentiment}
+            onChange={(e) => setFilters({ ...filters, sentiment: e.target.value })}
+            className="input-field"
+          >
+            <option value="all">All Sentiments</option>
+            <option value="positive">Positive</option>
+            <option value="neutral">Neutral</option>
+            <option value="negative">Negative</option>
+          </select>
+
           <select
             value={filters.sortBy}
             onChange={(e) => setFilters({ ...filters, sortBy: e.target.value })}
@@ -322,6 +352,19 @@ const Trends = () => {
         </div>
       )}
 
+      {!loading && nextCursor && (
+        <div className="flex justify-center">
+          <button
+            onClick={() => loadTrends(nextCursor)}
+            disabled={loadingMore}
+            className="btn-primary flex items-center space-x-2"
+          >
+            <RefreshCw className={`w-4 h-4 ${loadingMore ? 'animate-spin' : ''}`} />
+            <span>Load more</span>
+          </button>
+        </div>
+      )}
+
       {/* Stats */}
       {trends.length > 0 && (
         <div className="card">
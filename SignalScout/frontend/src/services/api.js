@@ -40,11 +40,31 @@ export const fetchYouTubeTrends = async () => {
   return response.data;
 };
 
-export const getTrends = async (limit = 50, platform = null) => {
+// Resolves once the ingestion job finishes or `wait` seconds pass
+export const getJob = async (jobId, wait = 0) => {
+  const response = await api.get(`/jobs/${jobId}`, { params: { wait } });
+  return response.data;
+};
+
+// Long-polls until the job has finished; each poll stays under the
+// request timeout
+export const waitForJob = async (jobId) => {
+  for (;;) {
+    const { job } = await getJob(jobId, 25);
+    if (job.finished_at) return job;
+  }
+};
+
+// filters: platform, topic, sentiment, tag (array), min_virality,
+// max_virality, since, until, author, sort, order and cursor (next_cursor
+// of the previous page); unset ones are left out
+export const getTrends = async (limit = 50, filters = {}) => {
   const params = { limit };
-  if (platform) params.platform = platform;
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value !== null && value !== undefined && value !== '') params[key] = value;
+  });
   
-  const response = await api.get('/trends', { params });
+  const response = await api.get('/trends', { params, paramsSerializer: { indexes: null } });
   return response.data;
 };
 
@@ -59,9 +79,10 @@ export const generateContent = async (trendId, contentType, brandVoice, targetAu
   return response.data;
 };
 
-export const getContentVault = async (limit = 50, topic = null) => {
+export const getContentVault = async (limit = 50, topic = null, cursor = null) => {
   const params = { limit };
   if (topic) params.topic = topic;
+  if (cursor) params.cursor = cursor;
   
   const response = await api.get('/content/vault', { params });
   return response.data;
@@ -0,0 +1,183 @@
+# Latency of the read endpoints under mixed load, with the database called
+# synchronously from async handlers (how the endpoints used to work) and
+# through the async session. Fast /trends and /content/vault requests run
+# alongside slow /analytics/virality requests over a large table; with the
+# sync session every slow query stalls the event loop and everything queued
+# behind it.
+#
+#   python benchmarks/bench_async_db.py --rows 300000 --seconds 15
+#   BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_async_db.py
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="signalscout-bench-")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from database import engine, SessionLocal, AsyncSessionLocal, dispose_async_engine  # noqa: E402
+from models import GeneratedContent, TrendingContent  # noqa: E402
+from services.migrations import run_migrations  # noqa: E402
+from services.storage import bulk_upsert_trending_content  # noqa: E402
+from services.trend_analyzer import TrendAnalyzer  # noqa: E402
+from services.content_generator import ContentGenerator  # noqa: E402
+
+TOPICS = ["technology", "music", "gaming", "politics", "science", "sports"]
+
+def seed(rows: int):
+    rng = random.Random(7)
+    now = datetime.now()
+    db = SessionLocal()
+    for start in range(0, rows, 10000):
+        items = [
+            {
+                "platform": rng.choice(["reddit", "youtube"]),
+                "content_id": f"bench{i}",
+                "title": f"Benchmark item {i}",
+                "description": "x" * 200,
+                "url": f"https://example.com/{i}",
+                "author": f"author{i % 500}",
+                "score": rng.randint(0, 50000),
+                "comments_count": rng.randint(0, 3000),
+                "engagement_rate": rng.random() * 10,
+                "virality_score": rng.random() * 100,
+                "tags": ["trending"],
+                "sentiment": rng.choice(["positive", "neutral", "negative"]),
+                "topic_cluster": rng.choice(TOPICS),
+                "story_id": rng.randrange(rows // 3 or 1)
+            }
+            for i in range(start, min(start + 10000, rows))
+        ]
+        bulk_upsert_trending_content(db, items)
+        db.commit()
+    # Spread created_at over a month so the analytics window is a real range
+    table = TrendingContent.__table__
+    for day in range(30):
+        db.execute(table.update().where(table.c.id % 30 == day).values(created_at=now - timedelta(days=day)))
+    db.add_all([
+        GeneratedContent(trend_id=rng.randint(1, rows), content_type="tweet", generated_text="x" * 200,
+                         brand_voice="default", target_audience="general", quality_score=80.0,
+                         topic_cluster=rng.choice(TOPICS), performance_prediction=rng.random() * 100)
+        for _ in range(2000)
+    ])
+    db.commit()
+    db.close()
+
+def build_app() -> FastAPI:
+    analyzer = TrendAnalyzer()
+    generator = ContentGenerator()
+    app = FastAPI()
+
+    # The previous handlers: async endpoints calling the sync session
+    @app.get("/sync/trends")
+    async def sync_trends(limit: int = 50):
+        db = SessionLocal()
+        trends = analyzer.get_trending_content(db, limit)
+        db.close()
+        return {"trends": trends}
+
+    @app.get("/sync/analytics/virality")
+    async def sync_analytics(days: int = 30):
+        db = SessionLocal()
+        analytics = analyzer.get_virality_analytics(db, days)
+        db.close()
+        return {"analytics": analytics}
+
+    @app.get("/sync/content/vault")
+    async def sync_vault(limit: int = 50):
+        db = SessionLocal()
+        content = generator.get_generated_content(db, limit)
+        db.close()
+        return {"content": content}
+
+    # The handlers in main.py
+    @app.get("/async/trends")
+    async def async_trends(limit: int = 50):
+        async with AsyncSessionLocal() as db:
+            trends = await analyzer.get_trending_content_async(db, limit)
+        return {"trends": trends}
+
+    @app.get("/async/analytics/virality")
+    async def async_analytics(days: int = 30):
+        async with AsyncSessionLocal() as db:
+            analytics = await analyzer.get_virality_analytics_async(db, days)
+        return {"analytics": analytics}
+
+    @app.get("/async/content/vault")
+    async def async_vault(limit: int = 50):
+        async with AsyncSessionLocal() as db:
+            content = await generator.get_generated_content_async(db, limit)
+        return {"content": content}
+
+    return app
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+async def run(app: FastAPI, mode: str, seconds: float, fast_clients: int, slow_clients: int, rate: float):
+    latencies = {"/trends": [], "/content/vault": [], "/analytics/virality": []}
+    started = time.perf_counter()
+    deadline = started + seconds
+
+    async def slow_client(path: str):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+            while time.perf_counter() < deadline:
+                sent = time.perf_counter()
+                response = await http.get(f"/{mode}{path}")
+                response.raise_for_status()
+                latencies[path].append(time.perf_counter() - sent)
+
+    async def fast_client(path: str, offset: float):
+        # Requests go out on a fixed schedule and latency counts from when
+        # each was due, so time spent waiting for a blocked loop is included
+        due = started + offset
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+            while due < deadline:
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                response = await http.get(f"/{mode}{path}")
+                response.raise_for_status()
+                latencies[path].append(time.perf_counter() - due)
+                due += 1 / rate
+
+    clients = [slow_client("/analytics/virality") for _ in range(slow_clients)]
+    for i in range(fast_clients):
+        clients.append(fast_client("/trends" if i % 2 == 0 else "/content/vault", i / (rate * fast_clients)))
+    await asyncio.gather(*clients)
+
+    for path, samples in latencies.items():
+        if not samples:
+            continue
+        print(f"  {mode:>5} {path:<20} {len(samples):>6} requests  "
+              f"p50 {percentile(samples, 0.5):>8.1f} ms  p99 {percentile(samples, 0.99):>8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--fast-clients", type=int, default=4)
+    parser.add_argument("--slow-clients", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=5.0, help="requests per second per fast client")
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    started = time.perf_counter()
+    seed(args.rows)
+    print(f"seeded {args.rows:,} rows in {time.perf_counter() - started:.1f}s "
+          f"({engine.dialect.name}, {args.fast_clients} fast + {args.slow_clients} slow clients)")
+
+    app = build_app()
+    for mode in ("sync", "async"):
+        asyncio.run(run(app, mode, args.seconds, args.fast_clients, args.slow_clients, args.rate))
+    asyncio.run(dispose_async_engine())
+
+if __name__ == "__main__":
+    main()
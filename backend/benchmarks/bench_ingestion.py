@@ -0,0 +1,77 @@
+# End-to-end ingestion throughput against the replayed Reddit and YouTube
+# APIs, runnable on an offline machine.
+#
+#   python benchmarks/bench_ingestion.py --subreddits 200 --scale 50 --latency-ms 80
+#
+# Fixtures default to the small synthetic set in benchmarks/fixtures; point
+# --fixtures at a directory captured with SIGNALSCOUT_API_MODE=record to
+# replay real traffic. --scale multiplies every listing and chart, so
+# 200 subreddits x 10 fixture posts x 50 = 100k submissions.
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def configure(args):
+    os.environ["SIGNALSCOUT_API_MODE"] = "replay"
+    os.environ["SIGNALSCOUT_FIXTURE_DIR"] = args.fixtures
+    os.environ["REPLAY_SCALE"] = str(args.scale)
+    os.environ["REPLAY_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["REPLAY_ERROR_RATE"] = str(args.error_rate)
+    os.environ["REPLAY_SEED"] = "1"
+    os.environ["REDDIT_MIN_REFRESH_SECONDS"] = "0"
+    os.environ["REDDIT_FETCH_CONCURRENCY"] = str(args.concurrency)
+    os.environ["YOUTUBE_FETCH_CONCURRENCY"] = str(args.concurrency)
+    os.environ.setdefault(
+        "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='signalscout-bench-')}/bench.db"
+    )
+
+async def run(args):
+    from database import engine
+    from models import Base
+    from services.reddit_service import RedditService
+    from services.youtube_service import YouTubeService
+
+    Base.metadata.create_all(bind=engine)
+
+    reddit = RedditService()
+    subreddits = [f"bench{i}" for i in range(args.subreddits)]
+    started = time.perf_counter()
+    report = await reddit.fetch_multiple_subreddits(subreddits, limit=args.posts_per_subreddit)
+    elapsed = time.perf_counter() - started
+    print(f"reddit   {len(subreddits):>5} subreddits  {report['total_posts']:>8} posts  "
+          f"{elapsed:>7.2f}s  {report['total_posts'] / elapsed:>9,.0f} posts/s  "
+          f"failed={len(report['failed'])}")
+
+    youtube = YouTubeService()
+    regions = [f"R{i:02d}" for i in range(args.regions)]
+    started = time.perf_counter()
+    harvest = await youtube.harvest_trending_regions(regions, limit_per_region=args.videos_per_region)
+    elapsed = time.perf_counter() - started
+    calls = sum(r["api_calls"] or 0 for r in harvest["regions"])
+    print(f"youtube  {len(regions):>5} regions     {harvest['unique_videos']:>8} videos "
+          f"{elapsed:>7.2f}s  {harvest['unique_videos'] / elapsed:>9,.0f} videos/s  api_calls={calls}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", default=os.path.join(BACKEND_DIR, "benchmarks", "fixtures"))
+    parser.add_argument("--subreddits", type=int, default=200)
+    parser.add_argument("--posts-per-subreddit", type=int, default=100)
+    parser.add_argument("--regions", type=int, default=20)
+    parser.add_argument("--videos-per-region", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    configure(args)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Latency of repeated dashboard loads through the response cache: a miss
+# (the data version moved, so the body is rebuilt), a hit (same version,
+# cached body sent again) and a revalidation that comes back 304. Requests
+# go through the real app over ASGI, without a network in between.
+#
+#   python benchmarks/bench_response_cache.py --rows 300000 --repeat 50
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="signalscout-bench-")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+os.environ.setdefault("STORY_INDEX_PATH", "")
+os.environ.setdefault("TOPIC_MODEL_PATH", "")
+
+import httpx  # noqa: E402
+from database import engine, SessionLocal, dispose_async_engine  # noqa: E402
+from services.migrations import run_migrations  # noqa: E402
+from services.storage import bulk_upsert_trending_content, bump_data_version  # noqa: E402
+import main as api  # noqa: E402
+
+TOPICS = ["technology", "music", "gaming", "politics", "science", "sports"]
+ENDPOINTS = ["/trends?limit=50", "/trends?limit=50&topic=music&sort=engagement_rate",
+             "/analytics/virality?days=7", "/content/vault?limit=50"]
+
+def seed(rows: int):
+    rng = random.Random(7)
+    db = SessionLocal()
+    for start in range(0, rows, 10000):
+        items = [
+            {
+                "platform": rng.choice(["reddit", "youtube"]),
+                "content_id": f"bench{i}",
+                "title": f"Benchmark item {i}",
+                "description": "x" * 200,
+                "url": f"https://example.com/{i}",
+                "author": f"author{i % 500}",
+                "score": rng.randint(0, 50000),
+                "comments_count": rng.randint(0, 3000),
+                "engagement_rate": rng.random() * 10,
+                "virality_score": rng.random() * 100,
+                "tags": ["trending"],
+                "sentiment": rng.choice(["positive", "neutral", "negative"]),
+                "topic_cluster": rng.choice(TOPICS)
+            }
+            for i in range(start, min(start + 10000, rows))
+        ]
+        bulk_upsert_trending_content(db, items)
+        db.commit()
+    db.close()
+
+def bump():
+    db = SessionLocal()
+    bump_data_version(db, "trends")
+    bump_data_version(db, "content")
+    db.commit()
+    db.close()
+
+def p50(samples):
+    return sorted(samples)[len(samples) // 2] * 1000
+
+async def measure(client: httpx.AsyncClient, path: str, repeat: int):
+    misses, hits, not_modified = [], [], []
+    for _ in range(repeat):
+        bump()
+        started = time.perf_counter()
+        response = await client.get(path)
+        misses.append(time.perf_counter() - started)
+        etag = response.headers["etag"]
+
+        started = time.perf_counter()
+        await client.get(path)
+        hits.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        response = await client.get(path, headers={"If-None-Match": etag})
+        not_modified.append(time.perf_counter() - started)
+        assert response.status_code == 304
+    return p50(misses), p50(hits), p50(not_modified), len(response.content)
+
+async def run(args):
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ENDPOINTS:
+            miss, hit, not_modified, _ = await measure(client, path, args.repeat)
+            print(f"{path:<55} miss {miss:>7.2f} ms  hit {hit:>6.2f} ms  304 {not_modified:>6.2f} ms")
+    await dispose_async_engine()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    started = time.perf_counter()
+    seed(args.rows)
+    print(f"seeded {args.rows:,} rows in {time.perf_counter() - started:.0f}s")
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Payload size and encoding cost of a 1,000-row /trends response: the full
+# items against a sparse fieldset, rendered with FastAPI's default path
+# (jsonable_encoder + JSONResponse) and with render_json, then compressed
+# with each encoding the response cache offers.
+#
+#   python benchmarks/bench_response_encoding.py --rows 1000 --repeat 50
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="signalscout-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/bench.db"
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from database import engine, SessionLocal  # noqa: E402
+from services.fieldsets import parse_fields  # noqa: E402
+from services.migrations import run_migrations  # noqa: E402
+from services.storage import bulk_upsert_trending_content  # noqa: E402
+from services.trend_analyzer import TREND_FIELDS, TrendAnalyzer  # noqa: E402
+from response_cache import ENCODERS, orjson, render_json  # noqa: E402
+
+TOPICS = ["technology", "music", "gaming", "politics", "science", "sports"]
+WORDS = ["launch", "update", "review", "guide", "breaking", "viral", "music", "startup", "market", "game"]
+# What the dashboard asks for
+DASHBOARD_FIELDS = "id,platform,topic_cluster,title,score,engagement_rate,virality_score"
+
+def seed(rows: int):
+    rng = random.Random(7)
+    db = SessionLocal()
+    items = [
+        {
+            "platform": rng.choice(["reddit", "youtube"]),
+            "content_id": f"bench{i}",
+            "title": " ".join(rng.choice(WORDS) for _ in range(8)),
+            "description": " ".join(rng.choice(WORDS) for _ in range(70))[:500],
+            "url": f"https://example.com/{i}",
+            "author": f"author{i % 500}",
+            "score": rng.randint(0, 50000),
+            "comments_count": rng.randint(0, 3000),
+            "engagement_rate": rng.random() * 10,
+            "virality_score": rng.random() * 100,
+            "tags": rng.sample(WORDS, 3),
+            "sentiment": rng.choice(["positive", "neutral", "negative"]),
+            "topic_cluster": rng.choice(TOPICS),
+            "created_at": datetime.now()
+        }
+        for i in range(rows)
+    ]
+    bulk_upsert_trending_content(db, items)
+    db.commit()
+    db.close()
+
+def p50_ms(run, repeat: int) -> float:
+    run()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    return sorted(samples)[len(samples) // 2] * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    seed(args.rows)
+    analyzer = TrendAnalyzer()
+    db = SessionLocal()
+    print(f"{args.rows:,} rows, serializer {'orjson' if orjson is not None else 'json'}, "
+          f"encodings {', '.join(ENCODERS)}")
+
+    for name, fields in (("full", None), ("fields=dashboard", DASHBOARD_FIELDS)):
+        selected = parse_fields(fields, TREND_FIELDS, ("id", "virality_score"))
+
+        def query():
+            db.expunge_all()
+            return {"trends": analyzer.get_trending_content(db, args.rows, fields=selected)}
+
+        payload = query()
+        default_ms = p50_ms(lambda: JSONResponse(jsonable_encoder(payload)).body, args.repeat)
+        fast_ms = p50_ms(lambda: render_json(payload), args.repeat)
+        body = render_json(payload)
+        assert body == JSONResponse(jsonable_encoder(payload)).body
+        print(f"{name:<17} query {p50_ms(query, args.repeat):>6.2f} ms  "
+              f"serialize default {default_ms:>6.2f} ms  render_json {fast_ms:>5.2f} ms  "
+              f"identity {len(body) / 1024:>6.1f} KiB")
+        for encoding, encode in ENCODERS.items():
+            compressed = encode(body)
+            print(f"{'':<17} {encoding:<6} {len(compressed) / 1024:>6.1f} KiB "
+                  f"({len(compressed) / len(body):.0%})  {p50_ms(lambda: encode(body), args.repeat):>6.2f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Sentiment scoring throughput on one core: the lexicon scorer in
+# services/sentiment.py over titles and descriptions, next to the six-word
+# counter it replaced, with the label mix each one produces.
+#
+#   python benchmarks/bench_sentiment.py --texts 100000
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.sentiment import BOOSTERS, DEFAULT_LEXICON, SentimentScorer
+from bench_enrichment import FILLER, legacy_analyze_sentiment
+
+def corpus(count, body_words, seed):
+    # Roughly one word in twelve carries sentiment, with the odd booster or
+    # negation in front of it
+    rng = random.Random(seed)
+    lexicon = list(DEFAULT_LEXICON)
+    modifiers = list(BOOSTERS) + ["not", "never", "don't", "isn't"]
+
+    def text(words):
+        out = []
+        for _ in range(words):
+            roll = rng.random()
+            if roll < 0.08:
+                if rng.random() < 0.25:
+                    out.append(rng.choice(modifiers))
+                out.append(rng.choice(lexicon))
+            else:
+                out.append(rng.choice(FILLER))
+        return " ".join(out) + ("!" if rng.random() < 0.1 else "")
+
+    return [(text(rng.randint(6, 14)).capitalize(), text(rng.randint(0, body_words))) for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=100000)
+    parser.add_argument("--body-words", type=int, default=80)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    docs = corpus(args.texts, args.body_words, args.seed)
+    words = sum(len(title.split()) + len(body.split()) for title, body in docs)
+    scorer = SentimentScorer()
+
+    started = time.perf_counter()
+    legacy = [legacy_analyze_sentiment(title) for title, _ in docs]
+    elapsed = time.perf_counter() - started
+    print(f"legacy   titles only         {len(docs) / elapsed:>10,.0f} texts/s")
+
+    started = time.perf_counter()
+    scores = []
+    for start in range(0, len(docs), args.batch):
+        scores.extend(scorer.score_batch(docs[start:start + args.batch]))
+    elapsed = time.perf_counter() - started
+    print(f"lexicon  titles+descriptions {len(docs) / elapsed:>10,.0f} texts/s  {words / elapsed:>12,.0f} words/s")
+
+    for name, labels in (("legacy", legacy), ("lexicon", [scorer.label(score) for score in scores])):
+        mix = Counter(labels)
+        print(f"{name:<8} " + "  ".join(f"{label}={mix[label] / len(labels):.1%}"
+                                        for label in ("positive", "negative", "neutral")))
+
+if __name__ == "__main__":
+    main()
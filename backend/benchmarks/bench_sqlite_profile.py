@@ -0,0 +1,144 @@
+# Concurrent ingestion and API reads against one SQLite file, with SQLite's
+# defaults ("plain") and with the WAL profile (read-only reader pool, writes
+# through the write queue). Writer threads upsert pages of items the way the
+# crawlers do; reader threads run the /trends and /analytics/virality
+# queries. Reports throughput, read latency and "database is locked" errors.
+#
+#   python benchmarks/bench_sqlite_profile.py --writers 8 --readers 8 --seconds 10
+#
+# Each profile runs in its own process, since the profile is picked when the
+# database module is imported.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def make_page(rng, writer: int, page: int, size: int):
+    return [
+        {
+            "platform": "reddit" if i % 2 else "youtube",
+            "content_id": f"w{writer}-{rng.randrange(page * size + size)}",
+            "title": f"Benchmark item {i}",
+            "description": "x" * 200,
+            "url": f"https://example.com/{writer}/{i}",
+            "author": f"author{i % 50}",
+            "score": rng.randint(0, 50000),
+            "comments_count": rng.randint(0, 3000),
+            "engagement_rate": rng.random() * 10,
+            "virality_score": rng.random() * 100,
+            "tags": ["trending"],
+            "sentiment": "neutral",
+            "topic_cluster": "technology"
+        }
+        for i in range(size)
+    ]
+
+def worker(args):
+    # Runs inside the child process for one profile
+    from database import ReadSessionLocal, engine
+    from services.migrations import run_migrations
+    from services.storage import bulk_upsert_trending_content
+    from services.snapshot_store import record_snapshots
+    from services.trend_analyzer import TrendAnalyzer
+    from services.write_queue import get_write_queue
+
+    run_migrations(engine)
+    analyzer = TrendAnalyzer()
+    write_queue = get_write_queue()
+    deadline = time.perf_counter() + args.seconds
+    lock = threading.Lock()
+    result = {"written": 0, "reads": 0, "write_errors": 0, "read_errors": 0, "locked": 0, "read_latencies": []}
+
+    def count_error(kind: str, error: Exception):
+        with lock:
+            result[kind] += 1
+            if "locked" in str(error):
+                result["locked"] += 1
+
+    def write_loop(writer: int):
+        rng = random.Random(writer)
+        page = 0
+        while time.perf_counter() < deadline:
+            items = make_page(rng, writer, page, args.page)
+            page += 1
+
+            def store(db):
+                bulk_upsert_trending_content(db, items)
+                record_snapshots(db, items)
+
+            try:
+                write_queue.run(store)
+                with lock:
+                    result["written"] += len(items)
+            except Exception as e:
+                count_error("write_errors", e)
+
+    def read_loop(reader: int):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            db = ReadSessionLocal()
+            try:
+                if reader % 4 == 0:
+                    analyzer.get_virality_analytics(db, 7)
+                else:
+                    analyzer.get_trending_content(db, 50)
+                with lock:
+                    result["reads"] += 1
+                    result["read_latencies"].append(time.perf_counter() - started)
+            except Exception as e:
+                count_error("read_errors", e)
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=write_loop, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=read_loop, args=(i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(result.pop("read_latencies")) or [0.0]
+    result["read_p50_ms"] = latencies[len(latencies) // 2] * 1000
+    result["read_p99_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    result["batches"] = write_queue.stats["batches"]
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--profile", choices=["plain", "wal"])
+    args = parser.parse_args()
+
+    if args.profile:
+        worker(args)
+        return
+
+    for profile in ("plain", "wal"):
+        with tempfile.TemporaryDirectory(prefix="signalscout-bench-") as directory:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{directory}/bench.db", SQLITE_PROFILE=profile,
+                       STORY_INDEX_PATH="", TOPIC_MODEL_PATH="")
+            output = subprocess.run(
+                [sys.executable, __file__, "--profile", profile, "--writers", str(args.writers),
+                 "--readers", str(args.readers), "--seconds", str(args.seconds), "--page", str(args.page)],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{profile:>5}  {result['written'] / args.seconds:>8,.0f} items/s written  "
+                  f"{result['reads'] / args.seconds:>7,.0f} reads/s  "
+                  f"read p50 {result['read_p50_ms']:>7.1f} ms  p99 {result['read_p99_ms']:>7.1f} ms  "
+                  f"errors {result['write_errors']} write / {result['read_errors']} read "
+                  f"({result['locked']} locked)  {result['batches']} commits batched")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Story grouping at scale: ingest synthetic items through the MinHash/LSH
+# story index in pages, with a share of them rewritten copies of earlier
+# items (reposts, cross-posts, video titles of the same story). Reports
+# throughput as the index grows, memory held, and how many copies landed
+# in their original's story.
+#
+#   python benchmarks/bench_story_index.py --items 1000000
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.story_index import StoryIndex
+from bench_enrichment import FILLER
+
+VOCABULARY_SIZE = 50000
+
+def rewrite(title, rng, vocabulary):
+    # Drop or swap a word or two, sometimes add a prefix or suffix
+    words = title.split()
+    for _ in range(rng.randint(0, 2)):
+        position = rng.randrange(len(words))
+        if rng.random() < 0.5 and len(words) > 6:
+            del words[position]
+        else:
+            words[position] = rng.choice(vocabulary)
+    if rng.random() < 0.3:
+        words = [rng.choice(["BREAKING:", "[video]", "Update:", "Watch:"])] + words
+    if rng.random() < 0.3:
+        words.append(rng.choice(["(reddit)", "| full story", "- reaction", "#shorts"]))
+    return " ".join(words)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--duplicates", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [f"w{i}" for i in range(VOCABULARY_SIZE)] + FILLER
+    originals = []
+    index = StoryIndex(path=None)
+
+    # (story of the original, title) for every rewritten copy
+    expected = []
+    total = 0.0
+    window = 0.0
+    for page_start in range(0, args.items, args.page):
+        docs = []
+        sources = []
+        for _ in range(args.page):
+            if originals and rng.random() < args.duplicates:
+                source = rng.randrange(len(originals))
+                docs.append((rewrite(originals[source][0], rng, vocabulary), "", ""))
+                sources.append(source)
+            else:
+                title = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(7, 14)))
+                docs.append((title, " ".join(rng.choice(vocabulary) for _ in range(20)), ""))
+                sources.append(None)
+        started = time.perf_counter()
+        stories = index.assign_batch(docs)
+        elapsed = time.perf_counter() - started
+        total += elapsed
+        window += elapsed
+        for doc, source, story in zip(docs, sources, stories):
+            if source is None:
+                originals.append((doc[0], story))
+            else:
+                expected.append((originals[source][1], story))
+
+        done = page_start + args.page
+        if done % (args.items // 10 or args.page) == 0:
+            stats = index.stats()
+            print(f"{done:>9,} items  {(args.items // 10 or args.page) / window:>9,.0f} items/s  "
+                  f"{stats['stories']:>9,} stories  {stats['memory_bytes'] / 1e6:>7.1f} MB arrays  "
+                  f"{stats['pending_keys']:>7,} pending")
+            window = 0.0
+
+    grouped = sum(1 for original, story in expected if original == story)
+    print(f"total    {args.items / total:,.0f} items/s over {args.items:,} items")
+    print(f"copies grouped with their original: {grouped / len(expected):.1%} of {len(expected):,}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index.path = os.path.join(directory, "story_index.npz")
+        started = time.perf_counter()
+        index.save(through=0)
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        loaded = StoryIndex(path=index.path)
+        print(f"save {saved:.2f}s  load {time.perf_counter() - started:.2f}s  "
+              f"{os.path.getsize(index.path) / 1e6:.1f} MB on disk  stories={loaded.stats()['stories']:,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Latency of filtered /trends queries over a large trending_content table.
+# Seeds rows spread over platforms, topics, sentiments, authors, tags and
+# three months of created_at, then runs each filter combination the
+# endpoint supports and reports its latency and the index the database
+# picked for it.
+#
+#   python benchmarks/bench_trend_filters.py --rows 1000000
+#   python benchmarks/bench_trend_filters.py --rows 10000000 --keep /tmp/trends-10m.db
+#
+# Seeding writes straight through the DBAPI connection; the indexes are
+# built once the rows are in, which is much faster than maintaining them
+# row by row. --keep reuses a database seeded by an earlier run.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000)
+parser.add_argument("--repeat", type=int, default=20)
+parser.add_argument("--keep", help="database file to seed once and reuse")
+args = parser.parse_args()
+
+_path = args.keep or os.path.join(tempfile.mkdtemp(prefix="signalscout-bench-"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from sqlalchemy import event, text  # noqa: E402
+from database import engine, SessionLocal  # noqa: E402
+from models import TrendingContent  # noqa: E402
+from services.migrations import run_migrations  # noqa: E402
+from services.trend_analyzer import TrendAnalyzer  # noqa: E402
+
+TOPICS = [f"topic-{i}" for i in range(40)]
+SENTIMENTS = ["positive", "neutral", "negative"]
+PLATFORMS = ["reddit", "reddit", "youtube"]
+TAGS = 5000
+DAYS = 90
+NOW = datetime(2026, 1, 1)
+
+def seed(rows: int):
+    rng = random.Random(7)
+    table = TrendingContent.__table__
+    indexes = [index for index in table.indexes if not index.unique]
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+    for index in indexes:
+        cursor.execute(f"DROP INDEX IF EXISTS {index.name}")
+
+    columns = ["platform", "content_id", "title", "url", "author", "score", "comments_count",
+               "engagement_rate", "virality_score", "tags", "sentiment", "topic_cluster", "story_id",
+               "created_at", "fetched_at"]
+    insert = f"INSERT INTO trending_content ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for start in range(0, rows, 50000):
+        batch, tag_rows = [], []
+        for i in range(start, min(start + 50000, rows)):
+            # Tag popularity is skewed: a few tags are on many items
+            tags = sorted({f"tag{min(TAGS - 1, int(rng.paretovariate(1.2)) - 1)}" for _ in range(3)})
+            created = (NOW - timedelta(seconds=rng.randrange(DAYS * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+            batch.append((rng.choice(PLATFORMS), f"bench{i}", f"Benchmark item {i}", f"https://example.com/{i}",
+                          f"author{rng.randrange(100000)}", rng.randint(0, 50000), rng.randint(0, 3000),
+                          rng.random() * 10, rng.random() * 100, '["' + '", "'.join(tags) + '"]',
+                          rng.choice(SENTIMENTS), rng.choice(TOPICS), rng.randrange(rows // 3 or 1),
+                          created, created))
+            tag_rows.extend((tag, i + 1) for tag in tags)
+        cursor.executemany(insert, batch)
+        cursor.executemany("INSERT OR IGNORE INTO trend_tags (tag, trend_id) VALUES (?, ?)", tag_rows)
+        connection.commit()
+
+    for index in indexes:
+        columns = ", ".join(column.name for column in index.columns)
+        cursor.execute(f"CREATE INDEX {index.name} ON {table.name} ({columns})")
+    # No ANALYZE: the planner sees what it sees in production
+    connection.commit()
+    connection.close()
+
+def combinations():
+    day = NOW - timedelta(days=1)
+    week = NOW - timedelta(days=7)
+    return [
+        ("default (virality)", {}),
+        ("platform=youtube", {"platform": "youtube"}),
+        ("topic", {"topic": "topic-3"}),
+        ("topic + sentiment", {"topic": "topic-3", "sentiment": "negative"}),
+        ("sentiment, sort=engagement_rate", {"sentiment": "positive", "sort": "engagement_rate"}),
+        ("min_virality=90, sort=score", {"min_virality": 90, "sort": "score"}),
+        ("virality 40-45, sort=created_at", {"min_virality": 40, "max_virality": 45, "sort": "created_at"}),
+        ("since 1 day", {"since": day}),
+        ("since 7 days, sort=created_at asc", {"since": week, "sort": "created_at", "order": "asc"}),
+        ("topic + since 7 days, sort=engagement", {"topic": "topic-3", "since": week, "sort": "engagement_rate"}),
+        ("topic, sort=score", {"topic": "topic-3", "sort": "score"}),
+        ("topic, sort=created_at", {"topic": "topic-3", "sort": "created_at"}),
+        ("author", {"author": "author42"}),
+        ("author, sort=virality", {"author": "author42", "sort": "virality_score"}),
+        ("common tag", {"tags": ["tag0"]}),
+        ("rare tag", {"tags": ["tag900"]}),
+        ("topic + common tag", {"topic": "topic-3", "tags": ["tag1"]}),
+        ("everything", {"platform": "reddit", "topic": "topic-3", "sentiment": "positive", "min_virality": 20,
+                        "since": week, "sort": "engagement_rate"}),
+        ("one_per_story", {"one_per_story": True}),
+    ]
+
+def plan(filters):
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        # The page query, not the trend_tags count before it
+        if statement.lstrip().upper().startswith("SELECT") and "FROM trending_content" in statement and not captured:
+            captured.append((statement, parameters))
+
+    db = SessionLocal()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        TrendAnalyzer().get_trending_content(db, 50, **filters)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        db.close()
+    statement, parameters = captured[0]
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return "; ".join(row[-1] for row in rows)
+
+def main():
+    run_migrations(engine)
+    with engine.connect() as connection:
+        stored = connection.execute(text("SELECT COUNT(*) FROM trending_content")).scalar()
+    if stored == 0:
+        started = time.perf_counter()
+        seed(args.rows)
+        print(f"seeded {args.rows:,} rows in {time.perf_counter() - started:.0f}s")
+    else:
+        print(f"reusing {stored:,} rows in {_path}")
+
+    analyzer = TrendAnalyzer()
+    for name, filters in combinations():
+        db = SessionLocal()
+        analyzer.get_trending_content(db, 50, **filters)  # warm the page cache
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            analyzer.get_trending_content(db, 50, **filters)
+            samples.append(time.perf_counter() - started)
+        db.close()
+        samples.sort()
+        print(f"{name:<40} p50 {samples[len(samples) // 2] * 1000:>7.2f} ms  "
+              f"max {samples[-1] * 1000:>7.2f} ms  {plan(filters)}")
+
+if __name__ == "__main__":
+    main()
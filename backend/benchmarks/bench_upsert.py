@@ -0,0 +1,91 @@
+# Bulk upsert throughput for trending_content.
+#
+#   python benchmarks/bench_upsert.py                 # temporary SQLite file
+#   BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_upsert.py
+#
+# Each size is measured twice: once with every row new (insert path) and once
+# re-upserting the same keys with fresh metrics (update path).
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="signalscout-bench-")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+
+from database import engine, SessionLocal  # noqa: E402
+from models import Base, DataVersion, EngagementSnapshot, TrendingContent, TrendTag  # noqa: E402
+from services.storage import bulk_upsert_trending_content  # noqa: E402
+
+def make_items(count: int, generation: int):
+    return [
+        {
+            "platform": "reddit" if i % 2 else "youtube",
+            "content_id": f"bench{i}",
+            "title": f"Benchmark item {i}",
+            "description": "x" * 200,
+            "url": f"https://example.com/{i}",
+            "author": f"author{i % 500}",
+            "score": i * generation,
+            "comments_count": i % 300,
+            "engagement_rate": (i % 100) / 10,
+            "virality_score": float(i % 100),
+            "tags": ["trending", "news"],
+            "sentiment": "neutral",
+            "topic_cluster": "technology"
+        }
+        for i in range(count)
+    ]
+
+def legacy_store(db, items):
+    # The per-row existence check this benchmark replaces
+    for item in items:
+        existing = db.query(TrendingContent).filter(
+            TrendingContent.content_id == item["content_id"],
+            TrendingContent.platform == item["platform"]
+        ).first()
+        if not existing:
+            db.add(TrendingContent(**item))
+
+def timed(store, items) -> float:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        store(db, items)
+        db.commit()
+        return time.perf_counter() - started
+    finally:
+        db.close()
+
+# Every table the upsert writes to
+TABLES = [TrendingContent.__table__, EngagementSnapshot.__table__, TrendTag.__table__, DataVersion.__table__]
+
+def reset_table():
+    Base.metadata.drop_all(bind=engine, tables=TABLES)
+    Base.metadata.create_all(bind=engine, tables=TABLES)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--legacy", action="store_true", help="also time the per-row path")
+    args = parser.parse_args()
+
+    print(f"database: {engine.url.render_as_string(hide_password=True)}")
+    print(f"{'path':<10}{'rows':>10}{'insert rows/s':>18}{'update rows/s':>18}")
+
+    paths = [("bulk", bulk_upsert_trending_content)]
+    if args.legacy:
+        paths.append(("legacy", legacy_store))
+
+    for name, store in paths:
+        for size in args.sizes:
+            reset_table()
+            inserted = timed(store, make_items(size, 1))
+            updated = timed(store, make_items(size, 2))
+            print(f"{name:<10}{size:>10}{size / inserted:>18,.0f}{size / updated:>18,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,146 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from typing import Iterator, Optional
 import os
 from dotenv import load_dotenv
+from db_pool import pool_monitor
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./signalscout.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# SQLite profile: "wal" (default) tunes file databases for concurrent
+# ingestion and API reads; "plain" keeps SQLite's defaults
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal")
+SQLITE_PRAGMAS = {
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative values are KiB rather than pages
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+}
+
+def _is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+WAL_PROFILE = _is_sqlite_file(DATABASE_URL) and SQLITE_PROFILE == "wal"
+
+def state_path(name: str) -> Optional[str]:
+    # Files derived from the stored rows (story index, topic model) sit next
+    # to the SQLite file they describe, so a different DATABASE_URL or
+    # working directory never picks up another database's state. Other
+    # databases have no such place; their files need an explicit path.
+    if not _is_sqlite_file(DATABASE_URL):
+        return None
+    base, _ = os.path.splitext(os.path.abspath(make_url(DATABASE_URL).database))
+    return f"{base}.{name}"
+
+def _sqlite_pragmas(dbapi_connection, connection_record, read_only: bool = False):
+    cursor = dbapi_connection.cursor()
+    if not read_only:
+        # Persistent in the file; readers then never block the writer
+        cursor.execute("PRAGMA journal_mode=WAL")
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def _serialized_writer(dbapi_connection, connection_record):
+    # Let SQLAlchemy issue BEGIN itself (pysqlite's implicit transactions
+    # break savepoints), and take the write lock when the transaction starts
+    # instead of failing to upgrade a read lock halfway through
+    dbapi_connection.isolation_level = None
+
+def _begin_immediate(connection):
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+_connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+
+engine = create_engine(DATABASE_URL, connect_args=_connect_args,
+                       poolclass=pool_monitor.pool_class("default", DATABASE_URL))
+
+if WAL_PROFILE:
+    event.listen(engine, "connect", _sqlite_pragmas)
+    # Queries get their own pool of read-only connections; every write from
+    # the write queue goes through a single connection
+    read_engine = create_engine(DATABASE_URL, connect_args=_connect_args,
+                                poolclass=pool_monitor.pool_class("read", DATABASE_URL))
+    event.listen(read_engine, "connect", partial(_sqlite_pragmas, read_only=True))
+    write_engine = create_engine(DATABASE_URL, connect_args=_connect_args, pool_size=1, max_overflow=0,
+                                 poolclass=pool_monitor.pool_class("write", DATABASE_URL))
+    event.listen(write_engine, "connect", _sqlite_pragmas)
+    event.listen(write_engine, "connect", _serialized_writer)
+    event.listen(write_engine, "begin", _begin_immediate)
+    pool_monitor.attach("read", read_engine)
+    pool_monitor.attach("write", write_engine)
+else:
+    read_engine = engine
+    write_engine = engine
+pool_monitor.attach("default", engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=write_engine)
+
+Base = declarative_base()
+
+@contextmanager
+def session_scope(factory: sessionmaker = SessionLocal) -> Iterator[Session]:
+    # Rolls back on error and always hands the connection back to the pool;
+    # committing stays with the caller
+    db = factory()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def get_db() -> Iterator[Session]:
+    # FastAPI dependencies, closed once the response is sent
+    with session_scope(SessionLocal) as db:
+        yield db
+
+def get_read_db() -> Iterator[Session]:
+    with session_scope(ReadSessionLocal) as db:
+        yield db
+
+# Async drivers for the same database, used by the read endpoints so a slow
+# query waits on the event loop instead of blocking it
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+def async_database_url(url: str = DATABASE_URL) -> str:
+    if os.getenv("ASYNC_DATABASE_URL"):
+        return os.getenv("ASYNC_DATABASE_URL")
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}; set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+@lru_cache(maxsize=None)
+def get_async_sessionmaker() -> async_sessionmaker:
+    # Created on first use, so the driver is only imported when an async
+    # endpoint is actually called
+    url = async_database_url()
+    async_engine = create_async_engine(url, poolclass=pool_monitor.pool_class("async", url, is_async=True))
+    pool_monitor.attach("async", async_engine.sync_engine)
+    if WAL_PROFILE:
+        # Only the read endpoints use it
+        event.listen(async_engine.sync_engine, "connect", partial(_sqlite_pragmas, read_only=True))
+    return async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def AsyncSessionLocal() -> AsyncSession:
+    return get_async_sessionmaker()()
 
-Base = declarative_base()
\ No newline at end of file
+async def dispose_async_engine():
+    if get_async_sessionmaker.cache_info().currsize:
+        await get_async_sessionmaker().kw["bind"].dispose()
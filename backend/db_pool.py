@@ -0,0 +1,168 @@
+import asyncio
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LEAK_THRESHOLD_SECONDS = float(os.getenv("DB_LEAK_THRESHOLD_SECONDS", "30"))
+LEAK_CHECK_SECONDS = float(os.getenv("DB_LEAK_CHECK_SECONDS", "10"))
+# Capturing the stack on every checkout costs a few tens of microseconds
+CAPTURE_STACKS = os.getenv("DB_LEAK_CAPTURE_STACKS", "true").lower() in ("1", "true", "yes")
+WAIT_SAMPLES = 2048
+SQLALCHEMY_PATH = f"{os.sep}sqlalchemy{os.sep}"
+
+def _percentile_ms(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+class PoolMonitor:
+    # Connections checked out of each engine's pool, how long callers waited
+    # for them, and which code has held one past the leak threshold
+    def __init__(self, leak_threshold: float = LEAK_THRESHOLD_SECONDS, capture_stacks: bool = CAPTURE_STACKS):
+        self.leak_threshold = leak_threshold
+        self.capture_stacks = capture_stacks
+        self._lock = threading.Lock()
+        self._engines: Dict[str, Engine] = {}
+        self._stats: Dict[str, Dict] = {}
+        self._held: Dict[int, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def pool_class(self, name: str, url: str, is_async: bool = False):
+        # Queue pools get a subclass that times the wait for a connection;
+        # other pools (in-memory SQLite) are left as they are
+        parsed = make_url(url)
+        base = parsed.get_dialect(is_async).get_pool_class(parsed)
+        if not issubclass(base, QueuePool):
+            return None
+        monitor = self
+
+        class InstrumentedPool(base):
+            def _do_get(self):
+                started = time.perf_counter()
+                try:
+                    connection = super()._do_get()
+                except Exception:
+                    monitor._record_wait(name, time.perf_counter() - started, timed_out=True)
+                    raise
+                monitor._record_wait(name, time.perf_counter() - started)
+                return connection
+
+        InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+        return InstrumentedPool
+
+    def attach(self, name: str, engine: Engine):
+        with self._lock:
+            if name in self._engines:
+                return
+            self._engines[name] = engine
+            self._stats[name] = {"checkouts": 0, "timeouts": 0, "waits": deque(maxlen=WAIT_SAMPLES),
+                                 "max_wait": 0.0, "max_held": 0.0}
+
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            held = {"engine": name, "since": time.monotonic(), "reported": False,
+                    "thread": threading.current_thread().name,
+                    "stack": traceback.extract_stack()[:-1] if self.capture_stacks else None}
+            with self._lock:
+                self._stats[name]["checkouts"] += 1
+                self._held[id(connection_record)] = held
+
+        def checkin(dbapi_connection, connection_record):
+            with self._lock:
+                held = self._held.pop(id(connection_record), None)
+                if held is not None:
+                    stats = self._stats[name]
+                    stats["max_held"] = max(stats["max_held"], time.monotonic() - held["since"])
+
+        event.listen(engine, "checkout", checkout)
+        event.listen(engine, "checkin", checkin)
+
+    def _record_wait(self, name: str, seconds: float, timed_out: bool = False):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                return
+            stats["waits"].append(seconds)
+            stats["max_wait"] = max(stats["max_wait"], seconds)
+            if timed_out:
+                stats["timeouts"] += 1
+
+    def check_leaks(self) -> int:
+        # Each connection held past the threshold is logged once, with the
+        # stack that checked it out
+        now = time.monotonic()
+        with self._lock:
+            leaked = [held for held in self._held.values()
+                      if not held["reported"] and now - held["since"] > self.leak_threshold]
+            for held in leaked:
+                held["reported"] = True
+        for held in leaked:
+            # SQLAlchemy's own frames say nothing about who holds the connection
+            frames = [frame for frame in held["stack"] or []
+                      if SQLALCHEMY_PATH not in frame.filename and not frame.filename.startswith("<sqlalchemy")]
+            stack = "".join(traceback.format_list(frames)) if held["stack"] else "(stack capture disabled)\n"
+            logger.warning(
+                f"Connection from {held['engine']} pool held for {now - held['since']:.1f}s "
+                f"by thread {held['thread']}, checked out at:\n{stack}"
+            )
+        return len(leaked)
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            engines = dict(self._engines)
+            stats = {name: {**values, "waits": list(values["waits"])} for name, values in self._stats.items()}
+            held = list(self._held.values())
+
+        report = {}
+        for name, engine in engines.items():
+            pool = engine.pool
+            values = stats[name]
+            held_here = [now - h["since"] for h in held if h["engine"] == name]
+            report[name] = {
+                "pool": type(pool).__name__,
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": len(held_here),
+                "overflow": max(0, pool.overflow()) if hasattr(pool, "overflow") else None,
+                "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+                "checkouts": values["checkouts"],
+                "wait_ms": {
+                    "p50": _percentile_ms(values["waits"], 0.5),
+                    "p99": _percentile_ms(values["waits"], 0.99),
+                    "max": round(values["max_wait"] * 1000, 3)
+                },
+                "timeouts": values["timeouts"],
+                "longest_held_seconds": round(max(held_here, default=0.0), 3),
+                "max_held_seconds": round(values["max_held"], 3),
+                "over_leak_threshold": sum(1 for seconds in held_here if seconds > self.leak_threshold)
+            }
+        return {"leak_threshold_seconds": self.leak_threshold, "engines": report}
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(LEAK_CHECK_SECONDS)
+            try:
+                self.check_leaks()
+            except Exception as e:
+                logger.error(f"Leak check failed: {str(e)}")
+
+pool_monitor = PoolMonitor()
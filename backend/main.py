@@ -1,22 +1,77 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from startup import startup_report
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional
+import asyncio
 import os
 from dotenv import load_dotenv
 
-from database import engine, SessionLocal
-from models import Base
-from services.reddit_service import RedditService
-from services.youtube_service import YouTubeService
-from services.content_generator import ContentGenerator
-from services.trend_analyzer import TrendAnalyzer
+from sqlalchemy.orm import Session
+
+from database import engine, get_read_db, dispose_async_engine
+from db_pool import pool_monitor
+from response_cache import response_cache
+from models import TopicCluster
+from services.trend_analyzer import TREND_FIELDS, TrendAnalyzer
+from services.migrations import run_migrations, schema_status
+from services.fieldsets import parse_fields
+from services.pagination import next_cursor
+from services.snapshot_store import get_snapshots, get_velocity
+from services.crawl_scheduler import CrawlScheduler, PRIORITY_INTERACTIVE, pages
+from services.refresh_planner import RefreshPlanner
+from services.job_registry import JobRegistry
+from services.write_queue import get_write_queue
 
 load_dotenv()
+startup_report.mark("import")
+
+crawl_scheduler = CrawlScheduler.from_env()
+job_registry = JobRegistry()
+
+MAX_JOB_WAIT_SECONDS = 60
+# The virality window slides with the clock, not only with ingests
+ANALYTICS_CACHE_SECONDS = float(os.getenv("ANALYTICS_CACHE_SECONDS", "60"))
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    run_migrations(engine)
+    startup_report.mark("schema")
+    response_cache.log_fallbacks()
+    await crawl_scheduler.start()
+    refresh_planner.load_from_env()
+    await refresh_planner.start()
+    await pool_monitor.start()
+    startup_report.finish()
+    # Started after the startup report so loading numpy and the saved model
+    # does not count towards time-to-ready
+    topic_clusterer = get_topic_clusterer()
+    if topic_clusterer is not None:
+        await topic_clusterer.start()
+    story_index = get_story_index()
+    if story_index is not None:
+        await story_index.start()
+    virality_engine = get_virality_engine()
+    if virality_engine is not None:
+        await virality_engine.start()
+    yield
+    if virality_engine is not None:
+        await virality_engine.stop()
+    if story_index is not None:
+        await story_index.stop()
+    if topic_clusterer is not None:
+        await topic_clusterer.stop()
+    await refresh_planner.stop()
+    await crawl_scheduler.stop()
+    # Last, so writes queued by the components above are committed
+    await get_write_queue().stop()
+    await dispose_async_engine()
+    await pool_monitor.stop()
 
-app = FastAPI(title="SignalScout - AI Content Intelligence", version="1.0.0")
+app = FastAPI(title="SignalScout - AI Content Intelligence", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,15 +86,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-reddit_service = RedditService()
-youtube_service = YouTubeService()
-content_generator = ContentGenerator()
 trend_analyzer = TrendAnalyzer()
+startup_report.mark("app")
+
+# Upstream clients are built on first use so replicas that only serve
+# analytics never import or construct them
+
+@lru_cache(maxsize=None)
+def get_reddit_service():
+    with startup_report.deferred("reddit_service"):
+        from services.reddit_service import RedditService
+        return RedditService()
+
+@lru_cache(maxsize=None)
+def get_youtube_service():
+    with startup_report.deferred("youtube_service"):
+        from services.youtube_service import YouTubeService
+        return YouTubeService()
+
+@lru_cache(maxsize=None)
+def get_content_generator():
+    with startup_report.deferred("content_generator"):
+        from services.content_generator import ContentGenerator
+        return ContentGenerator()
+
+@lru_cache(maxsize=None)
+def get_topic_clusterer():
+    with startup_report.deferred("topic_clusterer"):
+        from services.topic_clustering import get_topic_clusterer as load_topic_clusterer
+        return load_topic_clusterer()
+
+@lru_cache(maxsize=None)
+def get_story_index():
+    with startup_report.deferred("story_index"):
+        from services.story_index import get_story_index as load_story_index
+        return load_story_index()
+
+@lru_cache(maxsize=None)
+def get_virality_engine():
+    with startup_report.deferred("virality_engine"):
+        from services.virality import get_virality_engine as load_virality_engine
+        return load_virality_engine()
+
+refresh_planner = RefreshPlanner(crawl_scheduler, get_reddit_service, get_youtube_service)
 
 class TrendRequest(BaseModel):
     subreddit: str
     limit: int = 25
 
+class MultiTrendRequest(BaseModel):
+    subreddits: List[str]
+    limit: int = 25
+    max_concurrency: Optional[int] = None
+    wait: bool = False
+
+class YouTubeRegionsRequest(BaseModel):
+    regions: Optional[List[str]] = None
+    limit_per_region: int = 200
+
+class WatchSourceRequest(BaseModel):
+    kind: str  # "subreddit", "youtube_region", "keyword"
+    key: str
+    limit: Optional[int] = None
+
 class ContentGenerationRequest(BaseModel):
     trend_id: int
     content_type: str  # "tweet", "linkedin", "script", "carousel"
@@ -55,41 +164,231 @@ class BrandVoiceRequest(BaseModel):
 async def root():
     return {"message": "SignalScout API - AI Content Intelligence Platform", "status": "running"}
 
+@app.get("/health/startup")
+async def get_startup_report():
+    return startup_report.as_dict()
+
+@app.get("/health/schema")
+async def get_schema_status():
+    return schema_status(engine)
+
+@app.get("/health/db-pool")
+async def get_db_pool_status():
+    # Connections checked out per engine, wait times for one, and connections
+    # held past the leak threshold
+    return {**pool_monitor.snapshot(), "write_queue": {"depth": get_write_queue().depth(), **get_write_queue().stats}}
+
+@app.get("/health/response-cache")
+async def get_response_cache_stats():
+    return response_cache.status()
+
+@app.get("/enrichment/cache")
+async def get_enrichment_cache_stats():
+    from services.enrichment import get_enricher
+    enricher = get_enricher()
+    if enricher.cache is None:
+        return {"enabled": False, "dictionary_version": enricher.version}
+    return {"enabled": True, "dictionary_version": enricher.version, **enricher.cache.stats()}
+
+@app.get("/topics")
+async def get_topics(db: Session = Depends(get_read_db)):
+    try:
+        clusterer = get_topic_clusterer()
+        clusters = db.query(TopicCluster).order_by(TopicCluster.size.desc()).all()
+        return {
+            "enabled": clusterer is not None,
+            **(clusterer.status() if clusterer is not None else {}),
+            "topics": [
+                {"topic": f"cluster-{cluster.id}", "label": cluster.label, "terms": cluster.terms,
+                 "size": cluster.size, "updated_at": cluster.updated_at}
+                for cluster in clusters
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/topics/refit")
+async def refit_topics():
+    clusterer = get_topic_clusterer()
+    if clusterer is None:
+        raise HTTPException(status_code=503, detail="Topic clustering is disabled")
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, clusterer.refit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/stories/index")
+async def get_story_index_stats():
+    story_index = get_story_index()
+    if story_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **story_index.stats()}
+
+def submit_ingestion(kind: str, params: dict, provider: str, calls: dict, factory):
+    job = job_registry.create(kind, params)
+    crawl_job = crawl_scheduler.submit(
+        provider, f"{kind}:{job.id}", calls,
+        lambda: job_registry.run(job, lambda: factory(job)),
+        PRIORITY_INTERACTIVE
+    )
+    return job, crawl_job
+
+def ingestion_response(message: str, job, crawl_job) -> dict:
+    return {
+        "message": message,
+        "job_id": job.id,
+        "status": job.state,
+        "estimated_wait_seconds": crawl_scheduler.estimated_wait(crawl_job.provider, crawl_job.cost)
+    }
+
 @app.post("/trends/reddit")
-async def fetch_reddit_trends(request: TrendRequest, background_tasks: BackgroundTasks):
+async def fetch_reddit_trends(request: TrendRequest):
+    try:
+        job, crawl_job = submit_ingestion(
+            "reddit", {"subreddit": request.subreddit, "limit": request.limit},
+            "reddit", {"listing": pages("reddit", "listing", request.limit)},
+            lambda job: get_reddit_service().fetch_trending_posts(request.subreddit, request.limit, job)
+        )
+        return ingestion_response(f"Queued fetching trends from r/{request.subreddit}", job, crawl_job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/trends/reddit/batch")
+async def fetch_reddit_trends_batch(request: MultiTrendRequest):
     try:
-        background_tasks.add_task(reddit_service.fetch_trending_posts, request.subreddit, request.limit)
-        return {"message": f"Started fetching trends from r/{request.subreddit}", "status": "processing"}
+        job, crawl_job = submit_ingestion(
+            "reddit_batch", {"subreddits": request.subreddits, "limit": request.limit},
+            "reddit", {"listing": len(request.subreddits) * pages("reddit", "listing", request.limit)},
+            lambda job: get_reddit_service().fetch_multiple_subreddits(
+                request.subreddits, request.limit, request.max_concurrency, job
+            )
+        )
+        if request.wait:
+            report = await crawl_job.future
+            return {"report": report, "job_id": job.id, "status": "completed"}
+        
+        return ingestion_response(f"Queued fetching trends from {len(request.subreddits)} subreddits", job, crawl_job)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/trends/youtube")
-async def fetch_youtube_trends(background_tasks: BackgroundTasks):
+async def fetch_youtube_trends():
     try:
-        background_tasks.add_task(youtube_service.fetch_trending_videos)
-        return {"message": "Started fetching YouTube trending videos", "status": "processing"}
+        job, crawl_job = submit_ingestion(
+            "youtube", {"region": "US", "limit": 50},
+            "youtube", {"videos.list": pages("youtube", "videos.list", 50)},
+            lambda job: get_youtube_service().fetch_trending_videos(job=job)
+        )
+        return ingestion_response("Queued fetching YouTube trending videos", job, crawl_job)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/trends/youtube/regions")
+async def fetch_youtube_trends_by_region(request: YouTubeRegionsRequest):
+    try:
+        regions = request.regions or get_youtube_service().trending_regions
+        job, crawl_job = submit_ingestion(
+            "youtube_regions", {"regions": regions, "limit_per_region": request.limit_per_region},
+            "youtube", {"videos.list": len(regions) * pages("youtube", "videos.list", request.limit_per_region)},
+            lambda job: get_youtube_service().harvest_trending_regions(regions, request.limit_per_region, job)
+        )
+        return ingestion_response(f"Queued harvesting YouTube trending videos from {len(regions)} regions", job, crawl_job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 50):
+    return {"jobs": [job.as_dict() for job in job_registry.recent(limit)]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    job = job_registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    # Long-poll: return as soon as the job finishes, or after `wait` seconds
+    if wait > 0 and not job.finished:
+        await job.wait(min(wait, MAX_JOB_WAIT_SECONDS))
+    return {"job": job.as_dict()}
+
+@app.get("/scheduler/budget")
+async def get_crawl_budget():
+    return {"budget": crawl_scheduler.report()}
+
+@app.get("/sources")
+async def get_watched_sources():
+    return {"sources": refresh_planner.status()}
+
+@app.post("/sources")
+async def watch_source(request: WatchSourceRequest):
+    try:
+        source = refresh_planner.watch(request.kind, request.key, request.limit)
+        return {"source": source.as_dict()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/sources/{kind}/{key}")
+async def unwatch_source(kind: str, key: str):
+    if not refresh_planner.unwatch(kind, key):
+        raise HTTPException(status_code=404, detail="Source not watched")
+    return {"status": "removed"}
+
 @app.get("/trends")
-async def get_trends(limit: int = 50, platform: Optional[str] = None):
+async def get_trends(request: Request, limit: int = 50, platform: Optional[str] = None,
+                     one_per_story: bool = False, topic: Optional[str] = None, sentiment: Optional[str] = None,
+                     tag: Optional[List[str]] = Query(None), min_virality: Optional[float] = None,
+                     max_virality: Optional[float] = None, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, author: Optional[str] = None,
+                     sort: str = "virality_score", order: str = "desc", cursor: Optional[str] = None,
+                     fields: Optional[str] = None):
+    # Filters combine with AND; repeated tag parameters must all match.
+    # next_cursor fetches the following page with the same parameters.
+    # fields=id,title,... trims each item to those keys.
+    filters = {"topic": topic, "sentiment": sentiment, "tags": sorted(set(tag)) if tag else None,
+               "min_virality": min_virality, "max_virality": max_virality, "since": since, "until": until,
+               "author": author, "sort": sort, "order": order}
+
+    async def compute(db):
+        trends = await trend_analyzer.get_trending_content_async(db, limit, platform, one_per_story, cursor,
+                                                                 selected, **filters)
+        return {"trends": trends, "next_cursor": next_cursor(trends, limit, sort, order)}
+
+    try:
+        # Cursors are built from the id and the sort key
+        selected = parse_fields(fields, TREND_FIELDS + (("story_size",) if one_per_story else ()), ("id", sort))
+        params = {"limit": limit, "platform": platform, "one_per_story": one_per_story, "cursor": cursor,
+                  "fields": selected, **filters}
+        return await response_cache.respond(request, params, ("trends",), compute)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/trends/{trend_id}/snapshots")
+async def get_trend_snapshots(trend_id: int, since: Optional[int] = None, limit: int = 500,
+                              db: Session = Depends(get_read_db)):
+    try:
+        snapshots = get_snapshots(db, trend_id, since, limit)
+        return {"trend_id": trend_id, "snapshots": snapshots}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/trends/{trend_id}/velocity")
+async def get_trend_velocity(trend_id: int, window_hours: float = 6.0, db: Session = Depends(get_read_db)):
     try:
-        db = SessionLocal()
-        trends = trend_analyzer.get_trending_content(db, limit, platform)
-        db.close()
-        return {"trends": trends}
+        velocity = get_velocity(db, trend_id, window_hours)
+        return {"velocity": velocity}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/content/generate")
-async def generate_content(request: ContentGenerationRequest):
+async def generate_content(request: ContentGenerationRequest, db: Session = Depends(get_read_db)):
     try:
-        db = SessionLocal()
-        content = await content_generator.generate_content(
+        content = await get_content_generator().generate_content(
             db, request.trend_id, request.content_type, 
             request.brand_voice, request.target_audience
         )
-        db.close()
         return {"generated_content": content}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -97,7 +396,7 @@ async def generate_content(request: ContentGenerationRequest):
 @app.post("/brand-voice/train")
 async def train_brand_voice(request: BrandVoiceRequest):
     try:
-        voice_profile = await content_generator.train_brand_voice(
+        voice_profile = await get_content_generator().train_brand_voice(
             request.sample_content, request.brand_name, request.tone
         )
         return {"voice_profile": voice_profile, "status": "trained"}
@@ -105,22 +404,43 @@ async def train_brand_voice(request: BrandVoiceRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/analytics/virality")
-async def get_virality_analytics(days: int = 7):
+async def get_virality_analytics(request: Request, days: int = 7):
+    async def compute(db):
+        return {"analytics": await trend_analyzer.get_virality_analytics_async(db, days)}
+
+    try:
+        return await response_cache.respond(request, {"days": days}, ("trends",), compute,
+                                            max_age=ANALYTICS_CACHE_SECONDS)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/virality/baselines")
+async def get_virality_baselines():
+    # Per-platform distributions that virality scores are percentiles of
+    virality_engine = get_virality_engine()
+    if virality_engine is None:
+        return {"enabled": False}
     try:
-        db = SessionLocal()
-        analytics = trend_analyzer.get_virality_analytics(db, days)
-        db.close()
-        return {"analytics": analytics}
+        return {"enabled": True, "platforms": virality_engine.summary()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/content/vault")
-async def get_content_vault(limit: int = 50, topic: Optional[str] = None):
+async def get_content_vault(request: Request, limit: int = 50, topic: Optional[str] = None,
+                            cursor: Optional[str] = None, fields: Optional[str] = None):
+    async def compute(db):
+        content = await content_generator.get_generated_content_async(db, limit, topic, cursor, selected)
+        return {"content": content, "next_cursor": next_cursor(content, limit, "performance_prediction")}
+
     try:
-        db = SessionLocal()
-        content = content_generator.get_generated_content(db, limit, topic)
-        db.close()
-        return {"content": content}
+        content_generator = get_content_generator()
+        from services.content_generator import GENERATED_FIELDS
+        selected = parse_fields(fields, GENERATED_FIELDS, ("id", "performance_prediction"))
+        params = {"limit": limit, "topic": topic, "cursor": cursor, "fields": selected}
+        # Items carry the title and link of the trend that inspired them
+        return await response_cache.respond(request, params, ("content", "trends"), compute)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,9 +1,26 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, JSON, Index, LargeBinary
 from sqlalchemy.sql import func
 from database import Base
 
 class TrendingContent(Base):
     __tablename__ = "trending_content"
+    __table_args__ = (
+        # content_id first: with only a few platforms, a platform-led index
+        # would tempt the planner away from the sort-order walks below
+        Index("uq_trending_content_platform_content_id", "content_id", "platform", unique=True),
+        # /trends walks one of these in sort order (id breaks ties) and checks
+        # the remaining filters on the rows it reads. Topic and author
+        # filters are selective enough to lead their own indexes; topic only
+        # for the sorts TOPIC_SORTS lists. Every index here is written on
+        # each upsert, so there are no more than the queries pick.
+        Index("ix_trending_content_virality_filters", "virality_score", "id"),
+        Index("ix_trending_content_created_filters", "created_at", "id"),
+        Index("ix_trending_content_engagement_filters", "engagement_rate", "id"),
+        Index("ix_trending_content_score_filters", "score", "id"),
+        Index("ix_trending_content_topic_virality_filters", "topic_cluster", "virality_score", "id"),
+        Index("ix_trending_content_topic_engagement_filters", "topic_cluster", "engagement_rate", "id"),
+        Index("ix_trending_content_author_created", "author", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     platform = Column(String(50), nullable=False)
@@ -18,12 +35,95 @@ class TrendingContent(Base):
     virality_score = Column(Float, default=0.0)
     tags = Column(JSON)
     sentiment = Column(String(50))
+    sentiment_score = Column(Float)  # compound valence, -1 to 1
     topic_cluster = Column(String(100))
+    story_id = Column(Integer, index=True)  # near-duplicates across platforms share one
+    published_at = Column(DateTime(timezone=True))  # posted upstream; created_at is first seen
+    # Highest YouTube chart position in the latest harvest that saw it, and where
+    best_rank = Column(Integer)
+    best_rank_region = Column(String(10))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     fetched_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class TrendTag(Base):
+    # One row per tag of each item, so a tag filter is an index lookup
+    # instead of a scan of the JSON column
+    __tablename__ = "trend_tags"
+    
+    tag = Column(String(100), primary_key=True)
+    trend_id = Column(Integer, primary_key=True)
+
+class DataVersion(Base):
+    # Bumped in the same transaction as every write to data the cached read
+    # endpoints serve, so a cached response is current exactly as long as
+    # the versions it was computed under
+    __tablename__ = "data_versions"
+    
+    name = Column(String(50), primary_key=True)  # trends, content
+    version = Column(Integer, nullable=False, default=0)
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(255), nullable=False)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IngestionCursor(Base):
+    __tablename__ = "ingestion_cursors"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(255), nullable=False, unique=True)  # e.g. reddit:python
+    last_seen_fullname = Column(String(64))
+    last_seen_created_utc = Column(Float)
+    last_fetched_at = Column(DateTime(timezone=True))
+    items_processed = Column(Integer, default=0)
+
+class EngagementSnapshot(Base):
+    __tablename__ = "engagement_snapshots"
+    __table_args__ = (
+        Index("ix_engagement_snapshots_trend_captured", "trend_id", "captured_at"),
+        Index("ix_engagement_snapshots_resolution_captured", "resolution", "captured_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    trend_id = Column(Integer, nullable=False)
+    captured_at = Column(Integer, nullable=False)  # unix seconds, cheap to bucket
+    resolution = Column(String(8), nullable=False, default="raw")  # raw, hour, day
+    score = Column(Integer, default=0)
+    comments_count = Column(Integer, default=0)
+    virality_score = Column(Float, default=0.0)
+
+class TopicCluster(Base):
+    __tablename__ = "topic_clusters"
+    
+    id = Column(Integer, primary_key=True)  # stable across re-fits; topic_cluster is "cluster-<id>"
+    label = Column(String(255))
+    terms = Column(JSON)
+    size = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ViralitySketch(Base):
+    __tablename__ = "virality_sketches"
+    __table_args__ = (
+        Index("uq_virality_sketches_key", "platform", "topic", "feature", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    platform = Column(String(50), nullable=False)
+    topic = Column(String(100), nullable=False)  # "*" for the whole platform
+    feature = Column(String(50), nullable=False)
+    counts = Column(LargeBinary, nullable=False)  # float32 per log-spaced bin
+    decayed_at = Column(Float, nullable=False)  # unix seconds the counts are current to
+
 class GeneratedContent(Base):
     __tablename__ = "generated_content"
+    __table_args__ = (
+        # /content/vault, with and without a topic; id makes each a keyset
+        # for cursor pages
+        Index("ix_generated_content_performance", "performance_prediction", "id"),
+        Index("ix_generated_content_topic_performance", "topic_cluster", "performance_prediction", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     trend_id = Column(Integer, index=True)
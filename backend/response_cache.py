@@ -0,0 +1,173 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import DataVersion
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # bodies are rendered with the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip is offered on its own
+    brotli = None
+
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+ENABLED = os.getenv("RESPONSE_CACHE", "true").lower() in ("1", "true", "yes")
+# Bodies smaller than this go out as they are; compressing them saves less
+# than the headers cost
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+# Encodings in the order they are preferred when a client accepts several
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def render_json(content: Any) -> bytes:
+    # The same bytes JSONResponse would send, without walking the whole
+    # payload through jsonable_encoder first
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+    return JSONResponse(jsonable_encoder(content)).body
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in ENCODERS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def _digest(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def _etag(digest: str, encoding: Optional[str]) -> str:
+    # Each encoding is its own representation, so each gets its own strong
+    # validator
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+def _matches(if_none_match: Optional[str], digest: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 asks for If-None-Match; any encoding of
+    # the same body is still current
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        tag = tag[2:] if tag.startswith("W/") else tag
+        if tag.strip('"').split("-")[0] == digest:
+            return True
+    return False
+
+class ResponseCache:
+    # Rendered JSON bodies of the read endpoints, keyed by path and the parsed
+    # query parameters. Each entry remembers the data versions it was built
+    # from; the store layer bumps those on every ingest or generation commit,
+    # so an entry is served until the data under it actually changes. Clients
+    # revalidate with If-None-Match and get a 304 while the ETag still holds.
+    def __init__(self, max_entries: int = MAX_ENTRIES, enabled: bool = ENABLED):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0}
+
+    @staticmethod
+    def key(request: Request, params: Dict[str, Any]) -> Tuple:
+        # Parsed values rather than the raw query string, so "?limit=050",
+        # reordered parameters and spelled-out defaults share an entry
+        return request.url.path, json.dumps(jsonable_encoder(params), sort_keys=True)
+
+    async def respond(self, request: Request, params: Dict[str, Any], versions: Tuple[str, ...],
+                      compute: Callable[[AsyncSession], Awaitable[Any]], max_age: Optional[float] = None) -> Response:
+        key = self.key(request, params)
+        async with AsyncSessionLocal() as db:
+            # Read before compute(): a commit landing in between only makes
+            # the body newer than its versions, and the next request rebuilds
+            # it. The other order could keep serving stale data. Read from the
+            # database rather than kept in memory, as other processes (replicas,
+            # the rescore command) bump them too; a miss reuses the session.
+            current = await self.versions(db, versions)
+
+            entry = self._entries.get(key) if self.enabled else None
+            if entry is not None and entry["versions"] == current and (
+                    max_age is None or time.monotonic() - entry["stored_at"] < max_age):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+            else:
+                content = await compute(db)
+                body = render_json(content)
+                entry = {"versions": current, "digest": _digest(body), "body": body, "encoded": {},
+                         "stored_at": time.monotonic()}
+                self.stats["misses"] += 1
+                if self.enabled:
+                    self._store(key, entry)
+
+        body = entry["body"]
+        encoding = negotiate(request.headers.get("accept-encoding")) if len(body) >= COMPRESS_MIN_BYTES else None
+        headers = {"ETag": _etag(entry["digest"], encoding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if _matches(request.headers.get("if-none-match"), entry["digest"]):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            # Compressed once per entry and encoding, then reused by every hit
+            if encoding not in entry["encoded"]:
+                entry["encoded"][encoding] = ENCODERS[encoding](body)
+            body = entry["encoded"][encoding]
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    @staticmethod
+    async def versions(db: AsyncSession, names: Tuple[str, ...]) -> Tuple[int, ...]:
+        rows = await db.execute(select(DataVersion.name, DataVersion.version).where(DataVersion.name.in_(names)))
+        stored = dict(rows.all())
+        return tuple(stored.get(name, 0) for name in names)
+
+    def _store(self, key: Tuple, entry: Dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def log_fallbacks(self):
+        # Both are in requirements.txt; without them responses still go out,
+        # only slower to render or larger on the wire
+        if orjson is None:
+            logger.warning("orjson is not installed; response bodies are rendered with the json module")
+        if brotli is None:
+            logger.warning("brotli is not installed; responses are compressed with gzip only")
+
+    def status(self) -> Dict:
+        return {"enabled": self.enabled, "entries": len(self._entries), "max_entries": self.max_entries,
+                "serializer": "orjson" if orjson is not None else "json", "encodings": list(ENCODERS),
+                **self.stats}
+
+response_cache = ResponseCache()
@@ -0,0 +1,338 @@
+import copy
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit, parse_qsl
+import logging
+
+import httplib2
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stand-ins for the Reddit and YouTube APIs so ingestion can be load tested
+# offline.
+#
+#   SIGNALSCOUT_API_MODE=record  captures live praw / googleapiclient traffic
+#   SIGNALSCOUT_API_MODE=replay  serves it back from SIGNALSCOUT_FIXTURE_DIR
+#
+# Replay can add latency (REPLAY_LATENCY_MS), inject 503s (REPLAY_ERROR_RATE)
+# and multiply listing and chart payloads (REPLAY_SCALE), synthesizing unique
+# items from the recorded ones. Subreddits and regions without a fixture of
+# their own are served from any fixture recorded for the same route.
+
+MODE_LIVE = "live"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+# Query parameters that carry credentials or differ between runs and must
+# not be part of a fixture key
+_VOLATILE_PARAMS = {"key", "access_token", "prettyPrint", "alt"}
+
+_SUBREDDIT_LISTING = re.compile(r"^/r/([^/]+)/(hot|new|top|rising)/?$")
+
+class ReplayConfig:
+    def __init__(self, mode: str = MODE_LIVE, fixture_dir: str = "fixtures", latency_ms: float = 0.0,
+                 error_rate: float = 0.0, scale: int = 1, seed: Optional[int] = None):
+        self.mode = mode
+        self.fixture_dir = fixture_dir
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.scale = max(1, scale)
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "ReplayConfig":
+        seed = os.getenv("REPLAY_SEED")
+        return cls(
+            mode=os.getenv("SIGNALSCOUT_API_MODE", MODE_LIVE).lower(),
+            fixture_dir=os.getenv("SIGNALSCOUT_FIXTURE_DIR", "fixtures"),
+            latency_ms=float(os.getenv("REPLAY_LATENCY_MS", "0")),
+            error_rate=float(os.getenv("REPLAY_ERROR_RATE", "0")),
+            scale=int(os.getenv("REPLAY_SCALE", "1")),
+            seed=int(seed) if seed else None
+        )
+
+class FixtureStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Dict] = {}
+        self._by_route: Dict[str, List[Dict]] = {}
+        for path in sorted(glob.glob(os.path.join(directory, "*", "*.json"))):
+            with open(path) as handle:
+                self._index(json.load(handle))
+
+    def _index(self, fixture: Dict):
+        self._by_key[fixture["key"]] = fixture
+        self._by_route.setdefault(fixture["route"], []).append(fixture)
+
+    def find(self, key: str, route: str) -> Tuple[Optional[Dict], bool]:
+        # Exact match first, then any fixture recorded for the same route
+        if key in self._by_key:
+            return self._by_key[key], True
+        candidates = self._by_route.get(route)
+        return (candidates[0], False) if candidates else (None, False)
+
+    def save(self, provider: str, fixture: Dict):
+        folder = os.path.join(self.directory, provider)
+        os.makedirs(folder, exist_ok=True)
+        slug = re.sub(r"[^a-zA-Z0-9]+", "-", fixture["path"]).strip("-") or "root"
+        path = os.path.join(folder, f"{slug}-{fixture['key'][:10]}.json")
+        with self._lock:
+            with open(path, "w") as handle:
+                json.dump(fixture, handle, indent=1)
+            self._index(fixture)
+
+def fixture_key(method: str, url: str, params: Optional[Dict] = None) -> Tuple[str, str, Dict]:
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({k: str(v) for k, v in (params or {}).items() if v is not None})
+    query = {k: v for k, v in sorted(query.items()) if k not in _VOLATILE_PARAMS}
+    raw = f"{method.upper()} {parts.netloc}{parts.path}?{urlencode(query)}"
+    return hashlib.sha1(raw.encode()).hexdigest(), parts.path, query
+
+def reddit_route(path: str) -> str:
+    match = _SUBREDDIT_LISTING.match(path)
+    if match:
+        return f"reddit:listing:{match.group(2)}"
+    return f"reddit:{path}"
+
+def youtube_route(path: str, query: Dict) -> str:
+    resource = path.rstrip("/").rsplit("/", 1)[-1]
+    if resource == "videos":
+        return "youtube:videos.list:chart" if "chart" in query else "youtube:videos.list:id"
+    return f"youtube:{resource}.list"
+
+class _Chaos:
+    def __init__(self, config: ReplayConfig):
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.config.latency_ms > 0:
+            with self._lock:
+                jitter = self._random.uniform(0.5, 1.5)
+            time.sleep(self.config.latency_ms / 1000 * jitter)
+
+    def should_fail(self) -> bool:
+        if self.config.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.config.error_rate
+
+# ---------------------------------------------------------------- Reddit
+
+class RecordingSession(requests.Session):
+    def __init__(self, store: FixtureStore):
+        super().__init__()
+        self.store = store
+
+    def request(self, method, url, params=None, **kwargs):
+        response = super().request(method, url, params=params, **kwargs)
+        # Token exchanges carry credentials and are synthesized on replay
+        if "access_token" not in url and response.status_code == 200:
+            key, path, query = fixture_key(method, url, params)
+            self.store.save("reddit", {
+                "key": key, "route": reddit_route(path), "method": method.upper(),
+                "path": path, "params": query, "status": response.status_code,
+                "body": response.json()
+            })
+        return response
+
+class ReplaySession(requests.Session):
+    def __init__(self, store: FixtureStore, config: ReplayConfig, chaos: _Chaos):
+        super().__init__()
+        self.store = store
+        self.config = config
+        self.chaos = chaos
+
+    def request(self, method, url, params=None, **kwargs):
+        self.chaos.delay()
+        if "access_token" in url:
+            return self._response(url, 200, {
+                "access_token": "replay-token", "token_type": "bearer",
+                "expires_in": 86400, "scope": "*"
+            })
+        if self.chaos.should_fail():
+            return self._response(url, 503, {"message": "Injected replay error", "error": 503})
+
+        key, path, query = fixture_key(method, url, params)
+        route = reddit_route(path)
+        fixture, exact = self.store.find(key, route)
+        if fixture is None:
+            return self._response(url, 404, {"message": f"No fixture for {route}", "error": 404})
+        if exact and self.config.scale == 1:
+            return self._response(url, fixture["status"], fixture["body"])
+
+        match = _SUBREDDIT_LISTING.match(path)
+        if not match:
+            return self._response(url, fixture["status"], fixture["body"])
+        return self._response(url, 200, self._synthesize_listing(fixture["body"], match.group(1), query))
+
+    def _synthesize_listing(self, template: Dict, subreddit: str, query: Dict) -> Dict:
+        children = template["data"]["children"]
+        total = len(children) * self.config.scale
+        offset = _synthetic_offset(query.get("after"), "t3_rp")
+        limit = int(query.get("limit", 25))
+
+        page = []
+        for index in range(offset, min(offset + limit, total)):
+            child = copy.deepcopy(children[index % len(children)])
+            data = child["data"]
+            data["id"] = f"{data['id']}{subreddit.lower()}{index}"
+            data["name"] = f"t3_{data['id']}"
+            data["subreddit"] = subreddit
+            data["permalink"] = f"/r/{subreddit}/comments/{data['id']}/"
+            page.append(child)
+
+        listing = copy.deepcopy(template)
+        listing["data"]["children"] = page
+        listing["data"]["dist"] = len(page)
+        listing["data"]["after"] = f"t3_rp{offset + len(page)}" if offset + len(page) < total else None
+        return listing
+
+    def _response(self, url: str, status: int, body: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = json.dumps(body).encode()
+        response.headers = CaseInsensitiveDict({"content-type": "application/json; charset=UTF-8"})
+        return response
+
+# ---------------------------------------------------------------- YouTube
+
+class RecordingHttp:
+    def __init__(self, store: FixtureStore):
+        self.store = store
+        self._http = httplib2.Http()
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        response, content = self._http.request(uri, method, body=body, headers=headers, **kwargs)
+        if response.status == 200:
+            key, path, query = fixture_key(method, uri)
+            self.store.save("youtube", {
+                "key": key, "route": youtube_route(path, query), "method": method.upper(),
+                "path": path, "params": query, "status": 200,
+                "body": json.loads(content)
+            })
+        return response, content
+
+class ReplayHttp:
+    def __init__(self, store: FixtureStore, config: ReplayConfig, chaos: _Chaos):
+        self.store = store
+        self.config = config
+        self.chaos = chaos
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.chaos.delay()
+        if self.chaos.should_fail():
+            return self._response(503, {"error": {"code": 503, "message": "Injected replay error"}})
+
+        key, path, query = fixture_key(method, uri)
+        route = youtube_route(path, query)
+        fixture, exact = self.store.find(key, route)
+        if fixture is None:
+            return self._response(404, {"error": {"code": 404, "message": f"No fixture for {route}"}})
+        if exact and self.config.scale == 1:
+            return self._response(fixture["status"], fixture["body"])
+
+        template = fixture["body"]
+        if route == "youtube:videos.list:id":
+            return self._response(200, self._synthesize_by_id(template, query))
+        if route in ("youtube:videos.list:chart", "youtube:search.list"):
+            return self._response(200, self._synthesize_page(template, route, query))
+        return self._response(fixture["status"], template)
+
+    def _synthesize_page(self, template: Dict, route: str, query: Dict) -> Dict:
+        items = template.get("items", [])
+        total = len(items) * self.config.scale
+        offset = _synthetic_offset(query.get("pageToken"), "rp")
+        limit = int(query.get("maxResults", 5))
+
+        page = []
+        for index in range(offset, min(offset + limit, total)):
+            item = copy.deepcopy(items[index % len(items)])
+            # Ids only depend on position, so the same synthetic video can
+            # trend in several regions like real ones do
+            if route == "youtube:search.list":
+                item["id"]["videoId"] = f"{item['id']['videoId']}{index}"
+            else:
+                item["id"] = f"{item['id']}{index}"
+            page.append(item)
+
+        result = copy.deepcopy(template)
+        result["items"] = page
+        result["pageInfo"] = {"totalResults": total, "resultsPerPage": limit}
+        result.pop("nextPageToken", None)
+        if offset + len(page) < total:
+            result["nextPageToken"] = f"rp{offset + len(page)}"
+        return result
+
+    def _synthesize_by_id(self, template: Dict, query: Dict) -> Dict:
+        items = template.get("items", [])
+        result = copy.deepcopy(template)
+        result["items"] = []
+        for index, video_id in enumerate(query.get("id", "").split(",")):
+            if video_id and items:
+                item = copy.deepcopy(items[index % len(items)])
+                item["id"] = video_id
+                result["items"].append(item)
+        return result
+
+    def _response(self, status: int, body: Dict):
+        response = httplib2.Response({"status": str(status), "content-type": "application/json; charset=UTF-8"})
+        return response, json.dumps(body).encode()
+
+def _synthetic_offset(token: Optional[str], prefix: str) -> int:
+    if token and token.startswith(prefix) and token[len(prefix):].isdigit():
+        return int(token[len(prefix):])
+    return 0
+
+# ---------------------------------------------------------------- wiring
+
+class ApiTransport:
+    def __init__(self, config: ReplayConfig):
+        self.config = config
+        self.store = FixtureStore(config.fixture_dir) if config.mode != MODE_LIVE else None
+        self.chaos = _Chaos(config)
+        if config.mode != MODE_LIVE:
+            logger.info(f"API transport in {config.mode} mode using {config.fixture_dir}")
+
+    @property
+    def live(self) -> bool:
+        return self.config.mode == MODE_LIVE
+
+    def reddit_session(self) -> Optional[requests.Session]:
+        if self.config.mode == MODE_RECORD:
+            return RecordingSession(self.store)
+        if self.config.mode == MODE_REPLAY:
+            return ReplaySession(self.store, self.config, self.chaos)
+        return None
+
+    def youtube_http(self):
+        if self.config.mode == MODE_RECORD:
+            return RecordingHttp(self.store)
+        if self.config.mode == MODE_REPLAY:
+            return ReplayHttp(self.store, self.config, self.chaos)
+        return httplib2.Http()
+
+_transport: Optional[ApiTransport] = None
+_transport_lock = threading.Lock()
+
+def get_transport() -> ApiTransport:
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = ApiTransport(ReplayConfig.from_env())
+        return _transport
@@ -1,18 +1,34 @@
-import openai
 import os
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import GeneratedContent, BrandVoice, TrendingContent
+from services.fieldsets import project
+from services.pagination import after_key, decode_cursor
+from services.storage import bump_data_version
+from services.write_queue import get_write_queue
 import logging
 import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keys of each vault item; ?fields= picks a subset (services/fieldsets.py)
+GENERATED_FIELDS = ("id", "content_type", "generated_text", "brand_voice", "target_audience", "quality_score",
+                    "topic_cluster", "performance_prediction", "is_used", "created_at", "inspiration_source")
+
 class ContentGenerator:
     def __init__(self):
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        self.client = openai.OpenAI()
+        self._client = None
+    
+    @property
+    def client(self):
+        # openai is slow to import and only needed once content is generated
+        if self._client is None:
+            import openai
+            self._client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
     
     async def generate_content(self, db: Session, trend_id: int, content_type: str, 
                              brand_voice: str, target_audience: str) -> Dict:
@@ -31,26 +47,33 @@ class ContentGenerator:
             # Calculate quality score
             quality_score = self._calculate_quality_score(generated_text, content_type)
             
-            # Store generated content
-            generated_content = GeneratedContent(
-                trend_id=trend_id,
-                content_type=content_type,
-                generated_text=generated_text,
-                brand_voice=brand_voice,
-                target_audience=target_audience,
-                quality_score=quality_score,
-                topic_cluster=trend.topic_cluster,
-                performance_prediction=self._predict_performance(trend, generated_text)
-            )
+            # Store generated content; db is only read from, the write goes
+            # through the write queue like every other
+            performance_prediction = self._predict_performance(trend, generated_text)
             
-            db.add(generated_content)
-            db.commit()
+            def store(session: Session) -> int:
+                generated_content = GeneratedContent(
+                    trend_id=trend_id,
+                    content_type=content_type,
+                    generated_text=generated_text,
+                    brand_voice=brand_voice,
+                    target_audience=target_audience,
+                    quality_score=quality_score,
+                    topic_cluster=trend.topic_cluster,
+                    performance_prediction=performance_prediction
+                )
+                session.add(generated_content)
+                bump_data_version(session, "content")
+                session.flush()
+                return generated_content.id
+            
+            content_id = await get_write_queue().run_async(store)
             
             return {
-                "id": generated_content.id,
+                "id": content_id,
                 "content": generated_text,
                 "quality_score": quality_score,
-                "performance_prediction": generated_content.performance_prediction,
+                "performance_prediction": performance_prediction,
                 "inspiration_source": {
                     "title": trend.title,
                     "platform": trend.platform,
@@ -232,8 +255,7 @@ class ContentGenerator:
             characteristics = self._parse_voice_analysis(analysis)
             
             # Store brand voice in database
-            db = Session()
-            try:
+            def store(db: Session):
                 # Check if brand voice already exists
                 existing = db.query(BrandVoice).filter(BrandVoice.brand_name == brand_name).first()
                 
@@ -250,19 +272,16 @@ class ContentGenerator:
                         voice_embedding={}  # Could store vector embeddings for advanced matching
                     )
                     db.add(brand_voice)
-                
-                db.commit()
-                logger.info(f"Trained brand voice for {brand_name}")
-                
-                return {
-                    "brand_name": brand_name,
-                    "characteristics": characteristics,
-                    "training_samples": len(sample_content),
-                    "status": "trained"
-                }
-                
-            finally:
-                db.close()
+            
+            await get_write_queue().run_async(store)
+            logger.info(f"Trained brand voice for {brand_name}")
+            
+            return {
+                "brand_name": brand_name,
+                "characteristics": characteristics,
+                "training_samples": len(sample_content),
+                "status": "trained"
+            }
                 
         except Exception as e:
             logger.error(f"Error training brand voice: {str(e)}")
@@ -343,36 +362,49 @@ class ContentGenerator:
         
         return min(base_score, 100.0)
     
-    def get_generated_content(self, db: Session, limit: int = 50, topic: Optional[str] = None) -> List[Dict]:
-        query = db.query(GeneratedContent).order_by(GeneratedContent.performance_prediction.desc())
+    def get_generated_content(self, db: Session, limit: int = 50, topic: Optional[str] = None,
+                              cursor: Optional[str] = None, fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+        rows = db.execute(self._generated_content_query(limit, topic, cursor)).all()
+        return [project(self._generated_to_dict(item, trend), fields) for item, trend in rows]
+    
+    async def get_generated_content_async(self, db: AsyncSession, limit: int = 50, topic: Optional[str] = None,
+                                          cursor: Optional[str] = None,
+                                          fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+        rows = (await db.execute(self._generated_content_query(limit, topic, cursor))).all()
+        return [project(self._generated_to_dict(item, trend), fields) for item, trend in rows]
+    
+    def _generated_content_query(self, limit: int, topic: Optional[str], cursor: Optional[str] = None):
+        # The inspiring trend comes in the same query rather than one lookup
+        # per item. Pages are keyed on (performance_prediction, id), which
+        # both vault indexes end with.
+        query = select(GeneratedContent, TrendingContent).outerjoin(
+            TrendingContent, TrendingContent.id == GeneratedContent.trend_id
+        ).order_by(GeneratedContent.performance_prediction.desc(), GeneratedContent.id.desc())
         
         if topic:
-            query = query.filter(GeneratedContent.topic_cluster == topic)
-        
-        content = query.limit(limit).all()
+            query = query.where(GeneratedContent.topic_cluster == topic)
+        if cursor:
+            value, row_id = decode_cursor(cursor, "performance_prediction", "desc")
+            query = query.where(after_key(GeneratedContent.performance_prediction, GeneratedContent.id,
+                                          "desc", value, row_id))
         
-        result = []
-        for item in content:
-            # Get trend info
-            trend = db.query(TrendingContent).filter(TrendingContent.id == item.trend_id).first()
-            
-            content_dict = {
-                "id": item.id,
-                "content_type": item.content_type,
-                "generated_text": item.generated_text,
-                "brand_voice": item.brand_voice,
-                "target_audience": item.target_audience,
-                "quality_score": item.quality_score,
-                "topic_cluster": item.topic_cluster,
-                "performance_prediction": item.performance_prediction,
-                "is_used": item.is_used,
-                "created_at": item.created_at.isoformat(),
-                "inspiration_source": {
-                    "title": trend.title if trend else "Unknown",
-                    "platform": trend.platform if trend else "Unknown",
-                    "virality_score": trend.virality_score if trend else 0
-                }
+        return query.limit(limit)
+    
+    def _generated_to_dict(self, item: GeneratedContent, trend: Optional[TrendingContent]) -> Dict:
+        return {
+            "id": item.id,
+            "content_type": item.content_type,
+            "generated_text": item.generated_text,
+            "brand_voice": item.brand_voice,
+            "target_audience": item.target_audience,
+            "quality_score": item.quality_score,
+            "topic_cluster": item.topic_cluster,
+            "performance_prediction": item.performance_prediction,
+            "is_used": item.is_used,
+            "created_at": item.created_at.isoformat(),
+            "inspiration_source": {
+                "title": trend.title if trend else "Unknown",
+                "platform": trend.platform if trend else "Unknown",
+                "virality_score": trend.virality_score if trend else 0
             }
-            result.append(content_dict)
-        
-        return result
\ No newline at end of file
+        }
\ No newline at end of file
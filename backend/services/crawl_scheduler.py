@@ -0,0 +1,254 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCHEDULED = 10
+PRIORITY_BACKFILL = 20
+
+# Quota units per API call. YouTube publishes these per method; praw is
+# limited on requests per OAuth client, so every Reddit call costs one
+API_METHOD_COSTS = {
+    "youtube": {
+        "videos.list": 1,
+        "search.list": 100,
+    },
+    "reddit": {
+        "listing": 1,
+    },
+}
+
+# Items returned per call, used to turn a requested item count into calls
+PAGE_SIZES = {
+    ("youtube", "videos.list"): 50,
+    ("youtube", "search.list"): 50,
+    ("reddit", "listing"): 100,
+}
+
+def estimate_cost(provider: str, calls: Dict[str, int]) -> int:
+    costs = API_METHOD_COSTS[provider]
+    return sum(costs[method] * count for method, count in calls.items())
+
+def pages(provider: str, method: str, items: int) -> int:
+    return max(1, math.ceil(items / PAGE_SIZES[(provider, method)]))
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def try_consume(self, cost: float) -> bool:
+        # A job costing more than the whole bucket runs once the bucket is
+        # full and leaves it in debt, instead of waiting forever
+        self._refill()
+        if self.tokens >= min(cost, self.capacity):
+            self.tokens -= cost
+            return True
+        return False
+
+    def seconds_until(self, cost: float) -> float:
+        self._refill()
+        missing = min(cost, self.capacity) - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate_per_second
+
+class ProviderBudget:
+    def __init__(self, provider: str, bucket: TokenBucket, daily_quota: Optional[int] = None,
+                 reset_timezone: str = "UTC"):
+        self.provider = provider
+        self.bucket = bucket
+        self.daily_quota = daily_quota
+        self.spent_today = 0
+        self.reset_timezone = reset_timezone
+        try:
+            self._tz = ZoneInfo(reset_timezone)
+        except Exception:
+            logger.warning(f"Unknown quota timezone {reset_timezone}, using UTC")
+            self._tz = timezone.utc
+        self._day = datetime.now(self._tz).date()
+
+    def _roll_day(self):
+        today = datetime.now(self._tz).date()
+        if today != self._day:
+            self._day = today
+            self.spent_today = 0
+
+    def _daily_exhausted(self, cost: int) -> bool:
+        return self.daily_quota is not None and self.spent_today + cost > self.daily_quota
+
+    def try_spend(self, cost: int) -> bool:
+        self._roll_day()
+        if self._daily_exhausted(cost):
+            return False
+        if not self.bucket.try_consume(cost):
+            return False
+        self.spent_today += cost
+        return True
+
+    def seconds_until(self, cost: int) -> float:
+        self._roll_day()
+        if self._daily_exhausted(cost):
+            now = datetime.now(self._tz)
+            tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=self._tz)
+            return (tomorrow - now).total_seconds()
+        return self.bucket.seconds_until(cost)
+
+    def as_dict(self) -> Dict:
+        self.bucket._refill()
+        return {
+            "provider": self.provider,
+            "available_units": round(self.bucket.tokens, 2),
+            "capacity": round(self.bucket.capacity, 2),
+            "refill_per_hour": round(self.bucket.rate_per_second * 3600, 2),
+            "daily_quota": self.daily_quota,
+            "spent_today": self.spent_today,
+            "remaining_today": None if self.daily_quota is None else self.daily_quota - self.spent_today,
+            "quota_resets": self.reset_timezone
+        }
+
+class CrawlJob:
+    def __init__(self, provider: str, name: str, cost: int, factory: Callable[[], Awaitable],
+                 priority: int):
+        self.provider = provider
+        self.name = name
+        self.cost = cost
+        self.factory = factory
+        self.priority = priority
+        self.submitted_at = time.time()
+        self.future: Optional[asyncio.Future] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "provider": self.provider,
+            "name": self.name,
+            "cost": self.cost,
+            "priority": self.priority,
+            "submitted_at": self.submitted_at
+        }
+
+class CrawlScheduler:
+    def __init__(self, budgets: Dict[str, ProviderBudget]):
+        self.budgets = budgets
+        self._queues: Dict[str, List] = {provider: [] for provider in budgets}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._dispatchers: List[asyncio.Task] = []
+        self._running: Dict[str, int] = {provider: 0 for provider in budgets}
+        self._tasks = set()
+        self._sequence = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> "CrawlScheduler":
+        # YouTube's daily quota is refilled continuously at quota/day with a
+        # burst of a couple of hours, so it lasts the whole day
+        youtube_quota = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+        burst_hours = float(os.getenv("YOUTUBE_QUOTA_BURST_HOURS", "2"))
+        reddit_per_minute = float(os.getenv("REDDIT_REQUESTS_PER_MINUTE", "100"))
+
+        return cls({
+            "youtube": ProviderBudget(
+                "youtube",
+                TokenBucket(youtube_quota / 86400, youtube_quota * burst_hours / 24),
+                daily_quota=youtube_quota,
+                reset_timezone=os.getenv("YOUTUBE_QUOTA_TIMEZONE", "America/Los_Angeles")
+            ),
+            "reddit": ProviderBudget(
+                "reddit",
+                TokenBucket(reddit_per_minute / 60, reddit_per_minute)
+            ),
+        })
+
+    async def start(self):
+        for provider in self.budgets:
+            self._wakeups[provider] = asyncio.Event()
+            self._dispatchers.append(asyncio.create_task(self._dispatch(provider)))
+
+    async def stop(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+
+    def submit(self, provider: str, name: str, calls: Dict[str, int],
+               factory: Callable[[], Awaitable], priority: int = PRIORITY_SCHEDULED) -> CrawlJob:
+        job = CrawlJob(provider, name, estimate_cost(provider, calls), factory, priority)
+        job.future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[provider], (priority, next(self._sequence), job))
+        if provider in self._wakeups:
+            self._wakeups[provider].set()
+        return job
+
+    def estimated_wait(self, provider: str, cost: int) -> float:
+        return round(self.budgets[provider].seconds_until(cost), 1)
+
+    async def _dispatch(self, provider: str):
+        queue = self._queues[provider]
+        budget = self.budgets[provider]
+        wakeup = self._wakeups[provider]
+
+        while True:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            _, _, job = queue[0]
+            if not budget.try_spend(job.cost):
+                # Sleep until the head job is affordable, or a new (possibly
+                # higher priority) job arrives
+                delay = max(budget.seconds_until(job.cost), 1.0)
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(queue)
+            task = asyncio.create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: CrawlJob):
+        self._running[job.provider] += 1
+        try:
+            result = await job.factory()
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            logger.error(f"Crawl job {job.name} failed: {str(e)}")
+            if not job.future.done():
+                job.future.set_exception(e)
+                # Nobody may await fire-and-forget jobs; mark it retrieved
+                job.future.exception()
+        finally:
+            self._running[job.provider] -= 1
+
+    def report(self) -> Dict:
+        return {
+            provider: dict(
+                budget.as_dict(),
+                queued_jobs=len(self._queues[provider]),
+                queued_cost=sum(job.cost for _, _, job in self._queues[provider]),
+                running_jobs=self._running[provider]
+            )
+            for provider, budget in self.budgets.items()
+        }
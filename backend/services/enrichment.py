@@ -0,0 +1,330 @@
+import hashlib
+import json
+import os
+import string
+import threading
+from itertools import repeat
+from typing import Dict, List, Optional, Set, Tuple
+from services.enrichment_cache import EnrichmentCache
+from services.sentiment import SentimentScorer
+from services.text import normalize
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # batches fall back to matching item by item
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keyword dictionaries shared by every platform. Topics are checked in the
+# order listed and the first one with a hit wins, as before. Override with a
+# JSON file of the same shape via ENRICHMENT_DICTIONARIES. Sentiment comes
+# from the valence lexicon in services/sentiment.py.
+DEFAULT_DICTIONARIES = {
+    "tags": {
+        "trending": ["trending", "viral", "popular"],
+        "educational": ["tips", "hack", "secret"],
+        "humor": ["funny", "lol", "humor"],
+        "news": ["breaking", "news", "update"],
+    },
+    "topics": {
+        "technology": ["tech", "technology", "ai", "software", "coding", "programming", "gadget"],
+        "business": ["business", "startup", "marketing", "sales", "entrepreneur"],
+        "lifestyle": ["life", "lifestyle", "health", "fitness", "food", "beauty", "fashion"],
+        "entertainment": ["entertainment", "movie", "music", "comedy", "funny", "tv", "celebrity"],
+        "education": ["learn", "study", "course", "tutorial", "guide", "education", "how to"],
+        "finance": ["money", "investing", "crypto", "stock", "finance"],
+        "gaming": ["gaming", "game", "gamer", "gameplay", "playthrough"],
+        "travel": ["travel", "vacation", "trip", "destination", "explore"],
+        "sports": ["sports", "football", "basketball", "soccer", "workout", "training"],
+    },
+}
+
+# Set ENRICHMENT_VECTORIZED=false to force the per-item path everywhere
+VECTORIZED = os.getenv("ENRICHMENT_VECTORIZED", "true").lower() not in ("0", "false", "no")
+
+# Plurals and common inflections still count as a hit on the base keyword
+_SUFFIXES = ("s", "es", "ing", "ed")
+
+# Separators after a document's title, body and extra text in
+# enrich_batch(): control characters that neither str.split() nor the
+# punctuation mapping touch, so surrounded by spaces they come out of
+# split() as tokens of their own.
+_TITLE_END = "\x01"
+_BODY_END = "\x02"
+_DOC_END = "\x00"
+_SEPARATORS = (_TITLE_END, _BODY_END, _DOC_END)
+# Token codes in enrich_batch()'s stream: separators are negative, words
+# carry a sentiment lexicon bit, a phrase head bit and their keyword id + 1
+_LEXICON_BIT = 1
+_PHRASE_HEAD_BIT = 2
+_KEYWORD_SHIFT = 2
+# Documents joined per lowercase/translate call; small enough to stay in cache
+_TOKENIZE_CHUNK = 256
+
+# Punctuation becomes whitespace, so str.split() yields whole words; this
+# beats a \w+ regex scan by a wide margin on titles and bodies
+_PUNCTUATION = str.maketrans({char: " " for char in string.punctuation + "\u2018\u2019\u201c\u201d\u2013\u2014\u2026"})
+
+class KeywordEnricher:
+    def __init__(self, dictionaries: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                 cache: Optional[EnrichmentCache] = None, scorer: Optional[SentimentScorer] = None):
+        self.dictionaries = dictionaries or DEFAULT_DICTIONARIES
+        self.cache = cache
+        self.scorer = scorer or SentimentScorer()
+        self.version = hashlib.sha1(
+            (json.dumps(self.dictionaries, sort_keys=True) + self.scorer.version).encode()
+        ).hexdigest()[:12]
+
+        self._topic_order = list(self.dictionaries.get("topics", {}))
+        self._tag_order = list(self.dictionaries.get("tags", {}))
+
+        # keyword -> every (dictionary, label) it belongs to
+        self._labels: Dict[str, List[Tuple[str, str]]] = {}
+        for dictionary, groups in self.dictionaries.items():
+            for label, keywords in groups.items():
+                for keyword in keywords:
+                    key = " ".join(keyword.lower().split())
+                    self._labels.setdefault(key, []).append((dictionary, label))
+
+        # Every dictionary is folded into one table from word form to keyword,
+        # so a text is tokenized once and matched with a single set
+        # intersection. Matching whole words means "ai" no longer hits "said".
+        self._forms: Dict[str, str] = {}
+        # Multi-word keywords hang off their first word: word -> [(rest, keyword)]
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        for keyword in self._labels:
+            words = keyword.split()
+            if len(words) > 1:
+                self._phrases.setdefault(words[0], []).append((tuple(words[1:]), keyword))
+                continue
+            for suffix in _SUFFIXES:
+                # An exact keyword always beats an inflection of another one
+                if keyword + suffix not in self._labels:
+                    self._forms.setdefault(keyword + suffix, keyword)
+            self._forms[keyword] = keyword
+        self._keys = frozenset(self._forms) | frozenset(self._phrases)
+
+        # Per-keyword answers precomputed so enrich() only folds small sets
+        self._topic_rank: Dict[str, int] = {}
+        self._tag_mask: Dict[str, int] = {}
+        for keyword, labels in self._labels.items():
+            for dictionary, label in labels:
+                if dictionary == "topics":
+                    rank = self._topic_order.index(label)
+                    self._topic_rank[keyword] = min(rank, self._topic_rank.get(keyword, rank))
+                elif dictionary == "tags":
+                    self._tag_mask[keyword] = self._tag_mask.get(keyword, 0) | (1 << self._tag_order.index(label))
+
+        # The same per-keyword answers as columns, for enrich_batch()
+        self._keyword_ids = {keyword: index for index, keyword in enumerate(self._labels)}
+        self._form_keyword_ids = {form: self._keyword_ids[keyword] for form, keyword in self._forms.items()}
+        # Token -> code for the token stream, so one lookup per token answers
+        # keyword matching and tells the scorer which texts need a look
+        self._token_codes = {form: (index + 1) << _KEYWORD_SHIFT for form, index in self._form_keyword_ids.items()}
+        for head in self._phrases:
+            self._token_codes[head] = self._token_codes.get(head, 0) | _PHRASE_HEAD_BIT
+        for word in self.scorer.lexicon:
+            self._token_codes[word] = self._token_codes.get(word, 0) | _LEXICON_BIT
+        for code, separator in enumerate(_SEPARATORS, 1):
+            self._token_codes[separator] = -code
+        if np is not None:
+            keywords = list(self._labels)
+            self._topic_rank_column = np.array(
+                [self._topic_rank.get(keyword, len(self._topic_order)) for keyword in keywords], dtype=np.int64
+            )
+            self._tag_mask_column = np.array([self._tag_mask.get(keyword, 0) for keyword in keywords], dtype=np.int64)
+
+    def keywords(self, text: str) -> Set[str]:
+        # Distinct keywords present in the text; like the old helpers, a
+        # keyword counts once however often it appears
+        if not text:
+            return set()
+        tokens = text.lower().translate(_PUNCTUATION).split()
+        found = self._keys.intersection(tokens)
+        if not found:
+            return found
+        keywords = {self._forms[token] for token in found if token in self._forms}
+        for head in found.intersection(self._phrases):
+            for rest, keyword in self._phrases[head]:
+                if self._contains_phrase(tokens, head, rest):
+                    keywords.add(keyword)
+        return keywords
+
+    def match(self, text: str) -> Dict[str, Dict[str, int]]:
+        # Hit counts per dictionary and label, for callers that want the raw view
+        hits: Dict[str, Dict[str, int]] = {}
+        for keyword in self.keywords(text):
+            for dictionary, label in self._labels[keyword]:
+                counts = hits.setdefault(dictionary, {})
+                counts[label] = counts.get(label, 0) + 1
+        return hits
+
+    def enrich(self, title: str, body: str = "", extra: str = "") -> Dict:
+        if self.cache is None:
+            return self._enrich(title, body, extra)
+        key = self.cache.key(self.version, title, body, extra)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return _copy_result(cached)
+        result = self._enrich(title, body, extra)
+        self.cache.put(key, _copy_result(result))
+        return result
+
+    def enrich_batch(self, docs: List[Tuple[str, str, str]]) -> List[Dict]:
+        # docs are (title, body, extra) triples; results match enrich() item
+        # for item. Texts seen before come from the cache and only the rest
+        # go through matching.
+        if self.cache is None:
+            return self._enrich_batch(docs)
+        keys = [self.cache.key(self.version, *doc) for doc in docs]
+        results = [None if cached is None else _copy_result(cached) for cached in self.cache.get_many(keys)]
+
+        missing: Dict[str, List[int]] = {}
+        for index, result in enumerate(results):
+            if result is None:
+                missing.setdefault(keys[index], []).append(index)
+        if missing:
+            computed = self._enrich_batch([docs[indexes[0]] for indexes in missing.values()])
+            for indexes, result in zip(missing.values(), computed):
+                for index in indexes:
+                    results[index] = _copy_result(result)
+            self.cache.put_many(list(zip(missing, computed)))
+        return results
+
+    def _enrich(self, title: str, body: str = "", extra: str = "") -> Dict:
+        found = self.keywords(title)
+        if body or extra:
+            found = found | self.keywords(f"{body} {extra}")
+
+        topic_rank = self._topic_rank
+        ranks = [topic_rank[keyword] for keyword in found if keyword in topic_rank]
+
+        tag_mask = 0
+        for keyword in found:
+            tag_mask |= self._tag_mask.get(keyword, 0)
+
+        sentiment_score = self.scorer.score(title, body)
+        return {
+            "tags": [tag for bit, tag in enumerate(self._tag_order) if tag_mask >> bit & 1] if tag_mask else [],
+            "sentiment": self.scorer.label(sentiment_score),
+            "sentiment_score": sentiment_score,
+            "topic": self._topic_order[min(ranks)] if ranks else "general",
+        }
+
+    def _enrich_batch(self, docs: List[Tuple[str, str, str]]) -> List[Dict]:
+        # The whole batch is tokenized as one token stream, a chunk of
+        # documents per lowercase/translate/split call, and every token is
+        # mapped to its code in a single pass over that stream. The
+        # (document, keyword) pairs are a sparse document x keyword matrix in
+        # coordinate form, folded into topic and tags with array operations.
+        # The same pass finds the titles and bodies holding sentiment words,
+        # the only ones the scorer has to tokenize again.
+        if not vectorized_available() or not docs:
+            return [self._enrich(*doc) for doc in docs]
+
+        codes = self._token_codes
+        phrases = self._phrases
+        rows = [np.zeros(0, dtype=np.int64)]
+        columns = [np.zeros(0, dtype=np.int64)]
+        scored = [np.zeros(0, dtype=np.int64)]
+        for start in range(0, len(docs), _TOKENIZE_CHUNK):
+            chunk = docs[start:start + _TOKENIZE_CHUNK]
+            text = "".join(f"{title} {_TITLE_END} {body} {_BODY_END} {extra} {_DOC_END} "
+                           for title, body, extra in chunk)
+            if any(text.count(separator) != len(chunk) for separator in _SEPARATORS):
+                # A document contained one of the separator characters
+                return [self._enrich(*doc) for doc in docs]
+            tokens = normalize(text).split()
+            token_codes = np.fromiter(map(codes.get, tokens, repeat(0)), dtype=np.int64, count=len(tokens))
+            # Three parts per document: title, body and extra
+            separators = token_codes < 0
+            parts = np.cumsum(separators) - separators + 3 * start
+            token_rows = parts // 3
+
+            keywords = token_codes >> _KEYWORD_SHIFT
+            hits = keywords > 0
+            rows.append(token_rows[hits])
+            columns.append(keywords[hits] - 1)
+            # Sentiment reads titles and bodies, numbered as score_batch() does
+            sentiment = ~separators & (token_codes & _LEXICON_BIT > 0) & (parts % 3 < 2)
+            scored.append(np.unique(2 * token_rows[sentiment] + parts[sentiment] % 3))
+
+            # Phrase heads are rare, so only their positions are looked at.
+            # As in _enrich(), a phrase may run from the body into the extra
+            # text but not out of the title or into the next document.
+            heads = ~separators & (token_codes & _PHRASE_HEAD_BIT > 0)
+            for position in np.flatnonzero(heads).tolist():
+                for rest, keyword in phrases[tokens[position]]:
+                    following = [token for token in tokens[position + 1:position + 2 + len(rest)]
+                                 if token != _BODY_END][:len(rest)]
+                    if tuple(following) == rest:
+                        rows.append(token_rows[position:position + 1])
+                        columns.append(np.array([self._keyword_ids[keyword]], dtype=np.int64))
+
+        width = len(self._keyword_ids)
+        # Distinct (document, keyword) pairs: a keyword counts once per text
+        pairs = np.unique(np.concatenate(rows) * width + np.concatenate(columns))
+        rows, columns = pairs // width, pairs % width
+
+        size = len(docs)
+        topics = np.full(size, len(self._topic_order), dtype=np.int64)
+        np.minimum.at(topics, rows, self._topic_rank_column[columns])
+        tag_masks = np.zeros(size, dtype=np.int64)
+        np.bitwise_or.at(tag_masks, rows, self._tag_mask_column[columns])
+        sentiment_scores = self.scorer.score_batch([(title, body) for title, body, _ in docs], np.concatenate(scored))
+
+        topic_names = self._topic_order + ["general"]
+        label = self.scorer.label
+        tag_lists: Dict[int, List[str]] = {}
+        results = []
+        for topic, tag_mask, sentiment_score in zip(topics.tolist(), tag_masks.tolist(), sentiment_scores):
+            if tag_mask not in tag_lists:
+                tag_lists[tag_mask] = [tag for bit, tag in enumerate(self._tag_order) if tag_mask >> bit & 1]
+            results.append({
+                "tags": list(tag_lists[tag_mask]),
+                "sentiment": label(sentiment_score),
+                "sentiment_score": sentiment_score,
+                "topic": topic_names[topic],
+            })
+        return results
+
+    @staticmethod
+    def _contains_phrase(tokens: List[str], head: str, rest: Tuple[str, ...]) -> bool:
+        size = len(rest)
+        for index, token in enumerate(tokens):
+            if token == head and tuple(tokens[index + 1:index + 1 + size]) == rest:
+                return True
+        return False
+
+def _copy_result(result: Dict) -> Dict:
+    # Cached results are shared, so callers always get their own lists
+    return {
+        "tags": list(result["tags"]),
+        "sentiment": result["sentiment"],
+        "sentiment_score": result["sentiment_score"],
+        "topic": result["topic"],
+    }
+
+def vectorized_available() -> bool:
+    return VECTORIZED and np is not None
+
+_enricher: Optional[KeywordEnricher] = None
+_enricher_lock = threading.Lock()
+
+def load_dictionaries(path: str) -> Dict[str, Dict[str, List[str]]]:
+    with open(path) as handle:
+        return json.load(handle)
+
+def get_enricher() -> KeywordEnricher:
+    global _enricher
+    with _enricher_lock:
+        if _enricher is None:
+            path = os.getenv("ENRICHMENT_DICTIONARIES")
+            _enricher = KeywordEnricher(
+                load_dictionaries(path) if path else None, EnrichmentCache.from_env(), SentimentScorer.from_env()
+            )
+            logger.info(f"Compiled enrichment dictionaries (version {_enricher.version})")
+        return _enricher
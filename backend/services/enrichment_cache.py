@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite caps bound parameters per statement; disk lookups go in chunks
+DISK_LOOKUP_CHUNK = 500
+
+class EnrichmentCache:
+    def __init__(self, max_entries: int = 100000, ttl_seconds: float = 86400,
+                 disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._disk: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @classmethod
+    def from_env(cls) -> Optional["EnrichmentCache"]:
+        max_entries = int(os.getenv("ENRICHMENT_CACHE_SIZE", "100000"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            ttl_seconds=float(os.getenv("ENRICHMENT_CACHE_TTL_SECONDS", "86400")),
+            disk_path=os.getenv("ENRICHMENT_CACHE_PATH") or None
+        )
+
+    @staticmethod
+    def key(version: str, *texts: str) -> str:
+        # Matching ignores case and runs of whitespace, so neither is part
+        # of the key; the dictionary version is, so edited dictionaries
+        # never serve stale results
+        digest = hashlib.blake2b(version.encode(), digest_size=16)
+        for text in texts:
+            digest.update(b"\x00")
+            digest.update(" ".join(text.split()).lower().encode() if text else b"")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.get_many([key])[0]
+
+    def put(self, key: str, value: Dict):
+        self.put_many([(key, value)])
+
+    def get_many(self, keys: List[str]) -> List[Optional[Dict]]:
+        now = time.time()
+        results: List[Optional[Dict]] = [None] * len(keys)
+        missing: Dict[str, List[int]] = {}
+        with self._lock:
+            for index, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] > self.ttl_seconds:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    missing.setdefault(key, []).append(index)
+                    continue
+                self._entries.move_to_end(key)
+                results[index] = entry[1]
+                self.hits += 1
+
+            if missing and self._disk is not None:
+                for key, (stored_at, value) in self._disk_lookup(list(missing), now).items():
+                    self._remember(key, value, stored_at)
+                    for index in missing.pop(key):
+                        results[index] = value
+                        self.disk_hits += 1
+
+            self.misses += sum(len(indexes) for indexes in missing.values())
+        return results
+
+    def put_many(self, items: List[Tuple[str, Dict]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value, now)
+            if self._disk is not None:
+                try:
+                    self._disk.executemany(
+                        "INSERT OR REPLACE INTO enrichment_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                        [(key, json.dumps(value), now) for key, value in items]
+                    )
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not write enrichment cache to disk: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM enrichment_cache")
+                self._disk.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "disk_path": self.disk_path
+            }
+
+    def _remember(self, key: str, value: Dict, stored_at: float):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _open_disk(self, path: str):
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            # Service threads share the connection; every use holds self._lock
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS enrichment_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            pruned = self._disk.execute(
+                "DELETE FROM enrichment_cache WHERE stored_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            self._disk.commit()
+            logger.info(f"Enrichment cache disk tier at {path} ({pruned} expired entries pruned)")
+        except sqlite3.Error as e:
+            logger.warning(f"Enrichment cache disk tier disabled: {str(e)}")
+            self._disk = None
+
+    def _disk_lookup(self, keys: List[str], now: float) -> Dict[str, Tuple[float, Dict]]:
+        found = {}
+        try:
+            for start in range(0, len(keys), DISK_LOOKUP_CHUNK):
+                chunk = keys[start:start + DISK_LOOKUP_CHUNK]
+                rows = self._disk.execute(
+                    f"SELECT key, value, stored_at FROM enrichment_cache "
+                    f"WHERE key IN ({','.join('?' * len(chunk))}) AND stored_at >= ?",
+                    chunk + [now - self.ttl_seconds]
+                )
+                for key, value, stored_at in rows:
+                    found[key] = (stored_at, json.loads(value))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read enrichment cache from disk: {str(e)}")
+        return found
@@ -0,0 +1,23 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+# Sparse fieldsets: ?fields=id,title,virality_score returns only those keys
+# of each item. Keys the response itself relies on, such as the id and sort
+# key a cursor is built from, are always kept.
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str], always: Iterable[str] = ()) -> Optional[Tuple[str, ...]]:
+    # None means every field. Names come back in the allowed order, so
+    # requests naming the same fields differently normalize to one tuple.
+    requested = {name.strip() for name in (fields or "").split(",")} - {""}
+    if not requested:
+        return None
+    allowed = tuple(allowed)
+    unknown = sorted(requested - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    wanted = requested | set(always)
+    return tuple(name for name in allowed if name in wanted)
+
+def project(item: Dict, fields: Optional[Tuple[str, ...]]) -> Dict:
+    if fields is None:
+        return item
+    return {name: item[name] for name in fields if name in item}
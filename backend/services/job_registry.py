@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class IngestionJob:
+    def __init__(self, kind: str, params: Dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.state = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.items: Dict[str, int] = {}
+        self.stages: Dict[str, float] = {}
+        self.errors: List[str] = []
+        self.skipped: List[str] = []
+        self._lock = threading.Lock()
+        self._done = asyncio.Event()
+
+    # Services call these from their worker threads, so every update of the
+    # counters happens under the job's lock
+
+    def add_items(self, **counts: int):
+        with self._lock:
+            for name, count in counts.items():
+                self.items[name] = self.items.get(name, 0) + count
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_error(self, message: str):
+        with self._lock:
+            self.errors.append(message)
+
+    def add_skip(self, message: str):
+        # Work deliberately not done, e.g. a refresh inside its minimum interval
+        with self._lock:
+            self.skipped.append(message)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (JOB_SUCCEEDED, JOB_FAILED)
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(self._done.wait()), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.finished
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            now = self.finished_at or time.time()
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "params": self.params,
+                "state": self.state,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "queued_seconds": round((self.started_at or now) - self.created_at, 3),
+                "run_seconds": round(now - self.started_at, 3) if self.started_at else None,
+                "items": dict(self.items),
+                "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                "errors": list(self.errors),
+                "skipped": list(self.skipped)
+            }
+
+@contextmanager
+def track_stage(job: Optional[IngestionJob], name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if job is not None:
+            job.add_stage(name, time.perf_counter() - started)
+
+class JobRegistry:
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+
+    def create(self, kind: str, params: Dict) -> IngestionJob:
+        job = IngestionJob(kind, params)
+        self._jobs[job.id] = job
+        self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def recent(self, limit: int = 50) -> List[IngestionJob]:
+        return list(reversed(self._jobs.values()))[:limit]
+
+    async def run(self, job: IngestionJob, factory: Callable[[], Awaitable]):
+        job.state = JOB_RUNNING
+        job.started_at = time.time()
+        try:
+            result = await factory()
+            job.state = JOB_SUCCEEDED
+            return result
+        except Exception as e:
+            job.add_error(str(e))
+            job.state = JOB_FAILED
+            raise
+        finally:
+            job.finished_at = time.time()
+            job._done.set()
+            logger.info(f"Job {job.id} ({job.kind}) {job.state} in {job.finished_at - job.started_at:.2f}s")
+
+    def _evict(self):
+        # Oldest finished jobs go first; running jobs are never dropped
+        while len(self._jobs) > self.max_jobs:
+            for job_id, job in self._jobs.items():
+                if job.finished:
+                    del self._jobs[job_id]
+                    break
+            else:
+                break
@@ -0,0 +1,331 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from database import Base, SessionLocal, engine as default_engine
+from models import DataVersion, GeneratedContent, SchemaVersion, TrendingContent, TrendTag
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Every migration checks the schema before changing it: a database created
+# by create_all from current models passes through them as no-ops and is
+# only stamped, while an older one is brought up to date step by step.
+
+def _baseline(connection: Connection):
+    # Tables that do not exist yet, with all their current indexes
+    Base.metadata.create_all(bind=connection)
+
+def _unique_platform_content(connection: Connection):
+    # ON CONFLICT upserts need the unique index; duplicates from before it
+    # existed are removed first, keeping the row stored first
+    if _has_index(connection, TrendingContent.__tablename__, "uq_trending_content_platform_content_id"):
+        return
+    removed = connection.execute(text(
+        "DELETE FROM trending_content WHERE id NOT IN ("
+        "SELECT MIN(id) FROM trending_content GROUP BY platform, content_id)"
+    )).rowcount
+    _create_index(connection, TrendingContent, "uq_trending_content_platform_content_id")
+    logger.info(f"Removed {removed} duplicate trending_content rows")
+
+def _trending_columns(connection: Connection):
+    _add_trending_columns(connection, ("sentiment_score", "story_id", "published_at"))
+    _create_index(connection, TrendingContent, "ix_trending_content_story_id")
+
+def _add_trending_columns(connection: Connection, names: Tuple[str, ...]):
+    # Columns added to TrendingContent after databases were first created;
+    # all nullable, so a plain ADD COLUMN is enough
+    existing = {column["name"] for column in inspect(connection).get_columns(TrendingContent.__tablename__)}
+    for name in names:
+        if name in existing:
+            continue
+        column = TrendingContent.__table__.c[name]
+        connection.execute(text(
+            f"ALTER TABLE trending_content ADD COLUMN {name} {column.type.compile(connection.dialect)}"
+        ))
+        logger.info(f"Added trending_content.{name}")
+
+def _chart_rank_columns(connection: Connection):
+    _add_trending_columns(connection, ("best_rank", "best_rank_region"))
+
+def _hot_query_indexes(connection: Connection):
+    for name in ("ix_trending_content_virality_score", "ix_trending_content_platform_virality",
+                 "ix_trending_content_topic_virality", "ix_trending_content_created_at"):
+        _create_index(connection, TrendingContent, name)
+    for name in ("ix_generated_content_performance", "ix_generated_content_topic_performance"):
+        _create_index(connection, GeneratedContent, name)
+
+FILTER_INDEXES = (
+    "ix_trending_content_virality_filters", "ix_trending_content_created_filters",
+    "ix_trending_content_engagement_filters", "ix_trending_content_score_filters",
+    "ix_trending_content_topic_virality_filters", "ix_trending_content_topic_created_filters",
+    "ix_trending_content_topic_engagement_filters", "ix_trending_content_topic_score_filters",
+    "ix_trending_content_author_created",
+)
+
+# Superseded by the covering indexes; each is a prefix of one of them
+RETIRED_INDEXES = (
+    "ix_trending_content_virality_score", "ix_trending_content_platform_virality",
+    "ix_trending_content_topic_virality", "ix_trending_content_created_at",
+    # No query walks these; each cost a write on every upsert
+    "ix_trending_content_topic_created_filters", "ix_trending_content_topic_score_filters",
+)
+
+def _filtered_trend_indexes(connection: Connection):
+    unique = next(index for index in inspect(connection).get_indexes(TrendingContent.__tablename__)
+                  if index["name"] == "uq_trending_content_platform_content_id")
+    if unique["column_names"][0] == "platform":
+        connection.execute(text("DROP INDEX uq_trending_content_platform_content_id"))
+        _create_index(connection, TrendingContent, "uq_trending_content_platform_content_id")
+    for name in RETIRED_INDEXES:
+        if _has_index(connection, TrendingContent.__tablename__, name):
+            connection.execute(text(f"DROP INDEX {name}"))
+            logger.info(f"Dropped index {name}")
+    for name in FILTER_INDEXES:
+        _create_index(connection, TrendingContent, name)
+    if not inspect(connection).has_table(TrendTag.__tablename__):
+        TrendTag.__table__.create(bind=connection)
+        _backfill_trend_tags(connection)
+
+def _backfill_trend_tags(connection: Connection, page: int = 5000):
+    from services.storage import normalize_tag
+    table = TrendingContent.__table__
+    after, written = 0, 0
+    while True:
+        rows = connection.execute(
+            select(table.c.id, table.c.tags)
+            .where(table.c.id > after, table.c.tags.isnot(None)).order_by(table.c.id).limit(page)
+        ).all()
+        if not rows:
+            break
+        pairs = {(normalize_tag(tag), trend_id)
+                 for trend_id, tags in rows for tag in tags or [] if normalize_tag(tag)}
+        if pairs:
+            connection.execute(TrendTag.__table__.insert(),
+                               [{"tag": tag, "trend_id": trend_id} for tag, trend_id in pairs])
+        written += len(pairs)
+        after = rows[-1][0]
+    logger.info(f"Backfilled {written} trend_tags rows")
+
+def _vault_keyset_indexes(connection: Connection):
+    for name in ("ix_generated_content_performance", "ix_generated_content_topic_performance"):
+        _rebuild_index(connection, GeneratedContent, name)
+
+def _narrow_trend_indexes(connection: Connection):
+    for name in RETIRED_INDEXES[-2:]:
+        if _has_index(connection, TrendingContent.__tablename__, name):
+            connection.execute(text(f"DROP INDEX {name}"))
+            logger.info(f"Dropped index {name}")
+    for name in FILTER_INDEXES:
+        if name not in RETIRED_INDEXES:
+            _rebuild_index(connection, TrendingContent, name)
+
+def _missing_trend_tags(connection: Connection):
+    # _baseline creates trend_tags from the current models, so a database
+    # upgraded from before it reached migration 5 with the table already
+    # there and never got the backfill
+    if connection.execute(select(TrendTag.trend_id).limit(1)).first() is None:
+        _backfill_trend_tags(connection)
+
+def _data_versions(connection: Connection):
+    from services.storage import DATA_VERSIONS
+    DataVersion.__table__.create(bind=connection, checkfirst=True)
+    existing = set(connection.execute(select(DataVersion.name)).scalars())
+    for name in DATA_VERSIONS:
+        if name not in existing:
+            connection.execute(DataVersion.__table__.insert().values(name=name, version=0))
+
+# Append only; a shipped version is never edited or renumbered
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline tables", _baseline),
+    (2, "unique (platform, content_id) on trending_content, removing duplicates", _unique_platform_content),
+    (3, "trending_content sentiment_score, story_id and published_at", _trending_columns),
+    (4, "indexes for /trends, /analytics/virality and /content/vault", _hot_query_indexes),
+    (5, "covering indexes and trend_tags for filtered /trends queries", _filtered_trend_indexes),
+    (6, "id in the /content/vault indexes for cursor pagination", _vault_keyset_indexes),
+    (7, "data_versions for response cache invalidation", _data_versions),
+    (8, "trending_content best_rank and best_rank_region", _chart_rank_columns),
+    (9, "narrower /trends sort indexes, dropping the unused topic ones", _narrow_trend_indexes),
+    (10, "trend_tags backfill for databases upgraded with the table empty", _missing_trend_tags),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def run_migrations(engine: Engine = default_engine) -> List[int]:
+    # Each migration commits together with its version row, so a failure
+    # leaves the database at the last version that fully applied. Replicas
+    # starting at once race on the version primary key; the loser rolls
+    # back and finds the work done on its next start.
+    SchemaVersion.__table__.create(bind=engine, checkfirst=True)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version <= current_version(engine):
+            continue
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(SchemaVersion.__table__.insert().values(version=version, name=name))
+        applied.append(version)
+        logger.info(f"Applied schema migration {version} ({name}) in {time.perf_counter() - started:.2f}s")
+    return applied
+
+def current_version(engine: Engine = default_engine) -> int:
+    if not inspect(engine).has_table(SchemaVersion.__tablename__):
+        return 0
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def schema_status(engine: Engine = default_engine) -> Dict:
+    version = current_version(engine)
+    return {
+        "version": version,
+        "latest": LATEST_VERSION,
+        "pending": [{"version": v, "name": name} for v, name, _ in MIGRATIONS if v > version]
+    }
+
+def _has_index(connection: Connection, table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspect(connection).get_indexes(table))
+
+def _create_index(connection: Connection, model, name: str):
+    # Indexes a later migration retires are no longer on the model; they are
+    # not built only to be dropped again
+    index = next((index for index in model.__table__.indexes if index.name == name), None)
+    if index is None and name in RETIRED_INDEXES:
+        return
+    if not _has_index(connection, model.__tablename__, name):
+        index.create(bind=connection)
+        logger.info(f"Created index {name}")
+
+def _rebuild_index(connection: Connection, model, name: str):
+    # Brings an existing index to the columns the model now gives it
+    index = next(index for index in model.__table__.indexes if index.name == name)
+    existing = next((found for found in inspect(connection).get_indexes(model.__tablename__)
+                     if found["name"] == name), None)
+    if existing is not None and existing["column_names"] == [column.name for column in index.columns]:
+        return
+    if existing is not None:
+        connection.execute(text(f"DROP INDEX {name}"))
+    index.create(bind=connection)
+    logger.info(f"Rebuilt index {name}")
+
+# Query plans
+
+SCANNED_TABLES = (TrendingContent.__tablename__, GeneratedContent.__tablename__)
+
+def _api_queries() -> List[Tuple[str, Callable]]:
+    # The same calls the endpoints make, so the check follows the code
+    from services.trend_analyzer import TrendAnalyzer
+    from services.content_generator import ContentGenerator
+    from services.pagination import encode_cursor
+    analyzer = TrendAnalyzer()
+    generator = ContentGenerator()
+    return [
+        ("GET /trends", lambda db: analyzer.get_trending_content(db, 50)),
+        ("GET /trends?platform=reddit", lambda db: analyzer.get_trending_content(db, 50, "reddit")),
+        ("GET /trends?one_per_story=true", lambda db: analyzer.get_trending_content(db, 50, None, True)),
+        ("GET /trends?topic=technology&sentiment=positive",
+         lambda db: analyzer.get_trending_content(db, 50, topic="technology", sentiment="positive")),
+        ("GET /trends?sort=engagement_rate&min_virality=50",
+         lambda db: analyzer.get_trending_content(db, 50, sort="engagement_rate", min_virality=50)),
+        ("GET /trends?topic=technology&sort=score",
+         lambda db: analyzer.get_trending_content(db, 50, topic="technology", sort="score")),
+        ("GET /trends?sort=created_at&since=...",
+         lambda db: analyzer.get_trending_content(db, 50, sort="created_at", since=datetime.now() - timedelta(days=1))),
+        ("GET /trends?author=...", lambda db: analyzer.get_trending_content(db, 50, author="someone")),
+        ("GET /trends?tag=python", lambda db: analyzer.get_trending_content(db, 50, tags=["python"])),
+        ("GET /trends?cursor=...",
+         lambda db: analyzer.get_trending_content(db, 50, cursor=encode_cursor("virality_score", "desc", 50.0, 1))),
+        ("GET /trends?one_per_story=true&cursor=...",
+         lambda db: analyzer.get_trending_content(db, 50, None, True, encode_cursor("virality_score", "desc", 50.0, 1))),
+        ("GET /analytics/virality", lambda db: analyzer.get_virality_analytics(db, 7)),
+        ("recommendations by topic", lambda db: analyzer.get_content_recommendations(db, "technology", "tweet")),
+        ("GET /content/vault", lambda db: generator.get_generated_content(db, 50)),
+        ("GET /content/vault?topic=technology", lambda db: generator.get_generated_content(db, 50, "technology")),
+        ("GET /content/vault?cursor=...", lambda db: generator.get_generated_content(
+            db, 50, None, encode_cursor("performance_prediction", "desc", 50.0, 1))),
+    ]
+
+def query_plans(engine: Engine = default_engine) -> List[Dict]:
+    # Captures the SQL each API query issues and asks the database how it
+    # would run it. A full scan of a table with a usable index is flagged.
+    dialect = engine.dialect.name
+    captured: List[Tuple[str, object]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    report = []
+    for name, call in _api_queries():
+        captured.clear()
+        db = SessionLocal(bind=engine)
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            call(db)
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+            db.rollback()
+            db.close()
+
+        statements = []
+        seen = set()
+        for statement, parameters in captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            plan = _explain(engine, dialect, statement, parameters)
+            statements.append({
+                "sql": " ".join(statement.split()),
+                "plan": plan,
+                "full_scan": _is_full_scan(dialect, plan)
+            })
+        report.append({"query": name, "statements": statements})
+    return report
+
+def _explain(engine: Engine, dialect: str, statement: str, parameters) -> List[str]:
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+    if dialect == "sqlite":
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+def _is_full_scan(dialect: str, plan: List[str]) -> bool:
+    # Only the large tables count; small lookups such as topic_clusters
+    # are read whole on purpose. SQLite reports "SCAN <table>" without
+    # "USING ... INDEX", Postgres "Seq Scan on <table>".
+    for line in plan:
+        for table in SCANNED_TABLES:
+            if dialect == "sqlite" and line.split(" ")[:2] == ["SCAN", table] and "INDEX" not in line:
+                return True
+            if dialect != "sqlite" and f"Seq Scan on {table}" in line:
+                return True
+    return False
+
+if __name__ == "__main__":
+    # python -m services.migrations upgrade|status|plans
+    parser = argparse.ArgumentParser(description="Schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status", "plans"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = run_migrations()
+        logger.info(f"Schema at version {current_version()} ({len(applied)} migrations applied)")
+    elif args.command == "status":
+        status = schema_status()
+        print(f"version {status['version']} of {status['latest']}")
+        for pending in status["pending"]:
+            print(f"  pending {pending['version']}: {pending['name']}")
+    else:
+        full_scans = 0
+        for entry in query_plans():
+            print(entry["query"])
+            for statement in entry["statements"]:
+                full_scans += statement["full_scan"]
+                marker = "FULL SCAN" if statement["full_scan"] else "index"
+                print(f"  [{marker}] {statement['sql'][:110]}")
+                for line in statement["plan"]:
+                    print(f"      {line}")
+        raise SystemExit(1 if full_scans else 0)
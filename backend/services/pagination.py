@@ -0,0 +1,82 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import String, and_, literal, not_, or_
+from sqlalchemy.types import DateTime, TypeDecorator
+
+# Keyset pagination. A cursor names the sort it belongs to and the
+# (sort value, id) of the last row served; the next page starts strictly
+# after that key with an index seek, so a page costs the same at any depth
+# and rows stored in the meantime never shift the pages after it. Clients
+# treat cursors as opaque strings.
+
+class StoredTimestamp(TypeDecorator):
+    # Compares datetimes the way they are stored. SQLite keeps created_at as
+    # text written by CURRENT_TIMESTAMP (UTC, whole seconds), and SQLAlchemy
+    # would bind ".000000" microseconds that never compare equal to it.
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(String())
+        return dialect.type_descriptor(DateTime(timezone=True))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        # Naive values are taken as UTC, like created_at itself
+        value = value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+        if dialect.name == "sqlite":
+            return value.strftime("%Y-%m-%d %H:%M:%S.%f" if value.microsecond else "%Y-%m-%d %H:%M:%S")
+        return value
+
+def stored_value(value: Any):
+    # A bind parameter for a sort key or filter bound
+    if isinstance(value, datetime):
+        return literal(value, StoredTimestamp())
+    return value
+
+def encode_cursor(sort: str, order: str, value: Any, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, order, value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_order, value, row_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError(f"Cursor belongs to sort={cursor_sort}&order={cursor_order}")
+    if not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    if sort == "created_at" and isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value, row_id
+
+def after_key(sort_column, id_column, order: str, value: Any, row_id: int):
+    # Rows strictly after (value, row_id). The leading range on the sort
+    # column is what lets the database seek instead of filtering the walk.
+    value = stored_value(value)
+    if order == "desc":
+        return and_(sort_column <= value, or_(sort_column < value, id_column < row_id))
+    return and_(sort_column >= value, or_(sort_column > value, id_column > row_id))
+
+def through_key(sort_column, id_column, order: str, value: Any, row_id: int):
+    # Rows up to and including (value, row_id): everything earlier pages served
+    return not_(after_key(sort_column, id_column, order, value, row_id))
+
+def next_cursor(items: List[Dict], limit: int, sort: str, order: str = "desc") -> Optional[str]:
+    # A short page is the last one
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    value = last[sort]
+    if sort == "created_at" and isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return encode_cursor(sort, order, value, last["id"])
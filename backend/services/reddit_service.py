@@ -1,141 +1,330 @@
 import praw
 import os
-from typing import List, Dict
-from models import TrendingContent
-from database import SessionLocal
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from database import ReadSessionLocal, session_scope
+from services.snapshot_store import maybe_compact
+from services.job_registry import IngestionJob, track_stage
+from services.api_replay import get_transport
+from services.enrichment import get_enricher, vectorized_available
+from services.topic_clustering import apply_topic_clusters
+from services.story_index import apply_story_ids
+from services.virality import get_virality_engine
+from services.write_queue import get_write_queue
+from services.storage import (
+    bulk_upsert_trending_content, bulk_update_metrics, existing_content_topics, get_cursor, save_cursor
+)
 import logging
 
+try:
+    import numpy as np
+except ImportError:  # metrics fall back to the per-item formulas
+    np = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# new() is read in pages this small, so a refresh that finds a few new posts
+# stops after one short request instead of downloading a full listing
+NEW_PAGE_SIZE = int(os.getenv("REDDIT_NEW_PAGE_SIZE", "25"))
+
+class RefreshSkipped(Exception):
+    pass
+
 class RedditService:
-    def __init__(self):
-        self.reddit = praw.Reddit(
-            client_id=os.getenv("REDDIT_CLIENT_ID"),
-            client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-            user_agent=os.getenv("REDDIT_USER_AGENT", "ContentIntelligenceDashboard/1.0")
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("REDDIT_FETCH_CONCURRENCY", "8"))
+        # Refreshes of the same subreddit closer together than this are skipped
+        self.min_refresh_seconds = int(os.getenv("REDDIT_MIN_REFRESH_SECONDS", "60"))
+        # praw blocks on network I/O, so fetches run on a dedicated pool sized to
+        # the concurrency limit instead of on the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="reddit-fetch"
         )
+        self._local = threading.local()
+        self.enricher = get_enricher()
+    
+    @property
+    def reddit(self) -> praw.Reddit:
+        # praw.Reddit is not thread-safe; keep one client per worker thread
+        client = getattr(self._local, "reddit", None)
+        if client is None:
+            transport = get_transport()
+            # Record and replay modes swap the HTTP session under prawcore
+            session = transport.reddit_session()
+            placeholder = None if transport.live else "replay"
+            client = praw.Reddit(
+                client_id=os.getenv("REDDIT_CLIENT_ID", placeholder),
+                client_secret=os.getenv("REDDIT_CLIENT_SECRET", placeholder),
+                user_agent=os.getenv("REDDIT_USER_AGENT", "ContentIntelligenceDashboard/1.0"),
+                **({"requestor_kwargs": {"session": session}} if session is not None else {})
+            )
+            self._local.reddit = client
+        return client
     
-    async def fetch_trending_posts(self, subreddit_name: str, limit: int = 25) -> List[Dict]:
+    async def fetch_trending_posts(self, subreddit_name: str, limit: int = 25,
+                                   job: Optional[IngestionJob] = None, new_only: bool = False) -> List[Dict]:
+        # new_only reads just the posts newer than the subreddit's watermark
+        # from new(); stored posts then keep their metrics until the next
+        # full read of the hot listing
         try:
-            subreddit = self.reddit.subreddit(subreddit_name)
-            posts = []
-            
-            # Fetch hot posts
-            for submission in subreddit.hot(limit=limit):
-                if not submission.stickied:  # Skip pinned posts
-                    post_data = {
-                        "platform": "reddit",
-                        "content_id": submission.id,
-                        "title": submission.title,
-                        "description": submission.selftext[:500] if submission.selftext else "",
-                        "url": f"https://reddit.com{submission.permalink}",
-                        "author": str(submission.author) if submission.author else "unknown",
-                        "score": submission.score,
-                        "comments_count": submission.num_comments,
-                        "engagement_rate": self._calculate_engagement_rate(submission),
-                        "virality_score": self._calculate_virality_score(submission),
-                        "tags": self._extract_tags(submission),
-                        "sentiment": self._analyze_sentiment(submission.title),
-                        "topic_cluster": self._categorize_topic(submission.title, submission.selftext)
+            return await self._fetch(subreddit_name, limit, job, new_only)
+        except RefreshSkipped as e:
+            if job is not None:
+                job.add_skip(f"r/{subreddit_name}: {str(e)}")
+            return []
+    
+    async def _fetch(self, subreddit_name: str, limit: int, job: Optional[IngestionJob] = None,
+                     new_only: bool = False) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._fetch_trending_posts_sync, subreddit_name, limit, job, new_only
+        )
+    
+    async def fetch_multiple_subreddits(self, subreddit_names: List[str], limit: int = 25,
+                                        max_concurrency: Optional[int] = None,
+                                        job: Optional[IngestionJob] = None) -> Dict:
+        concurrency = min(max_concurrency or self.max_concurrency, self.max_concurrency)
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        names = list(dict.fromkeys(name.strip() for name in subreddit_names if name.strip()))
+        
+        async def fetch_one(name: str) -> Dict:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    posts = await self._fetch(name, limit, job)
+                    return {
+                        "subreddit": name,
+                        "status": "ok",
+                        "posts": len(posts),
+                        "seconds": round(time.perf_counter() - started, 3)
+                    }
+                except RefreshSkipped as e:
+                    if job is not None:
+                        job.add_skip(f"r/{name}: {str(e)}")
+                    return {
+                        "subreddit": name,
+                        "status": "skipped",
+                        "posts": 0,
+                        "reason": str(e),
+                        "seconds": round(time.perf_counter() - started, 3)
+                    }
+                except Exception as e:
+                    if job is not None:
+                        job.add_error(f"r/{name}: {str(e)}")
+                    return {
+                        "subreddit": name,
+                        "status": "error",
+                        "posts": 0,
+                        "error": str(e),
+                        "seconds": round(time.perf_counter() - started, 3)
                     }
-                    posts.append(post_data)
+        
+        started = time.perf_counter()
+        results = await asyncio.gather(*(fetch_one(name) for name in names))
+        elapsed = time.perf_counter() - started
+        
+        failed = [r["subreddit"] for r in results if r["status"] == "error"]
+        skipped = [r["subreddit"] for r in results if r["status"] == "skipped"]
+        logger.info(
+            f"Fetched {len(names)} subreddits in {elapsed:.2f}s "
+            f"(concurrency={concurrency}, failed={len(failed)}, skipped={len(skipped)})"
+        )
+        return {
+            "subreddits": results,
+            "total_posts": sum(r["posts"] for r in results),
+            "failed": failed,
+            "skipped": skipped,
+            "concurrency": concurrency,
+            "elapsed_seconds": round(elapsed, 3)
+        }
+    
+    def _fetch_trending_posts_sync(self, subreddit_name: str, limit: int,
+                                   job: Optional[IngestionJob] = None, new_only: bool = False) -> List[Dict]:
+        source = f"reddit:{subreddit_name.lower()}"
+        try:
+            # Sessions are held only around their queries, not across the
+            # fetch, so concurrent crawls do not pin pooled connections
+            with session_scope(ReadSessionLocal) as db:
+                cursor = get_cursor(db, source)
+                last_fetched = cursor.last_fetched_at if cursor else None
+                watermark = cursor.last_seen_created_utc if cursor and cursor.last_seen_created_utc else None
+            
+            if last_fetched and self.min_refresh_seconds > 0:
+                if last_fetched.tzinfo is None:
+                    last_fetched = last_fetched.replace(tzinfo=timezone.utc)
+                if datetime.now(timezone.utc) - last_fetched < timedelta(seconds=self.min_refresh_seconds):
+                    logger.info(f"Skipping r/{subreddit_name}: refreshed less than {self.min_refresh_seconds}s ago")
+                    if job is not None:
+                        job.add_items(skipped_sources=1)
+                    raise RefreshSkipped(f"refreshed less than {self.min_refresh_seconds}s ago")
+            
+            with track_stage(job, "fetch"):
+                subreddit = self.reddit.subreddit(subreddit_name)
+                if new_only and watermark is not None:
+                    submissions = self._new_since(subreddit, watermark, limit)
+                else:
+                    submissions = [s for s in subreddit.hot(limit=limit) if not s.stickied]  # Skip pinned posts
+            
+            with track_stage(job, "enrich"):
+                # Anything created after the watermark cannot be stored yet, so only
+                # older submissions need a membership check against the database
+                candidates = [s.id for s in submissions if watermark is not None and s.created_utc <= watermark]
+                known = {}
+                if candidates:
+                    with session_scope(ReadSessionLocal) as db:
+                        known = existing_content_topics(db, "reddit", candidates)
+                
+                new_posts, metric_updates = self._enrich_page(submissions, known)
             
-            # Store in database
-            self._store_trending_content(posts)
-            logger.info(f"Fetched {len(posts)} trending posts from r/{subreddit_name}")
-            return posts
+            newest = max(submissions, key=lambda s: s.created_utc, default=None)
+            with track_stage(job, "store"):
+                def store(session):
+                    bulk_upsert_trending_content(session, new_posts)
+                    bulk_update_metrics(session, metric_updates)
+                    save_cursor(
+                        session, source,
+                        newest.fullname if newest else None,
+                        newest.created_utc if newest else None,
+                        len(new_posts)
+                    )
+                
+                try:
+                    write_queue = get_write_queue()
+                    write_queue.run(store)
+                    write_queue.submit(maybe_compact)
+                except Exception as e:
+                    logger.error(f"Error storing trending content: {str(e)}")
+                    if job is not None:
+                        job.add_error(f"r/{subreddit_name}: storing failed: {str(e)}")
+            
+            if job is not None:
+                job.add_items(fetched=len(submissions), new=len(new_posts), updated=len(metric_updates))
             
+            logger.info(
+                f"Fetched {len(submissions)} trending posts from r/{subreddit_name} "
+                f"({len(new_posts)} new, {len(metric_updates)} metrics-only)"
+            )
+            return new_posts + metric_updates
+            
+        except RefreshSkipped:
+            raise
         except Exception as e:
             logger.error(f"Error fetching Reddit trends: {str(e)}")
             raise e
     
+    def _new_since(self, subreddit, watermark: float, limit: int) -> List:
+        # new() is newest first, so everything after the first post at or
+        # below the watermark was seen already and is never requested
+        submissions = []
+        for submission in subreddit.new(limit=limit, request_limit=min(NEW_PAGE_SIZE, limit)):
+            if submission.created_utc <= watermark:
+                break
+            if not submission.stickied:
+                submissions.append(submission)
+        return submissions
+    
+    def _enrich_page(self, submissions, known: Dict[str, Optional[str]]) -> Tuple[List[Dict], List[Dict]]:
+        # Text enrichment only for posts not stored yet (known maps stored
+        # ids to their topic); metrics for the whole page at once
+        fresh = [s for s in submissions if s.id not in known]
+        docs = [(s.title, s.selftext or "", "") for s in fresh]
+        fresh_enriched = apply_story_ids(docs, apply_topic_clusters(docs, self.enricher.enrich_batch(docs)))
+        topics = dict(known)
+        topics.update((s.id, item["topic"]) for s, item in zip(fresh, fresh_enriched))
+        engagement_rates, virality_scores = self._calculate_metrics(
+            submissions, [topics[s.id] for s in submissions], [s.id not in known for s in submissions]
+        )
+        enriched = iter(fresh_enriched)
+        
+        new_posts = []
+        metric_updates = []
+        for submission, engagement_rate, virality_score in zip(submissions, engagement_rates, virality_scores):
+            if submission.id in known:
+                metric_updates.append(self._submission_metrics(submission, engagement_rate, virality_score))
+            else:
+                new_posts.append(self._submission_to_dict(submission, next(enriched), engagement_rate, virality_score))
+        return new_posts, metric_updates
+    
+    def _submission_to_dict(self, submission, enriched: Dict, engagement_rate: float,
+                            virality_score: float) -> Dict:
+        return {
+            "platform": "reddit",
+            "content_id": submission.id,
+            "title": submission.title,
+            "description": submission.selftext[:500] if submission.selftext else "",
+            "url": f"https://reddit.com{submission.permalink}",
+            "author": str(submission.author) if submission.author else "unknown",
+            "score": submission.score,
+            "comments_count": submission.num_comments,
+            "engagement_rate": engagement_rate,
+            "virality_score": virality_score,
+            "tags": enriched["tags"],
+            "sentiment": enriched["sentiment"],
+            "sentiment_score": enriched["sentiment_score"],
+            "topic_cluster": enriched["topic"],
+            "story_id": enriched["story_id"],
+            "published_at": datetime.fromtimestamp(submission.created_utc, timezone.utc)
+        }
+    
+    def _submission_metrics(self, submission, engagement_rate: float, virality_score: float) -> Dict:
+        # Already stored: skip text enrichment and refresh the numbers only
+        return {
+            "platform": "reddit",
+            "content_id": submission.id,
+            "score": submission.score,
+            "comments_count": submission.num_comments,
+            "engagement_rate": engagement_rate,
+            "virality_score": virality_score
+        }
+    
+    def _calculate_metrics(self, submissions, topics: List[Optional[str]],
+                           new: List[bool]) -> Tuple[List[float], List[float]]:
+        # Only new posts feed the virality sketches; stored ones were counted
+        # when first fetched and are just ranked again
+        engine = get_virality_engine()
+        if engine is None:
+            virality = [self._calculate_virality_score(s) for s in submissions]
+        else:
+            now = time.time()
+            virality = engine.score(
+                "reddit",
+                [s.score for s in submissions],
+                [s.num_comments for s in submissions],
+                None,
+                [(now - s.created_utc) / 3600 for s in submissions],
+                topics,
+                observe=new
+            )
+        
+        if not vectorized_available():
+            return [self._calculate_engagement_rate(s) for s in submissions], virality
+        
+        # Same arithmetic as the scalar version below, so the results are
+        # bit for bit identical
+        score = np.array([s.score for s in submissions], dtype=np.float64)
+        comments = np.array([s.num_comments for s in submissions], dtype=np.float64)
+        
+        engagement = np.zeros(len(submissions))
+        np.divide(comments, score, out=engagement, where=score > 0)
+        engagement = engagement * 100
+        return engagement.tolist(), virality
+    
     def _calculate_engagement_rate(self, submission) -> float:
         if submission.score <= 0:
             return 0.0
         return (submission.num_comments / submission.score) * 100
     
     def _calculate_virality_score(self, submission) -> float:
-        # Simple virality score based on engagement metrics
-        age_hours = (submission.created_utc) / 3600
-        if age_hours == 0:
-            age_hours = 1
+        # Fallback when numpy is missing: not comparable with YouTube scores
+        age_hours = max((time.time() - submission.created_utc) / 3600, 1)
         
         score_per_hour = submission.score / age_hours
         comment_ratio = submission.num_comments / max(submission.score, 1)
         
         virality_score = (score_per_hour * 0.7) + (comment_ratio * 100 * 0.3)
         return min(virality_score, 100.0)  # Cap at 100
-    
-    def _extract_tags(self, submission) -> List[str]:
-        tags = []
-        
-        # Extract from title and text
-        text = f"{submission.title} {submission.selftext}".lower()
-        
-        # Common trending patterns
-        if any(word in text for word in ["trending", "viral", "popular"]):
-            tags.append("trending")
-        if any(word in text for word in ["tips", "hack", "secret"]):
-            tags.append("educational")
-        if any(word in text for word in ["funny", "lol", "humor"]):
-            tags.append("humor")
-        if any(word in text for word in ["breaking", "news", "update"]):
-            tags.append("news")
-        
-        return tags
-    
-    def _analyze_sentiment(self, text: str) -> str:
-        # Simple sentiment analysis (you can integrate with more sophisticated tools)
-        positive_words = ["great", "awesome", "amazing", "love", "best", "incredible"]
-        negative_words = ["bad", "terrible", "awful", "hate", "worst", "horrible"]
-        
-        text_lower = text.lower()
-        positive_count = sum(1 for word in positive_words if word in text_lower)
-        negative_count = sum(1 for word in negative_words if word in text_lower)
-        
-        if positive_count > negative_count:
-            return "positive"
-        elif negative_count > positive_count:
-            return "negative"
-        else:
-            return "neutral"
-    
-    def _categorize_topic(self, title: str, text: str) -> str:
-        content = f"{title} {text}".lower()
-        
-        categories = {
-            "technology": ["tech", "ai", "software", "coding", "programming"],
-            "business": ["business", "startup", "marketing", "sales", "entrepreneur"],
-            "lifestyle": ["life", "health", "fitness", "food", "travel"],
-            "entertainment": ["movie", "music", "game", "tv", "celebrity"],
-            "education": ["learn", "study", "course", "tutorial", "guide"],
-            "finance": ["money", "investing", "crypto", "stock", "finance"]
-        }
-        
-        for category, keywords in categories.items():
-            if any(keyword in content for keyword in keywords):
-                return category
-        
-        return "general"
-    
-    def _store_trending_content(self, posts: List[Dict]):
-        db = SessionLocal()
-        try:
-            for post_data in posts:
-                # Check if already exists
-                existing = db.query(TrendingContent).filter(
-                    TrendingContent.content_id == post_data["content_id"],
-                    TrendingContent.platform == "reddit"
-                ).first()
-                
-                if not existing:
-                    trending_content = TrendingContent(**post_data)
-                    db.add(trending_content)
-            
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error storing trending content: {str(e)}")
-        finally:
-            db.close()
\ No newline at end of file
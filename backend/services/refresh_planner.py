@@ -0,0 +1,209 @@
+import asyncio
+import os
+import random
+import time
+from typing import Callable, Dict, List, Optional, Set
+import logging
+
+from services.crawl_scheduler import CrawlScheduler, PRIORITY_SCHEDULED, pages
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SOURCE_KINDS = ("subreddit", "youtube_region", "keyword")
+
+# Polling bounds per kind, in seconds. Keyword searches cost 100 YouTube
+# quota units a page, so they are never polled as often as charts
+DEFAULT_INTERVALS = {
+    "subreddit": {"min": 300, "initial": 1800, "max": 6 * 3600},
+    "youtube_region": {"min": 900, "initial": 3600, "max": 12 * 3600},
+    "keyword": {"min": 3600, "initial": 6 * 3600, "max": 24 * 3600},
+}
+
+# Share of a source's items replaced between fetches that we aim to see on
+# each poll: much more means we polled too rarely, much less too often
+TARGET_CHURN = float(os.getenv("REFRESH_TARGET_CHURN", "0.2"))
+
+# Subreddit polls in between read only posts newer than the watermark; the
+# full hot listing, which also refreshes stored posts' metrics, this often
+METRICS_REFRESH_SECONDS = float(os.getenv("SUBREDDIT_METRICS_REFRESH_SECONDS", "3600"))
+
+TICK_SECONDS = 5
+
+class WatchedSource:
+    def __init__(self, kind: str, key: str, limit: int, min_interval: float,
+                 interval: float, max_interval: float):
+        self.kind = kind
+        self.key = key
+        self.limit = limit
+        self.min_interval = min_interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self.next_due = time.monotonic()
+        self.in_flight = False
+        self.last_ids: Optional[Set[str]] = None
+        self.last_churn: Optional[float] = None
+        self.last_fetched_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_full_at: Optional[float] = None
+        self.incremental = False
+        self.fetches = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.key}"
+
+    def observe(self, content_ids: Set[str], incremental: bool = False):
+        self.fetches += 1
+        self.last_fetched_at = time.time()
+        self.last_error = None
+        if not incremental:
+            self.last_full_at = time.monotonic()
+
+        # An empty result (e.g. a refresh skipped upstream) says nothing
+        # about churn, so the interval is left alone
+        if not content_ids:
+            return
+
+        if incremental:
+            # Only posts newer than the watermark came back, each of them new
+            # since the last poll; measured against the last full listing
+            if self.last_ids:
+                self._adapt(min(1.0, len(content_ids - self.last_ids) / len(self.last_ids)))
+            return
+
+        if self.last_ids is not None:
+            union = self.last_ids | content_ids
+            self._adapt(1 - len(self.last_ids & content_ids) / len(union))
+
+        self.last_ids = content_ids
+
+    def _adapt(self, churn: float):
+        self.last_churn = churn
+        if churn > TARGET_CHURN * 1.5:
+            self.interval = max(self.min_interval, self.interval / 2)
+        elif churn < TARGET_CHURN / 2:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+
+    def schedule_next(self):
+        # Jitter keeps sources configured together from polling in lockstep
+        self.next_due = time.monotonic() + self.interval * random.uniform(0.9, 1.1)
+
+    def as_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "key": self.key,
+            "interval_seconds": round(self.interval),
+            "next_due_in_seconds": max(0, round(self.next_due - time.monotonic())),
+            "in_flight": self.in_flight,
+            "last_churn": None if self.last_churn is None else round(self.last_churn, 3),
+            "last_fetched_at": self.last_fetched_at,
+            "last_error": self.last_error,
+            "fetches": self.fetches
+        }
+
+class RefreshPlanner:
+    def __init__(self, scheduler: CrawlScheduler, get_reddit_service: Callable, get_youtube_service: Callable):
+        self.scheduler = scheduler
+        self.get_reddit_service = get_reddit_service
+        self.get_youtube_service = get_youtube_service
+        self.sources: Dict[str, WatchedSource] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def load_from_env(self):
+        for kind, variable in (("subreddit", "WATCHED_SUBREDDITS"),
+                               ("youtube_region", "WATCHED_YOUTUBE_REGIONS"),
+                               ("keyword", "WATCHED_KEYWORDS")):
+            for key in os.getenv(variable, "").split(","):
+                if key.strip():
+                    self.watch(kind, key.strip())
+
+    def watch(self, kind: str, key: str, limit: Optional[int] = None) -> WatchedSource:
+        if kind not in SOURCE_KINDS:
+            raise ValueError(f"Unsupported source kind: {kind}")
+
+        source = WatchedSource(
+            kind, self._key(kind, key),
+            limit or (25 if kind == "keyword" else 50),
+            DEFAULT_INTERVALS[kind]["min"],
+            DEFAULT_INTERVALS[kind]["initial"],
+            DEFAULT_INTERVALS[kind]["max"]
+        )
+        return self.sources.setdefault(source.name, source)
+
+    def unwatch(self, kind: str, key: str) -> bool:
+        return self.sources.pop(f"{kind}:{self._key(kind, key)}", None) is not None
+
+    @staticmethod
+    def _key(kind: str, key: str) -> str:
+        # Region codes are stored upper case and subreddits lower case, as
+        # their cursors are, however they were given
+        if kind == "youtube_region":
+            return key.upper()
+        if kind == "subreddit":
+            return key.lower()
+        return key
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            for source in list(self.sources.values()):
+                if not source.in_flight and source.next_due <= now:
+                    self._submit(source)
+            await asyncio.sleep(TICK_SECONDS)
+
+    def _submit(self, source: WatchedSource):
+        provider, calls, factory = self._plan(source)
+        source.in_flight = True
+        job = self.scheduler.submit(provider, source.name, calls, factory, PRIORITY_SCHEDULED)
+        job.future.add_done_callback(lambda future: self._completed(source, future))
+
+    def _completed(self, source: WatchedSource, future: asyncio.Future):
+        source.in_flight = False
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            source.last_error = str(future.exception())
+            # Back off on failures the same way as on stale sources
+            source.interval = min(source.max_interval, source.interval * 1.5)
+        else:
+            source.observe({item["content_id"] for item in future.result()}, source.incremental)
+        source.schedule_next()
+
+    def _plan(self, source: WatchedSource):
+        if source.kind == "subreddit":
+            source.incremental = source.last_full_at is not None and (
+                time.monotonic() - source.last_full_at < METRICS_REFRESH_SECONDS)
+            new_only = source.incremental
+            return (
+                "reddit",
+                {"listing": pages("reddit", "listing", source.limit)},
+                lambda: self.get_reddit_service().fetch_trending_posts(source.key, source.limit, new_only=new_only)
+            )
+        if source.kind == "youtube_region":
+            return (
+                "youtube",
+                {"videos.list": pages("youtube", "videos.list", source.limit)},
+                lambda: self.get_youtube_service().fetch_trending_videos(source.key, source.limit)
+            )
+        return (
+            "youtube",
+            {
+                "search.list": pages("youtube", "search.list", source.limit),
+                "videos.list": pages("youtube", "videos.list", source.limit)
+            },
+            lambda: self.get_youtube_service().search_trending_by_keyword(source.key, limit=source.limit)
+        )
+
+    def status(self) -> List[Dict]:
+        return [source.as_dict() for source in self.sources.values()]
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import math
+import os
+import string
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+from services.text import normalize
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # score_batch normalizes item by item instead
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Word valences on a -4..4 scale. Extend or override with a JSON object of
+# word -> valence via SENTIMENT_LEXICON.
+DEFAULT_LEXICON = {
+    # positive
+    "love": 3.2, "loved": 2.9, "loves": 2.7, "loving": 2.9, "lovely": 2.8,
+    "great": 3.1, "greatest": 3.2, "awesome": 3.1, "amazing": 2.8, "amazed": 2.2,
+    "best": 3.2, "better": 1.9, "incredible": 2.6, "fantastic": 2.6, "good": 1.9,
+    "nice": 1.8, "excellent": 2.7, "wonderful": 2.7, "happy": 2.7, "happiness": 2.6,
+    "beautiful": 2.9, "perfect": 2.7, "brilliant": 2.8, "cool": 1.3, "fun": 2.3,
+    "funny": 1.9, "hilarious": 1.7, "win": 2.8, "wins": 2.7, "winning": 2.4,
+    "winner": 2.8, "victory": 2.8, "success": 2.7, "successful": 2.8,
+    "breakthrough": 2.0, "exciting": 2.2, "excited": 1.4, "impressive": 2.3,
+    "helpful": 1.8, "useful": 1.9, "easy": 1.9, "enjoy": 2.2, "enjoyed": 2.3,
+    "thanks": 1.9, "thank": 1.5, "grateful": 2.0, "wow": 2.8, "epic": 2.0,
+    "legendary": 2.0, "inspiring": 2.2, "inspired": 2.2, "hope": 1.9, "hopeful": 2.3,
+    "proud": 2.1, "safe": 1.9, "strong": 2.3, "improve": 1.9, "improved": 2.1,
+    "improvement": 2.0, "growth": 1.6, "boost": 1.7, "gain": 2.4, "gains": 1.8,
+    "profit": 1.9, "recommend": 1.5, "recommended": 1.5, "favorite": 2.0,
+    "interesting": 1.7, "smart": 1.7, "genius": 1.9, "masterpiece": 3.0, "glad": 2.0,
+    "celebrate": 2.7, "celebrating": 2.7, "support": 1.7, "wholesome": 2.2,
+    "cute": 2.0, "delicious": 2.7, "free": 1.2, "solved": 1.8, "fixed": 1.1,
+    "innovative": 2.0, "powerful": 1.8, "peace": 2.5, "joy": 2.8,
+    "congratulations": 2.9, "congrats": 2.4, "yes": 1.7, "worth": 0.9,
+    # negative
+    "bad": -2.5, "worse": -2.1, "worst": -3.1, "terrible": -2.5, "awful": -2.0,
+    "hate": -2.7, "hated": -3.2, "hates": -1.9, "horrible": -2.5, "disaster": -3.1,
+    "poor": -2.1, "sad": -2.1, "angry": -2.3, "anger": -2.7, "fail": -2.5,
+    "failed": -2.3, "fails": -1.8, "failure": -2.3, "broken": -2.1, "wrong": -2.1,
+    "problem": -1.7, "problems": -1.7, "bug": -1.2, "bugs": -1.2, "crash": -1.7,
+    "crashed": -1.8, "scam": -2.5, "fake": -2.1, "dead": -3.3, "death": -2.9,
+    "die": -2.9, "died": -2.6, "dies": -2.2, "kill": -3.7, "killed": -3.5,
+    "killing": -3.4, "war": -2.9, "crisis": -3.1, "attack": -2.1, "attacks": -2.1,
+    "lost": -1.3, "lose": -1.7, "losing": -1.6, "loss": -1.3, "risk": -1.1,
+    "danger": -2.4, "dangerous": -2.1, "fear": -2.2, "scary": -2.2, "worried": -1.2,
+    "worry": -1.9, "stupid": -2.4, "ugly": -2.3, "annoying": -1.7, "boring": -1.3,
+    "useless": -1.8, "waste": -1.8, "wasted": -2.2, "disappointing": -2.2,
+    "disappointed": -1.9, "disgusting": -2.4, "ridiculous": -1.5, "shame": -2.1,
+    "sucks": -1.5, "suck": -1.9, "fraud": -2.8, "layoffs": -1.8, "recession": -2.0,
+    "decline": -1.3, "outrage": -2.3, "toxic": -2.4, "racist": -3.1,
+    "violence": -3.1, "pain": -2.3, "sick": -2.1, "tragic": -3.1, "tragedy": -3.4,
+    "abuse": -3.2, "cheat": -2.0, "cheating": -2.6, "lie": -1.8, "lies": -1.8,
+    "liar": -2.5, "warning": -1.4, "ban": -2.6, "banned": -2.0, "illegal": -2.6,
+    "struggle": -1.5, "struggling": -1.4, "hurt": -2.4, "injured": -1.7,
+    "cry": -2.1, "crying": -2.1, "mess": -2.0, "chaos": -2.7, "hell": -3.6,
+    "nightmare": -2.8, "fired": -2.6, "threat": -2.4, "collapse": -2.2,
+    "lawsuit": -1.2, "stolen": -2.2, "steal": -2.2, "no": -1.2,
+}
+
+# Words that scale the next sentiment word up or down, within three words
+BOOSTERS = {
+    "very": 0.293, "really": 0.293, "extremely": 0.293, "so": 0.293, "super": 0.293,
+    "incredibly": 0.293, "absolutely": 0.293, "totally": 0.293, "completely": 0.293,
+    "most": 0.293, "highly": 0.293, "insanely": 0.293, "hugely": 0.293,
+    "seriously": 0.293, "truly": 0.293, "deeply": 0.293, "utterly": 0.293,
+    "quite": 0.15, "pretty": 0.15,
+    "slightly": -0.293, "somewhat": -0.293, "barely": -0.293, "hardly": -0.293,
+    "kinda": -0.293, "marginally": -0.293, "partly": -0.293, "little": -0.293,
+}
+
+# Apostrophes become spaces when tokenizing, so "don't" arrives as "don t"
+# and the lone "t" marks the negation
+NEGATORS = {
+    "not", "no", "never", "nothing", "nobody", "none", "neither", "nor", "without",
+    "cannot", "t", "dont", "cant", "wont", "isnt", "arent", "wasnt", "werent",
+    "doesnt", "didnt", "couldnt", "shouldnt", "wouldnt", "hasnt", "havent", "hadnt", "aint",
+}
+
+NEGATION_SCALAR = -0.74
+BOOSTER_DECAY = (1.0, 0.95, 0.9)
+EXCLAMATION_BOOST = 0.292
+MAX_EXCLAMATIONS = 4
+# Sentiment words before "but" count half, those after it one and a half
+BUT_BEFORE = 0.5
+BUT_AFTER = 1.5
+# Readers react to the title first, so it outweighs the description
+TITLE_WEIGHT = 2.0
+# Normalization constant for the compound score, as in VADER
+ALPHA = 15.0
+# Compound scores within this band of zero are labelled neutral
+NEUTRAL_BAND = 0.05
+
+_PUNCTUATION = str.maketrans({char: " " for char in string.punctuation + "\u2018\u2019\u201c\u201d\u2013\u2014\u2026"})
+
+# Separator between texts in score_batch(), as in services/enrichment.py
+_TEXT_END = "\x00"
+# Texts joined per lowercase/translate call
+_SCAN_CHUNK = 512
+
+class SentimentScorer:
+    def __init__(self, lexicon: Optional[Dict[str, float]] = None):
+        self.lexicon = dict(DEFAULT_LEXICON)
+        if lexicon:
+            self.lexicon.update({word.lower(): float(valence) for word, valence in lexicon.items()})
+        self.version = hashlib.sha1(json.dumps(self.lexicon, sort_keys=True).encode()).hexdigest()[:12]
+        self._words = frozenset(self.lexicon)
+        # Token codes for _with_words(): 1 for a lexicon word, 2 for the separator
+        self._codes = dict.fromkeys(self._words, 1)
+        self._codes[_TEXT_END] = 2
+
+    @classmethod
+    def from_env(cls) -> "SentimentScorer":
+        path = os.getenv("SENTIMENT_LEXICON")
+        if not path:
+            return cls()
+        with open(path) as handle:
+            return cls(json.load(handle))
+
+    def score(self, title: str, body: str = "") -> float:
+        return self._normalize(TITLE_WEIGHT * self._valence(title) + self._valence(body))
+
+    def score_batch(self, docs: List[Tuple[str, str]], with_words: Optional["np.ndarray"] = None) -> List[float]:
+        # docs are (title, body) pairs; results match score() item for item.
+        # with_words, from a caller that has scanned the texts already, holds
+        # the indexes of those with lexicon words, counting title and body
+        # of each pair in turn; the rest score zero.
+        if np is None:
+            return [self._normalize(TITLE_WEIGHT * self._valence(title) + self._valence(body)) for title, body in docs]
+        texts = [text for doc in docs for text in doc]
+        valences = np.zeros(len(texts))
+        if with_words is None:
+            with_words = self._with_words(texts)
+        for index in with_words.tolist():
+            valences[index] = self._valence(texts[index])
+        totals = TITLE_WEIGHT * valences[0::2] + valences[1::2]
+        return (totals / np.sqrt(totals * totals + ALPHA)).tolist()
+
+    @staticmethod
+    def label(score: float) -> str:
+        if score >= NEUTRAL_BAND:
+            return "positive"
+        elif score <= -NEUTRAL_BAND:
+            return "negative"
+        return "neutral"
+
+    @staticmethod
+    def _normalize(total: float) -> float:
+        return total / math.sqrt(total * total + ALPHA)
+
+    def _with_words(self, texts: List[str]) -> "np.ndarray":
+        # Indexes of the texts holding at least one lexicon word. The texts
+        # are scanned as one token stream, so the many without any never get
+        # a tokenizing call of their own.
+        codes = self._codes
+        found = []
+        for start in range(0, len(texts), _SCAN_CHUNK):
+            chunk = texts[start:start + _SCAN_CHUNK]
+            text = "".join(f"{text} {_TEXT_END} " for text in chunk)
+            if text.count(_TEXT_END) != len(chunk):
+                # A text contained the separator; look at each one
+                found.append(np.arange(start, start + len(chunk)))
+                continue
+            tokens = normalize(text).split()
+            token_codes = np.fromiter(map(codes.get, tokens, repeat(0)), dtype=np.int8, count=len(tokens))
+            ends = token_codes == 2
+            found.append(np.unique((np.cumsum(ends) - ends)[token_codes == 1]) + start)
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def _valence(self, text: str) -> float:
+        if not text:
+            return 0.0
+        tokens = text.lower().translate(_PUNCTUATION).split()
+        # Most titles carry no sentiment words at all
+        if self._words.isdisjoint(tokens):
+            return 0.0
+
+        lexicon = self.lexicon
+        hits: List[Tuple[int, float]] = []
+        last_but = -1
+        for index, token in enumerate(tokens):
+            if token == "but":
+                last_but = index
+                continue
+            valence = lexicon.get(token)
+            if valence is None:
+                continue
+
+            negated = False
+            for distance in range(1, 4):
+                if index - distance < 0:
+                    break
+                previous = tokens[index - distance]
+                boost = BOOSTERS.get(previous)
+                if boost is not None:
+                    # Boosters push away from zero, dampeners towards it
+                    valence += boost * BOOSTER_DECAY[distance - 1] * (1 if valence > 0 else -1)
+                elif previous in NEGATORS:
+                    negated = True
+            if negated:
+                valence *= NEGATION_SCALAR
+            hits.append((index, valence))
+
+        total = 0.0
+        for index, valence in hits:
+            if last_but >= 0:
+                valence *= BUT_BEFORE if index < last_but else BUT_AFTER
+            total += valence
+
+        if total:
+            total += math.copysign(min(text.count("!"), MAX_EXCLAMATIONS) * EXCLAMATION_BOOST, total)
+        return total
@@ -0,0 +1,151 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from models import TrendingContent, EngagementSnapshot
+from typing import List, Dict, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Downsampling tiers: (resolution being compacted, age after which it is
+# compacted, bucket width in seconds, resolution it becomes)
+RETENTION_TIERS = [
+    ("raw", 24 * 3600, 3600, "hour"),
+    ("hour", 30 * 24 * 3600, 24 * 3600, "day"),
+]
+
+COMPACT_INTERVAL_SECONDS = int(os.getenv("SNAPSHOT_COMPACT_INTERVAL_SECONDS", "900"))
+
+_compact_lock = threading.Lock()
+_last_compacted = 0.0
+
+def resolve_trend_ids(db: Session, items: List[Dict]) -> Dict[Tuple[str, str], int]:
+    # trending_content ids by (platform, content_id), with one lookup per
+    # platform and thousand items
+    by_platform = {}
+    for item in items:
+        by_platform.setdefault(item["platform"], []).append(item["content_id"])
+
+    ids = {}
+    for platform, content_ids in by_platform.items():
+        content_ids = list(dict.fromkeys(content_ids))
+        for start in range(0, len(content_ids), 1000):
+            found = db.query(TrendingContent.id, TrendingContent.content_id).filter(
+                TrendingContent.platform == platform,
+                TrendingContent.content_id.in_(content_ids[start:start + 1000])
+            )
+            ids.update(((platform, content_id), trend_id) for trend_id, content_id in found)
+    return ids
+
+def record_snapshots(db: Session, items: List[Dict], captured_at: Optional[int] = None,
+                     trend_ids: Optional[Dict[Tuple[str, str], int]] = None) -> int:
+    # One snapshot per fetched item, written with one executemany insert;
+    # callers that already resolved the ids pass them in
+    if not items:
+        return 0
+    captured_at = captured_at or int(time.time())
+    if trend_ids is None:
+        trend_ids = resolve_trend_ids(db, items)
+
+    latest = {(item["platform"], item["content_id"]): item for item in items}
+    rows = [
+        {
+            "trend_id": trend_ids[key],
+            "captured_at": captured_at,
+            "resolution": "raw",
+            "score": item.get("score") or 0,
+            "comments_count": item.get("comments_count") or 0,
+            "virality_score": item.get("virality_score") or 0.0
+        }
+        for key, item in latest.items() if key in trend_ids
+    ]
+
+    if rows:
+        db.execute(EngagementSnapshot.__table__.insert(), rows)
+    return len(rows)
+
+def maybe_compact(db: Session) -> bool:
+    global _last_compacted
+    with _compact_lock:
+        if time.monotonic() - _last_compacted < COMPACT_INTERVAL_SECONDS:
+            return False
+        _last_compacted = time.monotonic()
+    compact_snapshots(db)
+    return True
+
+def compact_snapshots(db: Session, now: Optional[int] = None) -> Dict[str, int]:
+    # Scores and comment counts are cumulative, so the last snapshot in each
+    # bucket carries everything the bucket needs; the rest are dropped and the
+    # survivor is promoted to the coarser resolution. Committed by the caller,
+    # normally the write queue.
+    now = now or int(time.time())
+    removed = {}
+    for resolution, max_age, bucket_seconds, coarser in RETENTION_TIERS:
+        params = {"resolution": resolution, "cutoff": now - max_age,
+                  "bucket": bucket_seconds, "coarser": coarser}
+        removed[resolution] = db.execute(text(
+            "DELETE FROM engagement_snapshots "
+            "WHERE resolution = :resolution AND captured_at < :cutoff AND id NOT IN ("
+            "  SELECT MAX(id) FROM engagement_snapshots "
+            "  WHERE resolution = :resolution AND captured_at < :cutoff "
+            "  GROUP BY trend_id, captured_at / :bucket)"
+        ), params).rowcount
+        db.execute(text(
+            "UPDATE engagement_snapshots SET resolution = :coarser "
+            "WHERE resolution = :resolution AND captured_at < :cutoff"
+        ), params)
+    logger.info(f"Compacted engagement snapshots (removed {removed})")
+    return removed
+
+def get_snapshots(db: Session, trend_id: int, since: Optional[int] = None, limit: int = 500) -> List[Dict]:
+    query = db.query(EngagementSnapshot).filter(EngagementSnapshot.trend_id == trend_id)
+    if since is not None:
+        query = query.filter(EngagementSnapshot.captured_at >= since)
+    snapshots = query.order_by(EngagementSnapshot.captured_at.desc()).limit(limit).all()
+    return [_snapshot_to_dict(s) for s in reversed(snapshots)]
+
+def get_velocity(db: Session, trend_id: int, window_hours: float = 6.0) -> Dict:
+    # Both ends come straight off the (trend_id, captured_at) index: the
+    # newest snapshot, and the oldest one inside the window (or the last one
+    # before it when the window holds a single point)
+    base = db.query(EngagementSnapshot).filter(EngagementSnapshot.trend_id == trend_id)
+    latest = base.order_by(EngagementSnapshot.captured_at.desc()).first()
+    if latest is None:
+        return {"trend_id": trend_id, "snapshots": 0, "message": "No snapshots recorded"}
+
+    window_start = latest.captured_at - int(window_hours * 3600)
+    earliest = base.filter(
+        EngagementSnapshot.captured_at >= window_start,
+        EngagementSnapshot.captured_at < latest.captured_at
+    ).order_by(EngagementSnapshot.captured_at.asc()).first()
+    if earliest is None:
+        earliest = base.filter(
+            EngagementSnapshot.captured_at < latest.captured_at
+        ).order_by(EngagementSnapshot.captured_at.desc()).first()
+
+    if earliest is None:
+        return {"trend_id": trend_id, "snapshots": 1, "latest": _snapshot_to_dict(latest),
+                "message": "Not enough snapshots for velocity"}
+
+    hours = (latest.captured_at - earliest.captured_at) / 3600
+    return {
+        "trend_id": trend_id,
+        "window_hours": round(hours, 3),
+        "score_per_hour": (latest.score - earliest.score) / hours,
+        "comments_per_hour": (latest.comments_count - earliest.comments_count) / hours,
+        "virality_change": latest.virality_score - earliest.virality_score,
+        "from": _snapshot_to_dict(earliest),
+        "latest": _snapshot_to_dict(latest)
+    }
+
+def _snapshot_to_dict(snapshot: EngagementSnapshot) -> Dict:
+    return {
+        "captured_at": snapshot.captured_at,
+        "resolution": snapshot.resolution,
+        "score": snapshot.score,
+        "comments_count": snapshot.comments_count,
+        "virality_score": snapshot.virality_score
+    }
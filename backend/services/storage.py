@@ -0,0 +1,221 @@
+from sqlalchemy import update, bindparam, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import List, Dict, Iterable, Optional, Tuple
+from datetime import datetime, timezone
+from models import DataVersion, TrendingContent, TrendTag, IngestionCursor
+from services.snapshot_store import record_snapshots, resolve_trend_ids
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns refreshed on every re-fetch of an item we already store
+METRIC_COLUMNS = ["score", "comments_count", "engagement_rate", "virality_score"]
+
+# Chart position, refreshed when a re-fetch carries one and kept otherwise
+RANK_COLUMNS = ["best_rank", "best_rank_region"]
+
+UPSERT_BATCH_SIZE = 1000
+
+_INSERTABLE_COLUMNS = [
+    column for column in TrendingContent.__table__.columns
+    if not column.primary_key and column.server_default is None
+]
+
+def bulk_upsert_trending_content(db: Session, items: List[Dict]) -> int:
+    rows = _prepare_rows(items)
+    if not rows:
+        return 0
+
+    dialect = db.get_bind().dialect.name
+    for batch in _batches(rows, UPSERT_BATCH_SIZE):
+        if dialect in ("sqlite", "postgresql"):
+            _upsert_on_conflict(db, dialect, batch)
+        else:
+            _upsert_portable(db, batch)
+
+    trend_ids = resolve_trend_ids(db, rows)
+    record_snapshots(db, rows, trend_ids=trend_ids)
+    record_tags(db, rows, trend_ids)
+    bump_data_version(db, "trends")
+    return len(rows)
+
+# trends: trending_content as /trends and /analytics/virality serve it;
+# content: generated_content behind /content/vault
+DATA_VERSIONS = ("trends", "content")
+
+def bump_data_version(db: Session, name: str):
+    # Part of the caller's transaction: cached responses go stale exactly
+    # when the write they depend on commits
+    table = DataVersion.__table__
+    updated = db.execute(
+        update(table).where(table.c.name == name).values(version=table.c.version + 1)
+    ).rowcount
+    if not updated:
+        db.execute(table.insert().values(name=name, version=1))
+
+MAX_TAG_LENGTH = TrendTag.__table__.c.tag.type.length
+
+def normalize_tag(tag) -> str:
+    return str(tag).strip().lower()[:MAX_TAG_LENGTH]
+
+def record_tags(db: Session, rows: List[Dict], trend_ids: Dict[Tuple[str, str], int]) -> int:
+    # Mirrors each item's tags into trend_tags for the /trends tag filter.
+    # Pairs already stored are skipped, so a re-fetch only costs the lookups.
+    pairs = {
+        (normalize_tag(tag), trend_ids[(row["platform"], row["content_id"])])
+        for row in rows if (row["platform"], row["content_id"]) in trend_ids
+        for tag in (row.get("tags") or []) if normalize_tag(tag)
+    }
+    if not pairs:
+        return 0
+    tag_rows = [{"tag": tag, "trend_id": trend_id} for tag, trend_id in pairs]
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        for batch in _batches(tag_rows, UPSERT_BATCH_SIZE):
+            db.execute(insert(TrendTag.__table__).on_conflict_do_nothing(), batch)
+        return len(tag_rows)
+
+    table = TrendTag.__table__
+    new_rows = []
+    for batch in _batches(tag_rows, UPSERT_BATCH_SIZE):
+        found = set(db.execute(select(table.c.tag, table.c.trend_id).where(
+            table.c.tag.in_({row["tag"] for row in batch}),
+            table.c.trend_id.in_({row["trend_id"] for row in batch})
+        )).all())
+        new_rows.extend(row for row in batch if (row["tag"], row["trend_id"]) not in found)
+    if new_rows:
+        db.execute(table.insert(), new_rows)
+    return len(tag_rows)
+
+def _prepare_rows(items: Iterable[Dict]) -> List[Dict]:
+    # Every row needs the same keys for a multi-row statement, and a key may
+    # only appear once per statement on Postgres, so the last occurrence wins
+    rows = {}
+    for item in items:
+        row = {}
+        for column in _INSERTABLE_COLUMNS:
+            if column.name in item:
+                row[column.name] = item[column.name]
+            elif column.default is not None and column.default.is_scalar:
+                row[column.name] = column.default.arg
+            else:
+                row[column.name] = None
+        rows[(row["platform"], row["content_id"])] = row
+    return list(rows.values())
+
+def _batches(rows: List[Dict], size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def _upsert_on_conflict(db: Session, dialect: str, rows: List[Dict]):
+    # A fixed statement executed with the whole batch as parameters keeps the
+    # compiled form cached; SQLAlchemy renders it as multi-row VALUES batches
+    db.execute(_upsert_statement(dialect), rows)
+
+_UPSERT_STATEMENTS = {}
+
+def _upsert_statement(dialect: str):
+    if dialect not in _UPSERT_STATEMENTS:
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        stmt = insert(TrendingContent.__table__)
+
+        updates = {name: stmt.excluded[name] for name in METRIC_COLUMNS}
+        updates.update({name: func.coalesce(stmt.excluded[name], stmt.table.c[name]) for name in RANK_COLUMNS})
+        updates["fetched_at"] = func.now()
+
+        _UPSERT_STATEMENTS[dialect] = stmt.on_conflict_do_update(
+            index_elements=["platform", "content_id"],
+            set_=updates
+        )
+    return _UPSERT_STATEMENTS[dialect]
+
+def _upsert_portable(db: Session, rows: List[Dict]):
+    # Fallback for dialects without ON CONFLICT: one lookup per platform in the
+    # batch, then one executemany insert and one executemany update
+    existing = set()
+    by_platform = {}
+    for row in rows:
+        by_platform.setdefault(row["platform"], []).append(row["content_id"])
+
+    for platform, content_ids in by_platform.items():
+        found = db.query(TrendingContent.content_id).filter(
+            TrendingContent.platform == platform,
+            TrendingContent.content_id.in_(content_ids)
+        ).all()
+        existing.update((platform, content_id) for (content_id,) in found)
+
+    new_rows = [row for row in rows if (row["platform"], row["content_id"]) not in existing]
+    old_rows = [row for row in rows if (row["platform"], row["content_id"]) in existing]
+
+    if new_rows:
+        db.execute(TrendingContent.__table__.insert(), new_rows)
+
+    if old_rows:
+        _update_metrics(db, old_rows)
+
+def bulk_update_metrics(db: Session, items: List[Dict]) -> int:
+    # Cheap refresh for items already stored: only the metric columns are
+    # sent, as one executemany UPDATE keyed on (platform, content_id)
+    for batch in _batches(items, UPSERT_BATCH_SIZE):
+        _update_metrics(db, batch)
+
+    record_snapshots(db, items)
+    bump_data_version(db, "trends")
+    return len(items)
+
+def _update_metrics(db: Session, rows: List[Dict]):
+    table = TrendingContent.__table__
+    values = {name: bindparam(f"new_{name}") for name in METRIC_COLUMNS}
+    values.update({name: func.coalesce(bindparam(f"new_{name}"), table.c[name]) for name in RANK_COLUMNS})
+    values["fetched_at"] = func.now()
+    stmt = update(table).where(
+        table.c.platform == bindparam("key_platform"),
+        table.c.content_id == bindparam("key_content_id")
+    ).values(values)
+    db.execute(stmt, [
+        dict(
+            {f"new_{name}": row.get(name) if name in RANK_COLUMNS else row[name]
+             for name in METRIC_COLUMNS + RANK_COLUMNS},
+            key_platform=row["platform"],
+            key_content_id=row["content_id"]
+        )
+        for row in rows
+    ])
+
+def existing_content_topics(db: Session, platform: str, content_ids: List[str]) -> Dict[str, Optional[str]]:
+    # Which of these items are stored already, with the topic each was
+    # given, so refreshes are scored against the same baseline
+    found = {}
+    for batch in _batches(list(content_ids), UPSERT_BATCH_SIZE):
+        found.update(db.query(TrendingContent.content_id, TrendingContent.topic_cluster).filter(
+            TrendingContent.platform == platform,
+            TrendingContent.content_id.in_(batch)
+        ))
+    return found
+
+def get_cursor(db: Session, source: str) -> Optional[IngestionCursor]:
+    return db.query(IngestionCursor).filter(IngestionCursor.source == source).first()
+
+def save_cursor(db: Session, source: str, last_seen_fullname: Optional[str],
+                last_seen_created_utc: Optional[float], items_processed: int) -> IngestionCursor:
+    cursor = get_cursor(db, source)
+    if cursor is None:
+        cursor = IngestionCursor(source=source, items_processed=0)
+        db.add(cursor)
+
+    # The watermark only moves forward; a listing without newer items keeps it
+    if last_seen_created_utc is not None and (
+        cursor.last_seen_created_utc is None or last_seen_created_utc > cursor.last_seen_created_utc
+    ):
+        cursor.last_seen_fullname = last_seen_fullname
+        cursor.last_seen_created_utc = last_seen_created_utc
+
+    cursor.last_fetched_at = datetime.now(timezone.utc)
+    cursor.items_processed = (cursor.items_processed or 0) + items_processed
+    return cursor
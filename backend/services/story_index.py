@@ -0,0 +1,549 @@
+import asyncio
+import os
+import string
+import threading
+import time
+import zlib
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, func, update
+from database import ReadSessionLocal, session_scope, state_path
+from models import TrendingContent
+from services.enrichment import vectorized_available
+from services.storage import bump_data_version
+from services.text import normalize
+from services.write_queue import get_write_queue
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # without numpy every item is its own story
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 20 bands of 3 rows: pairs at Jaccard 0.5 meet in some band 93% of the
+# time, at 0.6 99%; candidates are then checked against the threshold
+NUM_PERM = 60
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+STORY_THRESHOLD = float(os.getenv("STORY_SIMILARITY", "0.5"))
+INDEX_PATH = os.getenv("STORY_INDEX_PATH", state_path("story_index.npz"))
+SAVE_SECONDS = float(os.getenv("STORY_INDEX_SAVE_SECONDS", "600"))
+# Band keys collect in a dict and are merged into the sorted arrays in bulk
+MERGE_SIZE = 200000
+BACKFILL_PAGE = 2000
+# Permutations must not change between restarts, or saved keys stop matching
+SEED = 1729
+# Titles carry the story; a description's opening words are only added
+# when the title is too short to go on. Always mixing them in dilutes the
+# similarity between a described video and a text-less link post.
+MIN_TITLE_TOKENS = 4
+DESCRIPTION_WORDS = 12
+# Titles joined per lowercase/translate call when a batch is tokenized as
+# one stream, and the size of the token hash cache that stream goes through
+TOKENIZE_CHUNK = 256
+MAX_CACHED_TOKENS = 500000
+# Longest word, in UTF-8 bytes, whose bigram hashes are derived from the
+# cache; items with longer ones are shingled on their own
+MAX_SHIFT_BYTES = 48
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its of on or our so that the their this to was
+we what when who why will with you your
+""".split())
+
+_PUNCTUATION = str.maketrans({char: " " for char in string.punctuation + "‘’“”–—…"})
+_MIX = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+# Separator between titles in the token stream, as in services/enrichment.py
+_DOC_END = "\x00"
+# Token cache values besides the ids of cached words
+_STOPWORD = -1
+_DOC_END_CODE = -2
+_UNSEEN = -3
+
+class StoryIndex:
+    def __init__(self, path: Optional[str] = INDEX_PATH):
+        self.path = path
+        rng = np.random.default_rng(SEED)
+        # Multiply-shift hashing: (a * x + b) mod 2^64, top 32 bits, a odd
+        self._a = rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+        self._mix = np.array(_MIX, dtype=np.uint64)
+        self._band_salt = (np.arange(BANDS, dtype=np.uint64) + np.uint64(1)) * self._mix[3]
+
+        # Band key -> story, as sorted arrays plus the keys added since the last merge
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._stories = np.zeros(0, dtype=np.int32)
+        self._pending: Dict[int, int] = {}
+        # One 16-bit-per-hash signature per story, for verifying candidates;
+        # row = story id
+        self._signatures = np.zeros((1024, NUM_PERM), dtype=np.uint16)
+        self.next_id = 1
+        self.indexed_through = 0
+        self.loaded = False
+        self.last_save: Optional[Dict] = None
+
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Word -> id into crc32 of the word, crc32 of " " + word and that
+        # one's length, for the stream shingles
+        self._token_ids: Dict[str, int] = {}
+        self._token_hashes = np.zeros((1024, 3), dtype=np.uint64)
+        self._shift_tables: Optional["np.ndarray"] = None
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    # Assignment
+
+    def assign_batch(self, docs: List[Tuple[str, str, str]]) -> List[Optional[int]]:
+        # docs are (title, body, extra); returns a story id per item, None
+        # for items with no usable words. Each lookup touches BANDS keys,
+        # whatever the size of the index.
+        vectorized = vectorized_available()
+        if not vectorized:
+            lengths, values = self._flatten([self._shingles(title, body) for title, body, _ in docs])
+        with self._lock:
+            if vectorized:
+                # Under the lock: it fills the word hash cache
+                lengths, values = self._stream_shingles(docs)
+            signatures, keys, found = self._prepare(lengths, values)
+            nonempty = (lengths > 0).tolist()
+            if vectorized:
+                stories = self._assign_rows(signatures, keys, found, nonempty)
+            else:
+                stories = []
+                for row, usable in enumerate(nonempty):
+                    if not usable:
+                        stories.append(None)
+                        continue
+                    story = self._best_candidate(signatures[row], keys[row], found[row])
+                    if story is None:
+                        story = self._new_story(signatures[row])
+                    self._insert(keys[row], found[row], story)
+                    stories.append(story)
+            self._maybe_merge()
+            return stories
+
+    def _assign_rows(self, signatures: "np.ndarray", keys: "np.ndarray", found: "np.ndarray",
+                     nonempty: List[bool]) -> List[Optional[int]]:
+        # The loop in assign_batch() for the whole batch at once, with the
+        # same outcome. A row's candidates are the stories its band keys
+        # already point to, in the merged arrays or pending, plus the stories
+        # of earlier rows of this batch that first brought one of its keys.
+        # The first kind are scored for every row in one array operation;
+        # only rows that share a new key with an earlier row, near-duplicates
+        # within the batch, are then looked at one by one.
+        stories: List[Optional[int]] = [None] * len(keys)
+        rows = np.flatnonzero(nonempty)
+        if not len(rows):
+            return stories
+        keys, found, signatures = keys[rows], found[rows], signatures[rows]
+        pending = np.fromiter(map(self._pending.get, keys.ravel().tolist(), repeat(0)),
+                              dtype=np.int64, count=keys.size).reshape(keys.shape)
+
+        # Keys no story has yet; each is inserted by the first row holding it
+        new = (found <= 0) & (pending == 0)
+        _, first, inverse = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+        first_row = (first // BANDS)[inverse.ravel()].reshape(keys.shape)
+        position = np.arange(len(rows))[:, None]
+        shared = new & (first_row < position)
+        inserts = new & (first_row == position)
+
+        candidates = np.concatenate((np.maximum(found, 0), pending), axis=1)
+        similarity = np.full(candidates.shape, -1.0)
+        pairs = np.nonzero(candidates)
+        similarity[pairs] = (self._signatures[candidates[pairs]] == signatures[pairs[0]]).mean(axis=1)
+        best = similarity.max(axis=1)
+        # Ties go to the oldest story, as in _best_candidate()
+        oldest = np.where(similarity == best[:, None], candidates, np.iinfo(np.int64).max).min(axis=1)
+        matched = np.where(best >= STORY_THRESHOLD, oldest, 0).tolist()
+
+        assigned: List[int] = []
+        for index, (row, story, near) in enumerate(zip(rows.tolist(), matched, shared.any(axis=1).tolist())):
+            if near:
+                earlier = {assigned[other] for other in first_row[index][shared[index]].tolist()}
+                pool = np.array(sorted(earlier.union(candidates[index][candidates[index] > 0].tolist())))
+                scores = (self._signatures[pool] == signatures[index]).mean(axis=1)
+                choice = int(scores.argmax())
+                story = int(pool[choice]) if scores[choice] >= STORY_THRESHOLD else 0
+            if not story:
+                story = self._new_story(signatures[index])
+            assigned.append(story)
+            stories[row] = story
+
+        stories_by_position = np.array(assigned, dtype=np.int64)
+        self._pending.update(zip(keys[inserts].tolist(), stories_by_position[np.nonzero(inserts)[0]].tolist()))
+        return stories
+
+    def _index_known(self, shingles: List["np.ndarray"], stories: List[int]):
+        # Items that already carry a story id (catch-up after a restart)
+        # are put back under that id instead of being matched again
+        with self._lock:
+            signatures, keys, found = self._prepare(*self._flatten(shingles))
+            for row, story in enumerate(stories):
+                if not len(shingles[row]):
+                    continue
+                self._grow(story + 1)
+                if not self._signatures[story].any():
+                    self._signatures[story] = signatures[row]
+                self.next_id = max(self.next_id, story + 1)
+                self._insert(keys[row], found[row], story)
+            self._maybe_merge()
+
+    def _best_candidate(self, signature: "np.ndarray", keys: "np.ndarray", found: "np.ndarray") -> Optional[int]:
+        candidates = set(found[found > 0].tolist())
+        for key in keys.tolist():
+            story = self._pending.get(key)
+            if story is not None:
+                candidates.add(story)
+        if not candidates:
+            return None
+        # Sorted, so ties go to the oldest story
+        candidates = np.array(sorted(candidates), dtype=np.int64)
+        similarity = (self._signatures[candidates] == signature).mean(axis=1)
+        best = int(similarity.argmax())
+        return int(candidates[best]) if similarity[best] >= STORY_THRESHOLD else None
+
+    def _new_story(self, signature: "np.ndarray") -> int:
+        story = self.next_id
+        self._grow(story + 1)
+        self._signatures[story] = signature
+        self.next_id += 1
+        return story
+
+    def _insert(self, keys: "np.ndarray", found: "np.ndarray", story: int):
+        # A band key keeps the first story it was seen with
+        for key, existing in zip(keys.tolist(), found.tolist()):
+            if existing <= 0:
+                self._pending.setdefault(key, story)
+
+    def _grow(self, size: int):
+        if size > len(self._signatures):
+            grown = np.zeros((max(size, 2 * len(self._signatures)), NUM_PERM), dtype=np.uint16)
+            grown[:len(self._signatures)] = self._signatures
+            self._signatures = grown
+
+    def _maybe_merge(self):
+        if len(self._pending) < MERGE_SIZE:
+            return
+        # Inserting a sorted run into the sorted arrays is one linear copy
+        pending_keys = np.fromiter(self._pending.keys(), dtype=np.uint64, count=len(self._pending))
+        pending_stories = np.fromiter(self._pending.values(), dtype=np.int32, count=len(self._pending))
+        order = np.argsort(pending_keys)
+        positions = np.searchsorted(self._keys, pending_keys[order])
+        self._keys = np.insert(self._keys, positions, pending_keys[order])
+        self._stories = np.insert(self._stories, positions, pending_stories[order])
+        self._pending.clear()
+
+    # MinHash
+
+    def _shingles(self, title: str, body: str) -> "np.ndarray":
+        tokens = self._tokens(title)
+        if len(tokens) < MIN_TITLE_TOKENS and body:
+            tokens += self._tokens(" ".join(body.split()[:DESCRIPTION_WORDS]))
+        shingles = set(tokens)
+        shingles.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+        return np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles),
+                           dtype=np.uint64, count=len(shingles))
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return [word for word in text.lower().translate(_PUNCTUATION).split() if word not in STOPWORDS]
+
+    def _stream_shingles(self, docs: List[Tuple[str, str, str]]) -> Tuple["np.ndarray", "np.ndarray"]:
+        # The shingle hashes of _shingles() for a whole batch, as row lengths
+        # and values in row order. Titles go through _stream_hashes() first;
+        # those too short to go on alone go again with the opening words of
+        # their description, which tokenizes the same as the two apart.
+        # Items _stream_hashes() cannot take are shingled one by one.
+        rows, values, counts, separate = self._stream_hashes([title for title, _, _ in docs])
+        short = np.array([row for row in np.flatnonzero(counts < MIN_TITLE_TOKENS).tolist() if docs[row][1]],
+                         dtype=np.int64)
+        if len(short):
+            texts = [f"{docs[row][0]} {' '.join(docs[row][1].split()[:DESCRIPTION_WORDS])}" for row in short.tolist()]
+            short_rows, short_values, _, short_separate = self._stream_hashes(texts)
+            keep = ~np.isin(rows, short)
+            rows = np.concatenate((rows[keep], short[short_rows]))
+            values = np.concatenate((values[keep], short_values))
+            separate = np.union1d(separate, short[short_separate])
+        if len(separate):
+            own = [self._shingles(docs[row][0], docs[row][1]) for row in separate.tolist()]
+            keep = ~np.isin(rows, separate)
+            rows = np.concatenate([rows[keep]] + [np.full(len(item), row, dtype=np.int64)
+                                                  for row, item in zip(separate.tolist(), own)])
+            values = np.concatenate([values[keep]] + own)
+        order = np.argsort(rows, kind="stable")
+        return np.bincount(rows, minlength=len(docs)), values[order]
+
+    def _stream_hashes(self, texts: List[str]) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+        # Word and bigram hashes of every text, as a text index and a value
+        # per hash, plus each text's word count and the texts left to
+        # _shingles(). The texts are tokenized as one stream and every word
+        # goes through the hash cache in a single pass. A bigram's hash comes
+        # from its words' cached ones: crc32(a + " " + b) is crc32(" " + b)
+        # xor crc32(a) run through len(" " + b) zero bytes, and the latter is
+        # linear, so a table lookup (see _shift). Values may repeat within a
+        # text; MinHash only takes minimums, so that changes nothing.
+        if len(self._token_ids) > MAX_CACHED_TOKENS:
+            self._token_ids.clear()
+        rows, values = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.uint64)]
+        counts = np.zeros(len(texts), dtype=np.int64)
+        separate = [np.zeros(0, dtype=np.int64)]
+        for start in range(0, len(texts), TOKENIZE_CHUNK):
+            chunk = texts[start:start + TOKENIZE_CHUNK]
+            text = "".join(f"{text} {_DOC_END} " for text in chunk)
+            if text.count(_DOC_END) != len(chunk):
+                # A text contained the separator
+                separate.append(np.arange(start, start + len(chunk)))
+                continue
+            tokens = normalize(text).split()
+            ids = np.fromiter(map(self._token_ids.get, tokens, repeat(_UNSEEN)), dtype=np.int64, count=len(tokens))
+            for position in np.flatnonzero(ids == _UNSEEN).tolist():
+                ids[position] = self._token_id(tokens[position])
+            ends = ids == _DOC_END_CODE
+            token_rows = (np.cumsum(ends) - ends)[ids >= 0] + start
+            hashes = self._token_hashes[ids[ids >= 0]]
+            counts[start:start + len(chunk)] = np.bincount(token_rows - start, minlength=len(chunk))
+
+            same_row = token_rows[1:] == token_rows[:-1]
+            sizes = hashes[1:, 2][same_row]
+            bigram_rows = token_rows[1:][same_row]
+            separate.append(np.unique(bigram_rows[sizes > MAX_SHIFT_BYTES]))
+            rows.extend((token_rows, bigram_rows))
+            values.extend((hashes[:, 0],
+                           hashes[1:, 1][same_row] ^ self._shift(hashes[:-1, 0][same_row],
+                                                                 np.minimum(sizes, MAX_SHIFT_BYTES))))
+        return np.concatenate(rows), np.concatenate(values), counts, np.concatenate(separate)
+
+    def _token_id(self, token: str) -> int:
+        if token in self._token_ids:
+            return self._token_ids[token]
+        if token == _DOC_END:
+            index = _DOC_END_CODE
+        elif token in STOPWORDS:
+            index = _STOPWORD
+        else:
+            # Ids follow the cache size, so a few rows go unused; that keeps
+            # every cached entry, marker or word, a single dict lookup
+            index = len(self._token_ids)
+            if index >= len(self._token_hashes):
+                grown = np.zeros((2 * index, 3), dtype=np.uint64)
+                grown[:len(self._token_hashes)] = self._token_hashes
+                self._token_hashes = grown
+            tail = f" {token}".encode()
+            self._token_hashes[index] = (zlib.crc32(token.encode()), zlib.crc32(tail), len(tail))
+        self._token_ids[token] = index
+        return index
+
+    def _shift(self, crcs: "np.ndarray", sizes: "np.ndarray") -> "np.ndarray":
+        # crc32 state after feeding `size` zero bytes, minus what the zeros
+        # alone contribute: linear in the starting crc, so it is the xor of
+        # one table entry per byte of it
+        if self._shift_tables is None:
+            tables = np.zeros((MAX_SHIFT_BYTES + 1, 4, 256), dtype=np.uint64)
+            for size in range(MAX_SHIFT_BYTES + 1):
+                zeros = bytes(size)
+                base = zlib.crc32(zeros)
+                for byte in range(4):
+                    for value in range(256):
+                        tables[size, byte, value] = zlib.crc32(zeros, value << (8 * byte)) ^ base
+            self._shift_tables = tables
+        tables = self._shift_tables
+        crcs = crcs.astype(np.int64)
+        sizes = sizes.astype(np.int64)
+        return (tables[sizes, 0, crcs & 0xFF] ^ tables[sizes, 1, (crcs >> 8) & 0xFF]
+                ^ tables[sizes, 2, (crcs >> 16) & 0xFF] ^ tables[sizes, 3, crcs >> 24])
+
+    @staticmethod
+    def _flatten(shingles: List["np.ndarray"]) -> Tuple["np.ndarray", "np.ndarray"]:
+        lengths = np.array([len(item) for item in shingles], dtype=np.int64)
+        values = np.concatenate(shingles) if shingles else np.zeros(0, dtype=np.uint64)
+        return lengths, values.astype(np.uint64, copy=False)
+
+    def _prepare(self, lengths: "np.ndarray", values: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        # MinHash signatures for the whole batch in one pass, their band
+        # keys, and each key's story in the merged arrays (0 when absent).
+        # values holds every row's shingle hashes back to back.
+        count = len(lengths)
+        signatures = np.zeros((count, NUM_PERM), dtype=np.uint16)
+        keys = np.zeros((count, BANDS), dtype=np.uint64)
+        found = np.zeros((count, BANDS), dtype=np.int64)
+        nonempty = np.flatnonzero(lengths)
+        if not len(nonempty):
+            return signatures, keys, found
+
+        offsets = np.concatenate(([0], np.cumsum(lengths[nonempty])[:-1]))
+        with np.errstate(over="ignore"):
+            hashed = (self._a[:, None] * values[None, :] + self._b[:, None]) >> np.uint64(32)
+            minimums = np.minimum.reduceat(hashed, offsets, axis=1).T
+
+            bands = minimums.reshape(len(nonempty), BANDS, ROWS)
+            band_keys = self._band_salt[None, :].copy()
+            for column in range(ROWS):
+                band_keys = band_keys + bands[:, :, column] * self._mix[column]
+            band_keys ^= band_keys >> np.uint64(29)
+
+        signatures[nonempty] = (minimums & np.uint64(0xFFFF)).astype(np.uint16)
+        keys[nonempty] = band_keys
+        if len(self._keys):
+            positions = np.minimum(np.searchsorted(self._keys, band_keys), len(self._keys) - 1)
+            hits = self._keys[positions] == band_keys
+            found[nonempty] = np.where(hits, self._stories[positions], 0)
+        return signatures, keys, found
+
+    # Persistence and catch-up
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.path:
+            await asyncio.get_running_loop().run_in_executor(None, self.save)
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.catch_up)
+        except Exception as e:
+            logger.error(f"Story index catch-up failed: {str(e)}")
+        while True:
+            await asyncio.sleep(SAVE_SECONDS)
+            if not self.path:
+                continue
+            try:
+                await loop.run_in_executor(None, self.save)
+            except Exception as e:
+                logger.error(f"Could not save story index: {str(e)}")
+
+    def catch_up(self) -> int:
+        # Index rows stored after the last save (all of them when there is
+        # no saved index). Rows without a story id, e.g. from before story
+        # grouping existed, are assigned one.
+        started = time.perf_counter()
+        with session_scope(ReadSessionLocal) as db:
+            stored_max = db.query(func.max(TrendingContent.story_id)).scalar() or 0
+        with self._lock:
+            self.next_id = max(self.next_id, stored_max + 1)
+        last_id = self.indexed_through
+        indexed = 0
+        while True:
+            # A session per page, so a long backfill does not hold a connection
+            with session_scope(ReadSessionLocal) as db:
+                rows = db.query(
+                    TrendingContent.id, TrendingContent.title, TrendingContent.description, TrendingContent.story_id
+                ).filter(TrendingContent.id > last_id).order_by(TrendingContent.id).limit(BACKFILL_PAGE).all()
+            if not rows:
+                break
+            known = [row for row in rows if row.story_id is not None]
+            if known:
+                self._index_known([self._shingles(row.title, row.description) for row in known],
+                                  [row.story_id for row in known])
+            unknown = [row for row in rows if row.story_id is None]
+            if unknown:
+                stories = self.assign_batch([(row.title, row.description or "", "") for row in unknown])
+                updates = [{"row_id": row.id, "story": story}
+                           for row, story in zip(unknown, stories) if story is not None]
+                if updates:
+                    def store(session, updates=updates):
+                        session.execute(
+                            update(TrendingContent.__table__)
+                            .where(TrendingContent.__table__.c.id == bindparam("row_id"))
+                            .values(story_id=bindparam("story")),
+                            updates
+                        )
+                        bump_data_version(session, "trends")
+
+                    get_write_queue().run(store)
+            last_id = self.indexed_through = rows[-1].id
+            indexed += len(rows)
+        if indexed:
+            logger.info(f"Indexed {indexed} stored items into story index in "
+                        f"{time.perf_counter() - started:.1f}s")
+        return indexed
+
+    def save(self, through: Optional[int] = None):
+        # Every row stored before this point went through the index first,
+        # so the snapshot covers all ids up to it
+        if through is None:
+            with session_scope(ReadSessionLocal) as db:
+                through = db.query(func.max(TrendingContent.id)).scalar() or 0
+        with self._lock:
+            pending_keys = np.fromiter(self._pending.keys(), dtype=np.uint64, count=len(self._pending))
+            pending_stories = np.fromiter(self._pending.values(), dtype=np.int32, count=len(self._pending))
+            keys = np.concatenate((self._keys, pending_keys))
+            stories = np.concatenate((self._stories, pending_stories))
+            signatures = self._signatures[:self.next_id].copy()
+            next_id = self.next_id
+
+        order = np.argsort(keys, kind="stable")
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as handle:
+            np.savez(
+                handle,
+                keys=keys[order],
+                stories=stories[order],
+                signatures=signatures,
+                next_id=np.array(next_id),
+                indexed_through=np.array(max(through, self.indexed_through)),
+                num_perm=np.array(NUM_PERM)
+            )
+        os.replace(temporary, self.path)
+        self.indexed_through = max(through, self.indexed_through)
+        self.last_save = {"keys": len(keys), "stories": next_id - 1, "through_id": through}
+
+    def load(self, path: str):
+        try:
+            with np.load(path) as saved:
+                if int(saved["num_perm"]) != NUM_PERM:
+                    logger.warning(f"Ignoring story index at {path}: built with different permutations")
+                    return
+                self._keys = saved["keys"]
+                self._stories = saved["stories"]
+                self.next_id = int(saved["next_id"])
+                self._signatures = np.zeros((max(self.next_id, 1024), NUM_PERM), dtype=np.uint16)
+                self._signatures[:len(saved["signatures"])] = saved["signatures"]
+                self.indexed_through = int(saved["indexed_through"])
+            self.loaded = True
+            logger.info(f"Loaded story index from {path}: {len(self._keys)} keys, {self.next_id - 1} stories")
+        except Exception as e:
+            logger.warning(f"Could not load story index from {path}: {str(e)}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "stories": self.next_id - 1,
+                "keys": len(self._keys) + len(self._pending),
+                "pending_keys": len(self._pending),
+                "memory_bytes": int(self._keys.nbytes + self._stories.nbytes + self._signatures.nbytes),
+                "similarity_threshold": STORY_THRESHOLD,
+                "loaded_from_disk": self.loaded,
+                "last_save": self.last_save
+            }
+
+_index: Optional[StoryIndex] = None
+_index_lock = threading.Lock()
+
+def get_story_index() -> Optional[StoryIndex]:
+    global _index
+    if np is None:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = StoryIndex()
+        return _index
+
+def apply_story_ids(docs: List[Tuple[str, str, str]], enriched: List[Dict]) -> List[Dict]:
+    index = get_story_index()
+    stories = index.assign_batch(docs) if index is not None else [None] * len(docs)
+    for result, story in zip(enriched, stories):
+        result["story_id"] = story
+    return enriched
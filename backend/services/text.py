@@ -0,0 +1,25 @@
+import string
+
+# Punctuation becomes whitespace, so str.split() yields whole words
+PUNCTUATION = string.punctuation + "‘’“”–—…"
+
+_PUNCTUATION = str.maketrans({char: " " for char in PUNCTUATION})
+_ASCII_PUNCTUATION = bytes.maketrans(string.punctuation.encode(), b" " * len(string.punctuation))
+_WIDE_PUNCTUATION = tuple(char.encode() for char in PUNCTUATION if not char.isascii())
+
+def normalize(text: str) -> str:
+    # The same as text.lower().translate() with punctuation mapped to
+    # spaces. str.translate() drops off its fast path at the first character
+    # outside ASCII and runs several times slower from there, so a batch
+    # joined into one string would pay that for every emoji or curly quote
+    # in any of its items. Other text is translated over its UTF-8 bytes,
+    # where ASCII punctuation never occurs inside a multi-byte character.
+    text = text.lower()
+    if text.isascii():
+        return text.translate(_PUNCTUATION)
+    # surrogatepass: API text can carry lone surrogates, which plain UTF-8 refuses
+    encoded = text.encode("utf-8", "surrogatepass")
+    for char in _WIDE_PUNCTUATION:
+        if char in encoded:
+            encoded = encoded.replace(char, b" ")
+    return encoded.translate(_ASCII_PUNCTUATION).decode("utf-8", "surrogatepass")
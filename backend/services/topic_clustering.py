@@ -0,0 +1,541 @@
+import asyncio
+import json
+import math
+import os
+import string
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, update
+from database import ReadSessionLocal, session_scope, state_path
+from models import TopicCluster, TrendingContent
+from services.enrichment import vectorized_available
+from services.storage import bump_data_version
+from services.text import normalize
+from services.write_queue import get_write_queue
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # without numpy items keep their keyword topics
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOPIC_CLUSTER_PREFIX = "cluster-"
+
+# Hashed feature space: 2^16 buckets keeps 32 dense centroids at 8 MB
+HASH_BITS = int(os.getenv("TOPIC_HASH_BITS", "16"))
+CLUSTER_COUNT = int(os.getenv("TOPIC_CLUSTERS", "32"))
+REFIT_SECONDS = float(os.getenv("TOPIC_REFIT_SECONDS", str(6 * 3600)))
+# First fit after startup when no saved model exists
+INITIAL_FIT_DELAY_SECONDS = 60
+FIT_SAMPLE_SIZE = int(os.getenv("TOPIC_FIT_SAMPLE", "20000"))
+MIN_FIT_ITEMS = 200
+MODEL_PATH = os.getenv("TOPIC_MODEL_PATH", state_path("topic_model.npz"))
+
+BATCH_SIZE = 1024
+FIT_PASSES = 3
+MIN_FIT_ITERATIONS = 50
+SEED_SAMPLE_SIZE = 4096
+# Rows whose similarity is computed at once; bounds the K x nnz scratch array
+SIMILARITY_CHUNK = 2048
+# Below this cosine similarity an item keeps its keyword topic
+MIN_SIMILARITY = 0.1
+# A re-fitted centroid inherits an old id only when this close to it
+MATCH_SIMILARITY = 0.3
+LABEL_TERMS = 3
+# Descriptions are stored cut to 500 characters; features use the same
+# text at ingest and at re-fit
+BODY_CHARS = 500
+MAX_CACHED_TOKENS = 500000
+# Documents joined per lowercase/translate call when a batch is tokenized
+# as one stream
+TOKENIZE_CHUNK = 256
+
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further get gets got had has have having he her here
+hers herself him himself his how i if in into is it its itself just let like me more most my myself new no nor
+not now of off on once one only or other our ours out over own same she should so some such than that the their
+theirs them themselves then there these they this those through to too under until up very via vs was we were
+what when where which while who whom why will with would you your yours yourself
+""".split())
+
+_PUNCTUATION = str.maketrans({char: " " for char in string.punctuation + "‘’“”–—…"})
+# Separator between documents in the token stream, as in services/enrichment.py
+_DOC_END = "\x00"
+# Bucket cache values for tokens that are not features
+_SKIPPED = -1
+_DOC_END_CODE = -2
+_UNSEEN = -3
+
+# Sparse rows in CSR form: (indptr, indices, data); term counts come in the
+# same form with the counts as data
+Rows = Tuple["np.ndarray", "np.ndarray", "np.ndarray"]
+
+class TopicClusterer:
+    def __init__(self, cluster_count: int = CLUSTER_COUNT, hash_bits: int = HASH_BITS,
+                 model_path: Optional[str] = MODEL_PATH):
+        self.cluster_count = cluster_count
+        self.dim = 1 << hash_bits
+        self.model_path = model_path
+        self.refit_seconds = REFIT_SECONDS
+
+        self.centroids: Optional[np.ndarray] = None
+        self.ids: List[int] = []
+        self.counts = np.zeros(0)
+        self.df = np.zeros(self.dim)
+        self.docs = 0
+        self.terms: Dict[int, str] = {}
+        self.next_id = 1
+        self.last_refit: Optional[Dict] = None
+
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, int] = {}
+        self._rng = np.random.default_rng()
+        self._task: Optional[asyncio.Task] = None
+
+        if model_path and os.path.exists(model_path):
+            self.load(model_path)
+
+    @staticmethod
+    def key(cluster_id: int) -> str:
+        return f"{TOPIC_CLUSTER_PREFIX}{cluster_id}"
+
+    @property
+    def fitted(self) -> bool:
+        return self.centroids is not None
+
+    # Assignment
+
+    def assign_batch(self, docs: List[Tuple[str, str, str]], learn: bool = True) -> List[Optional[str]]:
+        # docs are (title, body, extra). Cost per item depends only on its
+        # length and the number of clusters, never on how much is stored.
+        # Confident assignments also nudge their centroids, so clusters
+        # follow the stream between re-fits.
+        if not docs:
+            return []
+        counts = self._counts(docs)
+        with self._lock:
+            self._observe(counts)
+            if self.centroids is None:
+                return [None] * len(docs)
+            rows = self._transform(counts)
+            labels, best = self._nearest(self.centroids, rows)
+            confident = best >= MIN_SIMILARITY
+            if learn and confident.any():
+                self._update(self.centroids, self.counts, self._take(rows, np.flatnonzero(confident)),
+                             labels[confident])
+            return [self.key(self.ids[label]) if ok else None
+                    for label, ok in zip(labels.tolist(), confident.tolist())]
+
+    # Re-fitting
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        delay = self.refit_seconds if self.fitted else INITIAL_FIT_DELAY_SECONDS
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await loop.run_in_executor(None, self.refit)
+            except Exception as e:
+                logger.error(f"Topic re-fit failed: {str(e)}")
+            delay = self.refit_seconds
+
+    def refit(self) -> Dict:
+        started = time.perf_counter()
+        # Everything read up front; the connection is not held while fitting
+        with session_scope(ReadSessionLocal) as db:
+            items = db.query(
+                TrendingContent.id, TrendingContent.platform, TrendingContent.title,
+                TrendingContent.description, TrendingContent.tags
+            ).order_by(TrendingContent.fetched_at.desc()).limit(FIT_SAMPLE_SIZE).all()
+            # Ids are never reused, including those of retired clusters
+            stored_max = max((cluster_id for (cluster_id,) in db.query(TopicCluster.id).all()), default=0)
+        if len(items) < MIN_FIT_ITEMS:
+            result = {"status": "skipped", "reason": f"{len(items)} items, need {MIN_FIT_ITEMS}"}
+            self.last_refit = result
+            return result
+
+        docs = [
+            (item.title, item.description or "",
+             " ".join(item.tags or []) if item.platform == "youtube" else "")
+            for item in items
+        ]
+        counts = self._counts(docs)
+        terms = self._learn_terms(docs)
+
+        # IDF is re-estimated from the sample, so the new centroids and
+        # the features they are compared against share one weighting
+        df = np.bincount(counts[1], minlength=self.dim).astype(np.float64)
+        rows = self._transform(counts, df, len(docs))
+
+        centroids, counts = self._fit(rows, min(self.cluster_count, len(docs)))
+        labels, best = self._nearest(centroids, rows)
+
+        with self._lock:
+            self.next_id = max(self.next_id, stored_max + 1)
+            ids = self._align(centroids)
+            self.centroids = centroids
+            self.counts = counts
+            self.ids = ids
+            self.df = df
+            self.docs = len(docs)
+            self.terms.update(terms)
+        if self.model_path:
+            self.save(self.model_path)
+
+        sizes = np.bincount(labels[best >= MIN_SIMILARITY], minlength=len(ids))
+        # Items in the sample move to their re-fitted clusters; anything
+        # below the similarity floor keeps the topic it already has
+        confident = np.flatnonzero(best >= MIN_SIMILARITY)
+
+        def store(session):
+            self._store_clusters(session, sizes)
+            if len(confident):
+                session.execute(
+                    update(TrendingContent.__table__)
+                    .where(TrendingContent.__table__.c.id == bindparam("row_id"))
+                    .values(topic_cluster=bindparam("topic")),
+                    [{"row_id": items[i].id, "topic": self.key(ids[labels[i]])} for i in confident.tolist()]
+                )
+            # Topic labels show in /analytics/virality even when no item moved
+            bump_data_version(session, "trends")
+
+        get_write_queue().run(store)
+
+        result = {
+            "status": "fitted",
+            "items": len(docs),
+            "clusters": len(ids),
+            "assigned": len(confident),
+            "seconds": round(time.perf_counter() - started, 3),
+            "fitted_at": datetime.now(timezone.utc).isoformat()
+        }
+        self.last_refit = result
+        logger.info(f"Re-fitted {len(ids)} topic clusters on {len(docs)} items in {result['seconds']}s")
+        return result
+
+    def _fit(self, rows: Rows, k: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        # Spherical mini-batch k-means with k-means++ seeding
+        count = len(rows[0]) - 1
+        centroids = self._seed(rows, k)
+        counts = np.zeros(k)
+        iterations = max(MIN_FIT_ITERATIONS, FIT_PASSES * count // BATCH_SIZE)
+        for _ in range(iterations):
+            batch = self._take(rows, self._rng.choice(count, size=min(BATCH_SIZE, count), replace=False))
+            labels, _ = self._nearest(centroids, batch)
+            self._update(centroids, counts, batch, labels)
+        return centroids, counts
+
+    def _seed(self, rows: Rows, k: int) -> "np.ndarray":
+        count = len(rows[0]) - 1
+        sample = self._take(rows, self._rng.choice(count, size=min(SEED_SAMPLE_SIZE, count), replace=False))
+        size = len(sample[0]) - 1
+        centroids = np.zeros((k, self.dim), dtype=np.float32)
+        chosen = int(self._rng.integers(size))
+        centroids[0] = self._dense(sample, chosen)
+        distance = 1 - self._similarities(centroids[:1], sample)[0]
+        for index in range(1, k):
+            weights = np.clip(distance, 0, None) ** 2
+            total = weights.sum()
+            chosen = int(self._rng.choice(size, p=weights / total)) if total > 0 else int(self._rng.integers(size))
+            centroids[index] = self._dense(sample, chosen)
+            distance = np.minimum(distance, 1 - self._similarities(centroids[index:index + 1], sample)[0])
+        return centroids
+
+    def _align(self, centroids: "np.ndarray") -> List[int]:
+        # Greedy best-match between new and old centroids; matched clusters
+        # keep their id so stored topic_cluster values stay meaningful
+        ids = [None] * len(centroids)
+        if self.centroids is not None and len(self.ids):
+            similarity = centroids @ self.centroids.T
+            taken = set()
+            for flat in np.argsort(similarity, axis=None)[::-1].tolist():
+                new, old = divmod(flat, similarity.shape[1])
+                if similarity[new, old] < MATCH_SIMILARITY:
+                    break
+                if ids[new] is None and old not in taken:
+                    ids[new] = self.ids[old]
+                    taken.add(old)
+        for index in range(len(ids)):
+            if ids[index] is None:
+                ids[index] = self.next_id
+                self.next_id += 1
+        return ids
+
+    # Features
+
+    def _counts(self, docs: List[Tuple[str, str, str]]) -> Rows:
+        # Hashed term counts of every document, one CSR row each
+        if vectorized_available():
+            counts = self._stream_counts(docs)
+            if counts is not None:
+                return counts
+        bucket_counts = [self._bucket_counts(doc) for doc in docs]
+        indptr = np.zeros(len(bucket_counts) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(counts) for counts in bucket_counts])
+        indices = np.fromiter((bucket for counts in bucket_counts for bucket in counts),
+                              dtype=np.int64, count=int(indptr[-1]))
+        tf = np.fromiter((count for counts in bucket_counts for count in counts.values()),
+                         dtype=np.float64, count=int(indptr[-1]))
+        return indptr, indices, tf
+
+    def _stream_counts(self, docs: List[Tuple[str, str, str]]) -> Optional[Rows]:
+        # The same counts as _bucket_counts() for the whole batch, without a
+        # dict per document: the batch is tokenized as one stream, each token
+        # mapped to its bucket through the cache in one pass, and the
+        # (document, bucket) pairs counted with np.unique. None when a
+        # document contains the separator.
+        buckets = self._buckets
+        if len(buckets) > MAX_CACHED_TOKENS:
+            buckets.clear()
+        keys = []
+        for start in range(0, len(docs), TOKENIZE_CHUNK):
+            chunk = docs[start:start + TOKENIZE_CHUNK]
+            text = "".join(f"{title} {body[:BODY_CHARS] if body else ''} {extra} {_DOC_END} "
+                           for title, body, extra in chunk)
+            if text.count(_DOC_END) != len(chunk):
+                return None
+            tokens = normalize(text).split()
+            codes = np.fromiter(map(buckets.get, tokens, repeat(_UNSEEN)), dtype=np.int64, count=len(tokens))
+            for position in np.flatnonzero(codes == _UNSEEN).tolist():
+                token = tokens[position]
+                if token not in buckets:
+                    buckets[token] = self._token_bucket(token)
+                codes[position] = buckets[token]
+            ends = codes == _DOC_END_CODE
+            rows = np.cumsum(ends) - ends + start
+            kept = codes >= 0
+            keys.append(rows[kept] * self.dim + codes[kept])
+
+        pairs, first, tf = np.unique(np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64),
+                                     return_index=True, return_counts=True)
+        # Buckets in order of first appearance within each row, as the dicts
+        # kept them, so the per-row sums downstream add up in the same order
+        order = np.argsort(first)
+        pairs, tf = pairs[order], tf[order]
+        indptr = np.zeros(len(docs) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(pairs // self.dim, minlength=len(docs)))
+        return indptr, pairs % self.dim, tf.astype(np.float64)
+
+    def _token_bucket(self, token: str) -> int:
+        if token == _DOC_END:
+            return _DOC_END_CODE
+        if len(token) < 3 or token in STOPWORDS or token.isdigit():
+            return _SKIPPED
+        # crc32 rather than hash(): buckets must survive a restart
+        return zlib.crc32(token.encode()) & (self.dim - 1)
+
+    def _bucket_counts(self, doc: Tuple[str, str, str]) -> Dict[int, int]:
+        title, body, extra = doc
+        counts: Dict[int, int] = {}
+        text = f"{title} {body[:BODY_CHARS] if body else ''} {extra}"
+        for token in text.lower().translate(_PUNCTUATION).split():
+            if len(token) < 3 or token in STOPWORDS or token.isdigit():
+                continue
+            bucket = self._buckets.get(token)
+            if bucket is None:
+                if len(self._buckets) > MAX_CACHED_TOKENS:
+                    self._buckets.clear()
+                # crc32 rather than hash(): buckets must survive a restart
+                bucket = self._buckets[token] = zlib.crc32(token.encode()) & (self.dim - 1)
+            counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def _learn_terms(self, docs: List[Tuple[str, str, str]]) -> Dict[int, str]:
+        # Most frequent token per bucket, used to label clusters
+        frequency: Dict[str, int] = {}
+        for title, body, extra in docs:
+            for token in f"{title} {body[:BODY_CHARS]} {extra}".lower().translate(_PUNCTUATION).split():
+                if len(token) >= 3 and token not in STOPWORDS and not token.isdigit():
+                    frequency[token] = frequency.get(token, 0) + 1
+        terms: Dict[int, Tuple[int, str]] = {}
+        for token, count in frequency.items():
+            bucket = zlib.crc32(token.encode()) & (self.dim - 1)
+            if bucket not in terms or terms[bucket][0] < count:
+                terms[bucket] = (count, token)
+        return {bucket: token for bucket, (_, token) in terms.items()}
+
+    def _observe(self, counts: Rows):
+        # A bucket appears at most once per row, so this counts documents
+        indptr, indices, _ = counts
+        self.df += np.bincount(indices, minlength=self.dim)
+        self.docs += len(indptr) - 1
+
+    def _transform(self, counts: Rows, df: Optional["np.ndarray"] = None, docs: Optional[int] = None) -> Rows:
+        df = self.df if df is None else df
+        docs = self.docs if docs is None else docs
+        indptr, indices, tf = counts
+        data = (1 + np.log(tf)) * (np.log((1 + docs) / (1 + df[indices])) + 1)
+
+        # L2-normalize each row
+        lengths = np.diff(indptr)
+        nonempty = np.flatnonzero(lengths)
+        norms = np.ones(len(lengths))
+        if len(nonempty):
+            norms[nonempty] = np.sqrt(np.add.reduceat(data * data, indptr[nonempty]))
+        data = (data / np.repeat(norms, lengths)).astype(np.float32)
+        return indptr, indices, data
+
+    # Sparse x dense helpers
+
+    def _similarities(self, centroids: "np.ndarray", rows: Rows) -> "np.ndarray":
+        indptr, indices, data = rows
+        count = len(indptr) - 1
+        similarities = np.zeros((len(centroids), count), dtype=np.float32)
+        for start in range(0, count, SIMILARITY_CHUNK):
+            stop = min(start + SIMILARITY_CHUNK, count)
+            lengths = np.diff(indptr[start:stop + 1])
+            nonempty = np.flatnonzero(lengths)
+            if not len(nonempty):
+                continue
+            low, high = indptr[start], indptr[stop]
+            products = centroids[:, indices[low:high]] * data[low:high]
+            similarities[:, start + nonempty] = np.add.reduceat(products, indptr[start + nonempty] - low, axis=1)
+        return similarities
+
+    def _nearest(self, centroids: "np.ndarray", rows: Rows) -> Tuple["np.ndarray", "np.ndarray"]:
+        similarities = self._similarities(centroids, rows)
+        labels = similarities.argmax(axis=0)
+        return labels, similarities[labels, np.arange(similarities.shape[1])]
+
+    def _update(self, centroids: "np.ndarray", counts: "np.ndarray", rows: Rows, labels: "np.ndarray"):
+        # Mini-batch k-means step: each centroid moves towards the mean of
+        # its batch members with a learning rate of batch size / all members
+        indptr, indices, data = rows
+        k = len(centroids)
+        members = np.bincount(labels, minlength=k)
+        touched = np.flatnonzero(members)
+        counts[touched] += members[touched]
+        row_labels = np.repeat(labels, np.diff(indptr))
+        for cluster in touched.tolist():
+            mask = row_labels == cluster
+            sums = np.bincount(indices[mask], weights=data[mask], minlength=self.dim)
+            rate = members[cluster] / counts[cluster]
+            centroid = centroids[cluster] * (1 - rate) + sums / counts[cluster]
+            norm = math.sqrt(float(centroid @ centroid))
+            centroids[cluster] = centroid / norm if norm > 0 else centroid
+
+    def _take(self, rows: Rows, selected: "np.ndarray") -> Rows:
+        indptr, indices, data = rows
+        starts, stops = indptr[selected], indptr[selected + 1]
+        lengths = stops - starts
+        new_indptr = np.zeros(len(selected) + 1, dtype=np.int64)
+        new_indptr[1:] = np.cumsum(lengths)
+        positions = np.repeat(starts - new_indptr[:-1], lengths) + np.arange(new_indptr[-1])
+        return new_indptr, indices[positions], data[positions]
+
+    def _dense(self, rows: Rows, row: int) -> "np.ndarray":
+        indptr, indices, data = rows
+        vector = np.zeros(self.dim, dtype=np.float32)
+        vector[indices[indptr[row]:indptr[row + 1]]] = data[indptr[row]:indptr[row + 1]]
+        return vector
+
+    # Persistence and reporting
+
+    def label_terms(self, index: int, count: int = 5) -> List[str]:
+        top = np.argsort(self.centroids[index])[::-1][:count * 2]
+        return [self.terms[bucket] for bucket in top.tolist()
+                if bucket in self.terms and self.centroids[index, bucket] > 0][:count]
+
+    def _store_clusters(self, db, sizes: "np.ndarray"):
+        existing = {cluster.id: cluster for cluster in db.query(TopicCluster).all()}
+        current = set()
+        for index, cluster_id in enumerate(self.ids):
+            terms = self.label_terms(index)
+            cluster = existing.get(cluster_id)
+            if cluster is None:
+                cluster = TopicCluster(id=cluster_id)
+                db.add(cluster)
+            cluster.terms = terms
+            cluster.label = " / ".join(terms[:LABEL_TERMS]) or self.key(cluster_id)
+            cluster.size = int(sizes[index])
+            current.add(cluster_id)
+        # Clusters that did not survive the re-fit keep their row (and label)
+        # for content already tagged with them
+        for cluster_id, cluster in existing.items():
+            if cluster_id not in current:
+                cluster.size = 0
+
+    def save(self, path: str):
+        with self._lock:
+            temporary = f"{path}.tmp"
+            with open(temporary, "wb") as handle:
+                np.savez(
+                    handle,
+                    centroids=self.centroids,
+                    ids=np.array(self.ids, dtype=np.int64),
+                    counts=self.counts,
+                    df=self.df,
+                    docs=np.array(self.docs),
+                    next_id=np.array(self.next_id),
+                    terms=np.array(json.dumps(self.terms))
+                )
+            os.replace(temporary, path)
+
+    def load(self, path: str):
+        try:
+            with np.load(path) as model:
+                if model["centroids"].shape[1] != self.dim:
+                    logger.warning(f"Ignoring topic model at {path}: built for a different hash size")
+                    return
+                self.centroids = model["centroids"].astype(np.float32)
+                self.ids = model["ids"].tolist()
+                self.counts = model["counts"]
+                self.df = model["df"]
+                self.docs = int(model["docs"])
+                self.next_id = int(model["next_id"])
+                self.terms = {int(bucket): term for bucket, term in json.loads(str(model["terms"])).items()}
+            logger.info(f"Loaded {len(self.ids)} topic clusters from {path}")
+        except Exception as e:
+            logger.warning(f"Could not load topic model from {path}: {str(e)}")
+
+    def status(self) -> Dict:
+        return {
+            "fitted": self.fitted,
+            "clusters": len(self.ids),
+            "documents_seen": self.docs,
+            "refit_interval_seconds": self.refit_seconds,
+            "last_refit": self.last_refit
+        }
+
+_clusterer: Optional[TopicClusterer] = None
+_clusterer_lock = threading.Lock()
+
+def get_topic_clusterer() -> Optional[TopicClusterer]:
+    # None when clustering is switched off (TOPIC_CLUSTERS=0) or numpy is
+    # missing; callers then keep the keyword topics
+    global _clusterer
+    if np is None or CLUSTER_COUNT <= 0:
+        return None
+    with _clusterer_lock:
+        if _clusterer is None:
+            _clusterer = TopicClusterer()
+        return _clusterer
+
+def apply_topic_clusters(docs: List[Tuple[str, str, str]], enriched: List[Dict]) -> List[Dict]:
+    # Replaces the keyword topic of each enrichment result with its cluster
+    # wherever the item is close enough to one
+    clusterer = get_topic_clusterer()
+    if clusterer is None:
+        return enriched
+    for result, topic in zip(enriched, clusterer.assign_batch(docs)):
+        if topic is not None:
+            result["topic"] = topic
+    return enriched
@@ -1,27 +1,221 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from models import TrendingContent, ViralityPattern
-from typing import List, Dict, Optional
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import asc, case, desc, distinct, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+from models import TopicCluster, TrendingContent, TrendTag, ViralityPattern
+from services.pagination import after_key, decode_cursor, encode_cursor, stored_value, through_key
+from services.storage import normalize_tag
+from services.write_queue import get_write_queue
+from typing import List, Dict, Optional, Tuple
 import logging
-from collections import Counter
+import os
 import re
+from datetime import datetime, timedelta
+from functools import partial
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sort options for /trends; each leads one of the sort indexes
+TREND_SORTS = {
+    "virality_score": TrendingContent.virality_score,
+    "engagement_rate": TrendingContent.engagement_rate,
+    "score": TrendingContent.score,
+    "created_at": TrendingContent.created_at,
+}
+# Sorts with a topic-led index too; a topic with another sort is checked
+# per row while walking the sort column's index
+TOPIC_SORTS = ("virality_score", "engagement_rate")
+
+# Keys of each item; ?fields= picks a subset (services/fieldsets.py)
+TREND_FIELDS = ("id", "platform", "title", "description", "url", "author", "score", "comments_count",
+                "engagement_rate", "virality_score", "tags", "sentiment", "sentiment_score", "topic_cluster",
+                "story_id", "best_rank", "best_rank_region", "created_at", "fetched_at")
+
+# A tag on fewer items than this drives the query from trend_tags; a more
+# common one is checked row by row while walking the sort index
+TAG_DRIVE_ROWS = int(os.getenv("TREND_TAG_DRIVE_ROWS", "10000"))
+
+class _unindexed(ColumnElement):
+    # The column, marked on SQLite (unary +) so the planner does not use an
+    # index on it; other databases get the plain column
+    inherit_cache = True
+    _traverse_internals = [("column", InternalTraversal.dp_clauseelement)]
+    
+    def __init__(self, column):
+        self.column = column
+        self.type = column.type
+
+@compiles(_unindexed)
+def _compile_unindexed(element, compiler, **kw):
+    return compiler.process(element.column, **kw)
+
+@compiles(_unindexed, "sqlite")
+def _compile_unindexed_sqlite(element, compiler, **kw):
+    return "+" + compiler.process(element.column, **kw)
+
 class TrendAnalyzer:
     def __init__(self):
         self.viral_threshold = 70.0  # Virality score threshold
     
-    def get_trending_content(self, db: Session, limit: int = 50, platform: Optional[str] = None) -> List[Dict]:
-        query = db.query(TrendingContent).order_by(desc(TrendingContent.virality_score))
-        
+    def get_trending_content(self, db: Session, limit: int = 50, platform: Optional[str] = None,
+                             one_per_story: bool = False, cursor: Optional[str] = None,
+                             fields: Optional[Tuple[str, ...]] = None, **filters) -> List[Dict]:
+        # filters: topic, sentiment, tags, min_virality, max_virality, since,
+        # until, author, sort and order (see _trending_query). cursor comes
+        # from next_cursor over the previous page; fields from parse_fields.
+        build = partial(self._trending_query, platform, tag_rows=self._tag_rows(db, filters.get("tags")), **filters)
+        if one_per_story:
+            return self._get_trending_stories(db, limit, build, cursor, fields)
+        
+        trending = db.scalars(build(cursor=cursor).options(*self._load_fields(fields)).limit(limit)).all()
+        
+        return [self._content_to_dict(content, fields) for content in trending]
+    
+    async def get_trending_content_async(self, db: AsyncSession, limit: int = 50, platform: Optional[str] = None,
+                                         one_per_story: bool = False, cursor: Optional[str] = None,
+                                         fields: Optional[Tuple[str, ...]] = None, **filters) -> List[Dict]:
+        tag_rows = await db.run_sync(self._tag_rows, filters.get("tags"))
+        build = partial(self._trending_query, platform, tag_rows=tag_rows, **filters)
+        if one_per_story:
+            return await db.run_sync(self._get_trending_stories, limit, build, cursor, fields)
+        
+        query = build(cursor=cursor).options(*self._load_fields(fields)).limit(limit)
+        trending = (await db.scalars(query)).all()
+        
+        return [self._content_to_dict(content, fields) for content in trending]
+    
+    def _load_fields(self, fields: Optional[Tuple[str, ...]], *needed: str) -> Tuple:
+        # Only the columns a fieldset names are read; descriptions are most
+        # of each row
+        if fields is None:
+            return ()
+        names = (set(fields) | set(needed)) - {"story_size"}
+        return (load_only(*(getattr(TrendingContent, name) for name in sorted(names))),)
+    
+    def _trending_query(self, platform: Optional[str] = None, topic: Optional[str] = None,
+                        sentiment: Optional[str] = None, tags: Optional[List[str]] = None,
+                        min_virality: Optional[float] = None, max_virality: Optional[float] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        author: Optional[str] = None, sort: str = "virality_score", order: str = "desc",
+                        tag_rows: Optional[Dict[str, int]] = None, cursor: Optional[str] = None,
+                        through: Optional[str] = None, stories: Optional[List[int]] = None):
+        # Each combination is served by one index, picked here rather than
+        # left to the planner: the author index when an author is given, a
+        # rare tag's trend_tags rows, the topic-led index for the sort column
+        # when a topic is given and TOPIC_SORTS has one, otherwise the index
+        # the sort column leads.
+        # The other filters are checked inside that index. SQLite, which
+        # keeps no statistics, is kept off the others with _unindexed.
+        # Rows come after cursor, or up to and including through; stories
+        # restricts them to those story ids, looked up by story_id.
+        if sort not in TREND_SORTS:
+            raise ValueError(f"Unsupported sort: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unsupported order: {order}")
+        
+        tag_rows = tag_rows or {}
+        tags = sorted({normalize_tag(tag) for tag in tags or []} - {""}, key=lambda tag: tag_rows.get(tag, 0))
+        driving_tag = None
+        if tags and not author and stories is None and tag_rows.get(tags[0], 0) < TAG_DRIVE_ROWS:
+            driving_tag = tags[0]
+        
+        def term(name: str, leads: bool):
+            column = TrendingContent.__table__.c[name]
+            return column if leads else _unindexed(column)
+        
+        conditions = []
+        if stories is not None:
+            conditions.append(TrendingContent.story_id.in_(stories))
         if platform:
-            query = query.filter(TrendingContent.platform == platform)
-        
-        trending = query.limit(limit).all()
-        
-        return [self._content_to_dict(content) for content in trending]
+            conditions.append(TrendingContent.platform == platform)
+        if sentiment:
+            conditions.append(TrendingContent.sentiment == sentiment)
+        if author:
+            conditions.append(term("author", stories is None) == author)
+        in_sort_order = not author and not driving_tag and stories is None
+        if topic:
+            conditions.append(term("topic_cluster", in_sort_order and sort in TOPIC_SORTS) == topic)
+        if min_virality is not None:
+            conditions.append(term("virality_score", in_sort_order and sort == "virality_score") >= min_virality)
+        if max_virality is not None:
+            conditions.append(term("virality_score", in_sort_order and sort == "virality_score") <= max_virality)
+        if since is not None:
+            conditions.append(term("created_at", in_sort_order and sort == "created_at") >= stored_value(since))
+        if until is not None:
+            conditions.append(term("created_at", in_sort_order and sort == "created_at") < stored_value(until))
+        for tag in tags:
+            if tag == driving_tag:
+                conditions.append(TrendingContent.id.in_(select(TrendTag.trend_id).where(TrendTag.tag == tag)))
+            else:
+                # Common tags are checked per row against the (tag, trend_id) key
+                conditions.append(select(TrendTag.trend_id).where(
+                    TrendTag.tag == tag, TrendTag.trend_id == TrendingContent.id
+                ).exists())
+        for key, bound in ((after_key, cursor), (through_key, through)):
+            if bound is not None:
+                value, row_id = decode_cursor(bound, sort, order)
+                conditions.append(key(term(sort, in_sort_order), term("id", in_sort_order), order, value, row_id))
+        
+        direction = desc if order == "desc" else asc
+        return select(TrendingContent).where(*conditions).order_by(
+            direction(TREND_SORTS[sort]), direction(TrendingContent.id)
+        )
+    
+    def _tag_rows(self, db: Session, tags: Optional[List[str]]) -> Dict[str, int]:
+        # How many items carry each tag, counted up to TAG_DRIVE_ROWS
+        rows = {}
+        for tag in {normalize_tag(tag) for tag in tags or []} - {""}:
+            matching = select(TrendTag.trend_id).where(TrendTag.tag == tag).limit(TAG_DRIVE_ROWS).subquery()
+            rows[tag] = db.execute(select(func.count()).select_from(matching)).scalar()
+        return rows
+    
+    def _get_trending_stories(self, db: Session, limit: int, build, cursor: Optional[str] = None,
+                              fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+        # Walks items in sort order, a keyset page at a time, and keeps the
+        # first of each story, so only the top of the index is read; items
+        # without a story id are stories of their own. After a cursor,
+        # stories with an item up to it were served on an earlier page.
+        # Story sizes count items matching the same filters.
+        sort = build.keywords.get("sort", "virality_score")
+        order = build.keywords.get("order", "desc")
+        leaders = []
+        seen = set()
+        page = max(limit * 4, 100)
+        position = cursor
+        load = self._load_fields(fields, "story_id", sort)
+        while len(leaders) < limit:
+            batch = db.scalars(build(cursor=position).options(*load).limit(page)).all()
+            if cursor is not None:
+                fresh = list({content.story_id for content in batch if content.story_id is not None} - seen)
+                if fresh:
+                    served = build(through=cursor, stories=fresh)
+                    seen.update(db.scalars(served.with_only_columns(TrendingContent.story_id).order_by(None)))
+            for content in batch:
+                story = content.story_id if content.story_id is not None else -content.id
+                if story not in seen:
+                    seen.add(story)
+                    leaders.append(content)
+                    if len(leaders) == limit:
+                        break
+            if len(batch) < page:
+                break
+            position = encode_cursor(sort, order, getattr(batch[-1], sort), batch[-1].id)
+        
+        story_ids = [content.story_id for content in leaders if content.story_id is not None]
+        sizes = {}
+        if story_ids:
+            counts = build(stories=story_ids).with_only_columns(
+                TrendingContent.story_id, func.count(TrendingContent.id)
+            ).group_by(TrendingContent.story_id).order_by(None)
+            sizes = dict(db.execute(counts).all())
+        
+        return [
+            {**self._content_to_dict(content, fields), "story_size": sizes.get(content.story_id, 1)}
+            for content in leaders
+        ]
     
     def analyze_viral_patterns(self, db: Session, min_virality_score: float = 70.0) -> Dict:
         viral_content = db.query(TrendingContent).filter(
@@ -36,12 +230,12 @@ class TrendAnalyzer:
             "timing_patterns": self._analyze_timing(viral_content),
             "emotion_patterns": self._analyze_emotions(viral_content),
             "format_patterns": self._analyze_formats(viral_content),
-            "topic_trends": self._analyze_topic_trends(viral_content),
+            "topic_trends": self._analyze_topic_trends(viral_content, self._topic_labels(db)),
             "platform_insights": self._analyze_platform_performance(viral_content)
         }
         
         # Store patterns in database
-        self._store_patterns(db, patterns)
+        self._store_patterns(patterns)
         
         return {
             "total_viral_content": len(viral_content),
@@ -50,25 +244,62 @@ class TrendAnalyzer:
         }
     
     def get_virality_analytics(self, db: Session, days: int = 7) -> Dict:
-        from datetime import datetime, timedelta
-        
+        queries = self._virality_analytics_queries(days)
+        return self._virality_analytics_from({name: db.execute(query).all() for name, query in queries.items()})
+    
+    async def get_virality_analytics_async(self, db: AsyncSession, days: int = 7) -> Dict:
+        rows = {}
+        for name, query in self._virality_analytics_queries(days).items():
+            rows[name] = (await db.execute(query)).all()
+        return self._virality_analytics_from(rows)
+    
+    def _virality_analytics_queries(self, days: int) -> Dict:
+        # Aggregated in the database over the created_at index; the recent
+        # rows themselves are never loaded
         cutoff_date = datetime.now() - timedelta(days=days)
+        recent = TrendingContent.created_at >= cutoff_date
+        count = func.count(TrendingContent.id)
         
-        recent_content = db.query(TrendingContent).filter(
-            TrendingContent.created_at >= cutoff_date
-        ).all()
+        return {
+            "totals": select(
+                count,
+                func.count(distinct(TrendingContent.story_id)),
+                func.sum(case((TrendingContent.story_id.is_(None), 1), else_=0)),
+                func.avg(TrendingContent.virality_score),
+                func.sum(case((TrendingContent.virality_score >= self.viral_threshold, 1), else_=0)),
+                func.avg(TrendingContent.engagement_rate),
+                func.max(TrendingContent.engagement_rate),
+                func.min(TrendingContent.engagement_rate)
+            ).where(recent),
+            "platforms": select(TrendingContent.platform, count).where(recent).group_by(TrendingContent.platform),
+            "topics": select(TrendingContent.topic_cluster, count).where(recent)
+                .group_by(TrendingContent.topic_cluster).order_by(desc(count)).limit(10),
+            "sentiments": select(TrendingContent.sentiment, count).where(recent).group_by(TrendingContent.sentiment),
+            "labels": select(TopicCluster.id, TopicCluster.label)
+        }
+    
+    def _virality_analytics_from(self, rows: Dict) -> Dict:
+        total, stories, unassigned, avg_virality, viral, avg_engagement, max_engagement, min_engagement = rows["totals"][0]
         
-        if not recent_content:
+        if not total:
             return {"message": "No recent content found"}
         
+        # Items without a story id are stories of their own
+        labels = {f"cluster-{cluster_id}": label for cluster_id, label in rows["labels"]}
         analytics = {
-            "total_content": len(recent_content),
-            "avg_virality_score": sum(c.virality_score for c in recent_content) / len(recent_content),
-            "viral_content_count": len([c for c in recent_content if c.virality_score >= self.viral_threshold]),
-            "platform_breakdown": self._get_platform_breakdown(recent_content),
-            "top_topics": self._get_top_topics(recent_content),
-            "engagement_trends": self._get_engagement_trends(recent_content),
-            "sentiment_distribution": self._get_sentiment_distribution(recent_content)
+            "total_content": total,
+            "total_stories": stories + unassigned,
+            "avg_virality_score": float(avg_virality),
+            "viral_content_count": viral,
+            "platform_breakdown": dict(rows["platforms"]),
+            "top_topics": [{"topic": topic, "label": labels.get(topic, topic), "count": count}
+                           for topic, count in rows["topics"]],
+            "engagement_trends": {
+                "avg_engagement": float(avg_engagement),
+                "max_engagement": max_engagement,
+                "min_engagement": min_engagement
+            },
+            "sentiment_distribution": dict(rows["sentiments"])
         }
         
         return analytics
@@ -198,13 +429,19 @@ class TrendAnalyzer:
         
         return platform_formats
     
-    def _analyze_topic_trends(self, content: List[TrendingContent]) -> Dict:
+    def _topic_labels(self, db: Session) -> Dict[str, str]:
+        # Learned clusters are stored as "cluster-<id>"; keyword topics are
+        # their own label
+        return {f"cluster-{cluster.id}": cluster.label for cluster in db.query(TopicCluster).all()}
+    
+    def _analyze_topic_trends(self, content: List[TrendingContent], labels: Dict[str, str]) -> Dict:
         topic_performance = {}
         
         for item in content:
             topic = item.topic_cluster
             if topic not in topic_performance:
                 topic_performance[topic] = {
+                    "label": labels.get(topic, topic),
                     "count": 0,
                     "total_score": 0,
                     "avg_engagement": 0
@@ -259,44 +496,13 @@ class TrendAnalyzer:
         
         return platform_stats
     
-    def _content_to_dict(self, content: TrendingContent) -> Dict:
-        return {
-            "id": content.id,
-            "platform": content.platform,
-            "title": content.title,
-            "description": content.description,
-            "url": content.url,
-            "author": content.author,
-            "score": content.score,
-            "comments_count": content.comments_count,
-            "engagement_rate": content.engagement_rate,
-            "virality_score": content.virality_score,
-            "tags": content.tags,
-            "sentiment": content.sentiment,
-            "topic_cluster": content.topic_cluster,
-            "created_at": content.created_at.isoformat(),
-            "fetched_at": content.fetched_at.isoformat()
-        }
-    
-    def _get_platform_breakdown(self, content: List[TrendingContent]) -> Dict:
-        platform_count = Counter([c.platform for c in content])
-        return dict(platform_count)
-    
-    def _get_top_topics(self, content: List[TrendingContent]) -> List[Dict]:
-        topic_count = Counter([c.topic_cluster for c in content])
-        return [{"topic": topic, "count": count} for topic, count in topic_count.most_common(10)]
-    
-    def _get_engagement_trends(self, content: List[TrendingContent]) -> Dict:
-        engagement_rates = [c.engagement_rate for c in content]
-        return {
-            "avg_engagement": sum(engagement_rates) / len(engagement_rates),
-            "max_engagement": max(engagement_rates),
-            "min_engagement": min(engagement_rates)
-        }
-    
-    def _get_sentiment_distribution(self, content: List[TrendingContent]) -> Dict:
-        sentiment_count = Counter([c.sentiment for c in content])
-        return dict(sentiment_count)
+    def _content_to_dict(self, content: TrendingContent, fields: Optional[Tuple[str, ...]] = None) -> Dict:
+        # Only the fieldset's attributes are touched; the others were not loaded
+        item = {name: getattr(content, name) for name in fields or TREND_FIELDS if name != "story_size"}
+        for name in ("created_at", "fetched_at"):
+            if name in item:
+                item[name] = item[name].isoformat()
+        return item
     
     def _get_recommendation_reason(self, content: TrendingContent, content_type: str) -> str:
         reasons = []
@@ -340,17 +546,17 @@ class TrendAnalyzer:
         insights = []
         
         if sorted_topics:
-            top_topic = sorted_topics[0][0]
+            top_topic = sorted_topics[0][1]["label"]
             insights.append(f"'{top_topic}' is the highest performing topic cluster")
         
         if len(sorted_topics) >= 3:
-            trending = [topic[0] for topic in sorted_topics[:3]]
+            trending = [str(topic[1]["label"]) for topic in sorted_topics[:3]]
             insights.append(f"Trending topics: {', '.join(trending)}")
         
         return insights
     
-    def _store_patterns(self, db: Session, patterns: Dict):
-        try:
+    def _store_patterns(self, patterns: Dict):
+        def store(db: Session):
             for pattern_type, pattern_data in patterns.items():
                 viral_pattern = ViralityPattern(
                     pattern_type=pattern_type,
@@ -360,11 +566,11 @@ class TrendAnalyzer:
                     topic_clusters=list(patterns.get("topic_trends", {}).get("top_topics", []))
                 )
                 db.add(viral_pattern)
-            
-            db.commit()
+        
+        try:
+            get_write_queue().run(store)
             logger.info("Stored virality patterns in database")
         except Exception as e:
-            db.rollback()
             logger.error(f"Error storing patterns: {str(e)}")
     
     def _calculate_pattern_success_rate(self, pattern_data) -> float:
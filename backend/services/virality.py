@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import bindparam, update
+from database import ReadSessionLocal, session_scope
+from models import TrendingContent, ViralitySketch
+from services.storage import bump_data_version
+from services.write_queue import get_write_queue
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # services fall back to their per-platform formulas
+    np = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Raw features per platform, all rates per hour of age so both platforms
+# are measured the same way; virality is the weighted mean of their
+# percentiles within the platform (and topic, once it has enough history)
+FEATURES = {
+    "reddit": ("velocity", "comment_velocity", "discussion"),
+    "youtube": ("velocity", "comment_velocity", "engagement"),
+}
+WEIGHTS = (0.6, 0.25, 0.15)
+ALL_TOPICS = "*"
+# A topic's own sketch is used once it has seen this many items
+MIN_TOPIC_COUNT = float(os.getenv("VIRALITY_MIN_TOPIC_COUNT", "500"))
+# Older observations fade so percentiles follow the current stream
+HALF_LIFE_HOURS = float(os.getenv("VIRALITY_HALF_LIFE_HOURS", "168"))
+FLUSH_SECONDS = float(os.getenv("VIRALITY_FLUSH_SECONDS", "60"))
+# Items younger than this are scored as if this old
+MIN_AGE_HOURS = 1.0
+RESCORE_PAGE = 5000
+
+# Log-spaced bins with 1% relative accuracy between MIN_VALUE and
+# MAX_VALUE; bin 0 holds everything smaller, including zero
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_VALUE = 1e-4
+MAX_VALUE = 1e9
+BIN_COUNT = int(math.ceil(math.log(MAX_VALUE / MIN_VALUE) / math.log(GAMMA))) + 2
+
+class QuantileSketch:
+    # Mergeable log-binned histogram (as in DDSketch): constant size, O(1)
+    # updates and percentile ranks within RELATIVE_ACCURACY of the value
+    def __init__(self, counts: Optional["np.ndarray"] = None, decayed_at: Optional[float] = None):
+        self.counts = np.zeros(BIN_COUNT) if counts is None else counts.astype(np.float64)
+        self.decayed_at = decayed_at or time.time()
+
+    @property
+    def count(self) -> float:
+        return float(self.counts.sum())
+
+    @staticmethod
+    def bins(values: "np.ndarray") -> "np.ndarray":
+        safe = np.maximum(values, MIN_VALUE)
+        indexes = np.floor(np.log(safe / MIN_VALUE) / math.log(GAMMA)).astype(np.int64) + 1
+        indexes[values < MIN_VALUE] = 0
+        return np.minimum(indexes, BIN_COUNT - 1)
+
+    def decay(self, now: float):
+        elapsed = now - self.decayed_at
+        if elapsed > 0 and HALF_LIFE_HOURS > 0:
+            self.counts *= 0.5 ** (elapsed / 3600 / HALF_LIFE_HOURS)
+        self.decayed_at = now
+
+    def add(self, values: "np.ndarray", now: float):
+        self.decay(now)
+        self.counts += np.bincount(self.bins(values), minlength=BIN_COUNT)
+
+    def ranks(self, values: "np.ndarray") -> "np.ndarray":
+        # Share of observations below each value, counting its own bin half
+        total = self.counts.sum()
+        if total <= 0:
+            return np.full(len(values), 0.5)
+        indexes = self.bins(values)
+        below = np.cumsum(self.counts) - self.counts
+        return (below[indexes] + 0.5 * self.counts[indexes]) / total
+
+    def quantile(self, q: float) -> float:
+        total = self.counts.sum()
+        if total <= 0:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), q * total))
+        if index == 0:
+            return 0.0
+        # Midpoint of the bin, in the log sense
+        return MIN_VALUE * GAMMA ** (index - 0.5)
+
+def features(platform: str, scores: Sequence[float], comments: Sequence[float],
+             likes: Optional[Sequence[float]], ages_hours: Sequence[float]) -> "np.ndarray":
+    # scores are upvotes on Reddit and views on YouTube
+    scores = np.asarray(scores, dtype=np.float64)
+    comments = np.asarray(comments, dtype=np.float64)
+    ages = np.maximum(np.asarray(ages_hours, dtype=np.float64), MIN_AGE_HOURS)
+    columns = [scores / ages, comments / ages]
+    if platform == "youtube":
+        likes = np.asarray(likes, dtype=np.float64)
+        columns.append((likes + comments * 3) / np.maximum(scores, 1))
+    else:
+        columns.append(comments / np.maximum(scores, 1))
+    return np.column_stack(columns)
+
+class ViralityEngine:
+    def __init__(self):
+        self._sketches: Dict[Tuple[str, str, str], QuantileSketch] = {}
+        self._dirty = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def score(self, platform: str, scores: Sequence[float], comments: Sequence[float],
+              likes: Optional[Sequence[float]], ages_hours: Sequence[float],
+              topics: Sequence[Optional[str]], observe: Union[bool, Sequence[bool]] = True) -> List[float]:
+        # Feeds the page into the sketches, then ranks it against them; the
+        # cost depends on the page and the bin count, not on stored rows.
+        # observe can also flag rows one by one, so items already stored
+        # and observed on an earlier fetch are ranked without counting twice.
+        if not len(scores):
+            return []
+        values = features(platform, scores, comments, likes, ages_hours)
+        with self._lock:
+            self._load()
+            if isinstance(observe, bool):
+                if observe:
+                    self._observe(platform, values, topics, time.time())
+            else:
+                rows = np.flatnonzero(np.asarray(observe, dtype=bool))
+                if len(rows):
+                    self._observe(platform, values[rows], [topics[row] for row in rows.tolist()], time.time())
+            return self._rank(platform, values, topics).tolist()
+
+    def _observe(self, platform: str, values: "np.ndarray", topics: Sequence[Optional[str]], now: float):
+        groups = self._group(topics)
+        for column, feature in enumerate(FEATURES[platform]):
+            self._sketch(platform, ALL_TOPICS, feature).add(values[:, column], now)
+            self._dirty.add((platform, ALL_TOPICS, feature))
+            for topic, rows in groups.items():
+                self._sketch(platform, topic, feature).add(values[rows, column], now)
+                self._dirty.add((platform, topic, feature))
+
+    def _rank(self, platform: str, values: "np.ndarray", topics: Sequence[Optional[str]]) -> "np.ndarray":
+        groups = self._group(topics)
+        percentiles = np.zeros(values.shape)
+        for column, feature in enumerate(FEATURES[platform]):
+            percentiles[:, column] = self._sketch(platform, ALL_TOPICS, feature).ranks(values[:, column])
+            for topic, rows in groups.items():
+                sketch = self._sketches.get((platform, topic, feature))
+                if sketch is not None and sketch.count >= MIN_TOPIC_COUNT:
+                    percentiles[rows, column] = sketch.ranks(values[rows, column])
+        return np.round(percentiles @ np.array(WEIGHTS) * 100, 2)
+
+    @staticmethod
+    def _group(topics: Sequence[Optional[str]]) -> Dict[str, "np.ndarray"]:
+        groups: Dict[str, List[int]] = {}
+        for row, topic in enumerate(topics):
+            if topic:
+                groups.setdefault(topic, []).append(row)
+        return {topic: np.array(rows) for topic, rows in groups.items()}
+
+    def _sketch(self, platform: str, topic: str, feature: str) -> QuantileSketch:
+        key = (platform, topic, feature)
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            sketch = self._sketches[key] = QuantileSketch()
+        return sketch
+
+    # Persistence
+
+    def _load(self):
+        if self._loaded:
+            return
+        with session_scope(ReadSessionLocal) as db:
+            for row in db.query(ViralitySketch).all():
+                counts = np.frombuffer(row.counts, dtype=np.float32)
+                if len(counts) == BIN_COUNT:
+                    self._sketches[(row.platform, row.topic, row.feature)] = QuantileSketch(counts, row.decayed_at)
+            self._loaded = True
+
+    def flush(self) -> int:
+        with self._lock:
+            dirty = {key: self._sketches[key] for key in self._dirty}
+            payload = {key: (sketch.counts.astype(np.float32).tobytes(), sketch.decayed_at)
+                       for key, sketch in dirty.items()}
+            self._dirty.clear()
+        if not payload:
+            return 0
+
+        def store(db):
+            stored = {
+                (row.platform, row.topic, row.feature): row
+                for row in db.query(ViralitySketch).filter(
+                    ViralitySketch.platform.in_({platform for platform, _, _ in payload})
+                )
+            }
+            for (platform, topic, feature), (counts, decayed_at) in payload.items():
+                row = stored.get((platform, topic, feature))
+                if row is None:
+                    db.add(ViralitySketch(platform=platform, topic=topic, feature=feature,
+                                          counts=counts, decayed_at=decayed_at))
+                else:
+                    row.counts = counts
+                    row.decayed_at = decayed_at
+
+        try:
+            get_write_queue().run(store)
+            return len(payload)
+        except Exception:
+            with self._lock:
+                self._dirty.update(payload)
+            raise
+
+    def reset(self, platform: Optional[str] = None):
+        with self._lock:
+            self._load()
+            for key in list(self._sketches):
+                if platform is None or key[0] == platform:
+                    self._sketches[key] = QuantileSketch()
+                    self._dirty.add(key)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except Exception as e:
+                logger.error(f"Could not save virality sketches: {str(e)}")
+
+    def summary(self) -> Dict:
+        with self._lock:
+            self._load()
+            platforms = {}
+            for (platform, topic, feature), sketch in sorted(self._sketches.items()):
+                entry = platforms.setdefault(platform, {"features": {}, "topics": set()})
+                if topic == ALL_TOPICS:
+                    entry["features"][feature] = {
+                        "count": round(sketch.count, 1),
+                        "p50": sketch.quantile(0.5),
+                        "p90": sketch.quantile(0.9),
+                        "p99": sketch.quantile(0.99)
+                    }
+                elif sketch.count >= MIN_TOPIC_COUNT:
+                    entry["topics"].add(topic)
+            return {
+                platform: {"features": entry["features"], "topics_with_own_baseline": sorted(entry["topics"])}
+                for platform, entry in platforms.items()
+            }
+
+    # Bulk rescoring
+
+    def rescore(self, platform: Optional[str] = None, rebuild: bool = True, page: int = RESCORE_PAGE) -> Dict:
+        # Historical rows predate published_at; their age is taken as the
+        # time between first and last fetch, so they score as fresh items
+        # did at the time
+        started = time.perf_counter()
+        platforms = [platform] if platform else list(FEATURES)
+        if rebuild:
+            self.reset(platform)
+            for name in platforms:
+                for rows in self._pages(name, page):
+                    values = features(name, *self._row_inputs(name, rows))
+                    with self._lock:
+                        self._observe(name, values, [row.topic_cluster for row in rows], time.time())
+
+        rescored = 0
+        write_queue = get_write_queue()
+        for name in platforms:
+            for rows in self._pages(name, page):
+                scores = self.score(name, *self._row_inputs(name, rows),
+                                    [row.topic_cluster for row in rows], observe=False)
+                params = [{"row_id": row.id, "virality": score} for row, score in zip(rows, scores)]
+
+                def store(db, params=params):
+                    db.execute(
+                        update(TrendingContent.__table__)
+                        .where(TrendingContent.__table__.c.id == bindparam("row_id"))
+                        .values(virality_score=bindparam("virality")),
+                        params
+                    )
+                    bump_data_version(db, "trends")
+
+                write_queue.run(store)
+                rescored += len(rows)
+        self.flush()
+        return {"rescored": rescored, "platforms": platforms, "seconds": round(time.perf_counter() - started, 2)}
+
+    @staticmethod
+    def _pages(platform: str, size: int):
+        # Keyset pages, each on a short-lived session
+        last_id = 0
+        while True:
+            with session_scope(ReadSessionLocal) as db:
+                rows = db.query(
+                    TrendingContent.id, TrendingContent.score, TrendingContent.comments_count,
+                    TrendingContent.engagement_rate, TrendingContent.topic_cluster,
+                    TrendingContent.published_at, TrendingContent.created_at, TrendingContent.fetched_at
+                ).filter(
+                    TrendingContent.platform == platform, TrendingContent.id > last_id
+                ).order_by(TrendingContent.id).limit(size).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+
+    @staticmethod
+    def _row_inputs(platform: str, rows) -> Tuple[List[float], List[float], Optional[List[float]], List[float]]:
+        scores = [row.score or 0 for row in rows]
+        comments = [row.comments_count or 0 for row in rows]
+        likes = None
+        if platform == "youtube":
+            # Likes are not stored; engagement_rate is (likes + 2 * comments) / views
+            likes = [max((row.engagement_rate or 0) * (row.score or 0) / 100 - 2 * (row.comments_count or 0), 0)
+                     for row in rows]
+        ages = []
+        for row in rows:
+            start = _aware(row.published_at or row.created_at)
+            end = _aware(row.fetched_at or row.created_at)
+            ages.append((end - start).total_seconds() / 3600 if start and end else MIN_AGE_HOURS)
+        return scores, comments, likes, ages
+
+def _aware(moment: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands back server-side timestamps without a zone; they are UTC
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment
+
+_engine: Optional[ViralityEngine] = None
+_engine_lock = threading.Lock()
+
+def get_virality_engine() -> Optional[ViralityEngine]:
+    global _engine
+    if np is None:
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = ViralityEngine()
+        return _engine
+
+if __name__ == "__main__":
+    # python -m services.virality rescore [--platform reddit] [--keep-sketches]
+    parser = argparse.ArgumentParser(description="Virality scoring maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rescore = commands.add_parser("rescore", help="Recompute virality_score for stored rows")
+    rescore.add_argument("--platform", choices=sorted(FEATURES))
+    rescore.add_argument("--keep-sketches", action="store_true",
+                         help="Rank against the current sketches instead of rebuilding them from the rows")
+    rescore.add_argument("--page", type=int, default=RESCORE_PAGE)
+    args = parser.parse_args()
+
+    if np is None:
+        parser.error("numpy is required for virality scoring")
+    result = get_virality_engine().rescore(args.platform, rebuild=not args.keep_sketches, page=args.page)
+    logger.info(f"Rescored {result['rescored']} rows for {', '.join(result['platforms'])} in {result['seconds']}s")
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple, TypeVar
+from sqlalchemy.orm import Session
+from database import WAL_PROFILE, WriteSessionLocal
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Jobs are functions of a session that write without committing. With the
+# SQLite WAL profile they run one batch at a time on a single writer thread:
+# each job in its own savepoint, the batch in one commit, so concurrent
+# ingestion never contends for the database lock. Elsewhere (Postgres, or
+# SQLite without the profile) a job runs and commits in the calling thread.
+MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "64"))
+BATCH_WINDOW_SECONDS = float(os.getenv("WRITE_QUEUE_BATCH_WINDOW_MS", "5")) / 1000
+
+_STOP = object()
+
+class WriteQueue:
+    def __init__(self, serialized: bool = WAL_PROFILE, session_factory=WriteSessionLocal,
+                 max_batch: int = MAX_BATCH, batch_window: float = BATCH_WINDOW_SECONDS):
+        self.serialized = serialized
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {"jobs": 0, "failed": 0, "batches": 0, "commit_seconds": 0.0}
+
+    def submit(self, job: Callable[[Session], T]) -> "Future[T]":
+        future: Future = Future()
+        if not self.serialized:
+            try:
+                future.set_result(self._run_direct(job))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._ensure_thread()
+        self._queue.put((job, future))
+        return future
+
+    def run(self, job: Callable[[Session], T]) -> T:
+        # Blocks until the batch holding the job has committed
+        if not self.serialized:
+            return self._run_direct(job)
+        return self.submit(job).result()
+
+    async def run_async(self, job: Callable[[Session], T]) -> T:
+        if not self.serialized:
+            return await asyncio.get_running_loop().run_in_executor(None, self._run_direct, job)
+        return await asyncio.wrap_future(self.submit(job))
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def stop(self):
+        # Lets queued jobs finish before the writer thread exits
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    def _run_direct(self, job: Callable[[Session], T]) -> T:
+        db = self.session_factory()
+        try:
+            result = job(db)
+            db.commit()
+            self.stats["jobs"] += 1
+            return result
+        except Exception:
+            db.rollback()
+            self.stats["failed"] += 1
+            raise
+        finally:
+            db.close()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="signalscout-writer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            stopping = False
+            # Jobs arriving within the window share the commit
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+            if stopping:
+                return
+
+    def _write_batch(self, batch: List[Tuple[Callable, Future]]):
+        # Cancelled futures are dropped before anything runs
+        batch = [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+        outcomes = []
+        db = self.session_factory()
+        try:
+            for job, future in batch:
+                savepoint = db.begin_nested()
+                try:
+                    result = job(db)
+                    savepoint.commit()
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    savepoint.rollback()
+                    logger.warning(f"Write job {getattr(job, '__name__', job)} failed: {str(e)}")
+                    outcomes.append((future, None, e))
+            started = time.perf_counter()
+            db.commit()
+            self.stats["commit_seconds"] += time.perf_counter() - started
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Write batch of {len(batch)} jobs failed: {str(e)}")
+            outcomes = [(future, None, e) for _, future in batch]
+        finally:
+            db.close()
+
+        self.stats["batches"] += 1
+        for future, result, error in outcomes:
+            if error is None:
+                self.stats["jobs"] += 1
+                future.set_result(result)
+            else:
+                self.stats["failed"] += 1
+                future.set_exception(error)
+
+_write_queue: Optional[WriteQueue] = None
+_write_queue_lock = threading.Lock()
+
+def get_write_queue() -> WriteQueue:
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue()
+        return _write_queue
@@ -1,50 +1,103 @@
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
 import os
-from typing import List, Dict
-from models import TrendingContent
-from database import SessionLocal
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from database import ReadSessionLocal, session_scope
+from services.storage import bulk_upsert_trending_content, existing_content_topics
+from services.snapshot_store import maybe_compact
+from services.job_registry import IngestionJob, track_stage
+from services.api_replay import get_transport
+from services.enrichment import get_enricher, vectorized_available
+from services.topic_clustering import apply_topic_clusters
+from services.story_index import apply_story_ids
+from services.virality import get_virality_engine
+from services.write_queue import get_write_queue
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+try:
+    import numpy as np
+except ImportError:  # metrics fall back to the per-item formulas
+    np = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Largest page size videos().list and search().list accept, and the most ids
+# one videos().list(id=...) call can look up
+MAX_RESULTS_PER_PAGE = 50
+
+DEFAULT_TRENDING_REGIONS = ["US"]
+
+# Region charts are fetched all at once: every region gets a thread, up to
+# this many. Quota is charged per call (one unit per page), so running them
+# together costs no more than running them in turn.
+MAX_HARVEST_CONCURRENCY = int(os.getenv("YOUTUBE_HARVEST_CONCURRENCY", "64"))
+
 class YouTubeService:
-    def __init__(self):
-        self.youtube = build('youtube', 'v3', developerKey=os.getenv("YOUTUBE_API_KEY"))
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self._youtube = None
+        self._client_lock = threading.Lock()
+        self.max_concurrency = max_concurrency or int(os.getenv("YOUTUBE_FETCH_CONCURRENCY", "8"))
+        self.trending_regions = [
+            region.strip().upper()
+            for region in os.getenv("YOUTUBE_TRENDING_REGIONS", ",".join(DEFAULT_TRENDING_REGIONS)).split(",")
+            if region.strip()
+        ]
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="youtube-fetch"
+        )
+        # Threads start only when a harvest needs them
+        self._harvest_executor = ThreadPoolExecutor(
+            max_workers=MAX_HARVEST_CONCURRENCY, thread_name_prefix="youtube-harvest"
+        )
+        self._local = threading.local()
+        self.enricher = get_enricher()
+    
+    @property
+    def youtube(self):
+        if self._youtube is None:
+            with self._client_lock:
+                if self._youtube is None:
+                    self._youtube = self._build_client()
+        return self._youtube
+    
+    def _build_client(self):
+        developer_key = os.getenv("YOUTUBE_API_KEY", None if get_transport().live else "replay")
+        document_path = os.getenv("YOUTUBE_DISCOVERY_DOCUMENT")
+        if document_path:
+            with open(document_path) as document:
+                return build_from_document(document.read(), developerKey=developer_key)
+        
+        # Use the discovery document bundled with google-api-python-client so
+        # building the client never goes to the network
+        return build('youtube', 'v3', developerKey=developer_key,
+                     static_discovery=True, cache_discovery=False)
+    
+    async def fetch_trending_videos(self, region_code: str = "US", limit: int = 50,
+                                    job: Optional[IngestionJob] = None) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._fetch_trending_videos_sync, region_code, limit, job
+        )
     
-    async def fetch_trending_videos(self, region_code: str = "US", limit: int = 50) -> List[Dict]:
+    def _fetch_trending_videos_sync(self, region_code: str, limit: int,
+                                    job: Optional[IngestionJob] = None) -> List[Dict]:
         try:
-            # Fetch trending videos
-            request = self.youtube.videos().list(
-                part="snippet,statistics",
-                chart="mostPopular",
-                regionCode=region_code,
-                maxResults=limit
-            )
-            response = request.execute()
-            
-            videos = []
-            for item in response.get('items', []):
-                video_data = {
-                    "platform": "youtube",
-                    "content_id": item['id'],
-                    "title": item['snippet']['title'],
-                    "description": item['snippet']['description'][:500],
-                    "url": f"https://www.youtube.com/watch?v={item['id']}",
-                    "author": item['snippet']['channelTitle'],
-                    "score": int(item['statistics'].get('viewCount', 0)),
-                    "comments_count": int(item['statistics'].get('commentCount', 0)),
-                    "engagement_rate": self._calculate_engagement_rate(item['statistics']),
-                    "virality_score": self._calculate_virality_score(item),
-                    "tags": item['snippet'].get('tags', [])[:10],  # Limit tags
-                    "sentiment": self._analyze_sentiment(item['snippet']['title']),
-                    "topic_cluster": self._categorize_topic(item['snippet'])
-                }
-                videos.append(video_data)
+            with track_stage(job, "fetch"):
+                items, _ = self._fetch_chart_pages(region_code, limit)
+            with track_stage(job, "enrich"):
+                videos = self._videos_to_dicts(items)
+                for rank, video_data in enumerate(videos, start=1):
+                    video_data["best_rank"] = rank
+                    video_data["best_rank_region"] = region_code.upper()
             
             # Store in database
-            self._store_trending_content(videos)
+            with track_stage(job, "store"):
+                self._store_trending_content(videos, job)
             logger.info(f"Fetched {len(videos)} trending YouTube videos")
             return videos
             
@@ -52,54 +105,201 @@ class YouTubeService:
             logger.error(f"Error fetching YouTube trends: {str(e)}")
             raise e
     
-    async def search_trending_by_keyword(self, keyword: str, days_back: int = 7, limit: int = 25) -> List[Dict]:
+    async def harvest_trending_regions(self, regions: Optional[List[str]] = None,
+                                       limit_per_region: int = 200,
+                                       job: Optional[IngestionJob] = None) -> Dict:
+        regions = list(dict.fromkeys(r.strip().upper() for r in (regions or self.trending_regions) if r.strip()))
+        loop = asyncio.get_running_loop()
+        
+        async def harvest_one(region: str) -> Dict:
+            started = time.perf_counter()
+            try:
+                items, api_calls = await loop.run_in_executor(
+                    self._harvest_executor, self._fetch_chart_pages, region, limit_per_region
+                )
+                return {"region": region, "items": items, "api_calls": api_calls, "error": None,
+                        "seconds": time.perf_counter() - started}
+            except Exception as e:
+                logger.error(f"Error fetching YouTube trends for {region}: {str(e)}")
+                if job is not None:
+                    job.add_error(f"{region}: {str(e)}")
+                return {"region": region, "items": [], "api_calls": None, "error": str(e),
+                        "seconds": time.perf_counter() - started}
+        
+        started = time.perf_counter()
+        with track_stage(job, "fetch"):
+            results = await asyncio.gather(*(harvest_one(region) for region in regions))
+        
+        with track_stage(job, "enrich"):
+            # Merge videos trending in several regions into one record carrying
+            # every region's chart position
+            merged = {}
+            for result in results:
+                for rank, item in enumerate(result["items"], start=1):
+                    entry = merged.get(item['id'])
+                    if entry is None:
+                        entry = merged[item['id']] = {"item": item, "region_ranks": {}}
+                    entry["region_ranks"].setdefault(result["region"], rank)
+            
+            # Off the event loop: enrichment and the stored-id lookup both block
+            videos = await loop.run_in_executor(
+                self._executor, self._videos_to_dicts, [entry["item"] for entry in merged.values()]
+            )
+            for video_data, entry in zip(videos, merged.values()):
+                video_data["region_ranks"] = entry["region_ranks"]
+                # Stored with the row; region_ranks only goes in the report
+                region, rank = min(entry["region_ranks"].items(), key=lambda pair: pair[1])
+                video_data["best_rank"] = rank
+                video_data["best_rank_region"] = region
+            videos.sort(key=lambda v: (v["best_rank"], -len(v["region_ranks"])))
+        
+        with track_stage(job, "store"):
+            await loop.run_in_executor(self._executor, self._store_trending_content, videos, job)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Harvested {len(videos)} unique trending videos from {len(regions)} regions in {elapsed:.2f}s")
+        
+        return {
+            "videos": videos,
+            "regions": [
+                {
+                    "region": r["region"],
+                    "videos": len(r["items"]),
+                    "api_calls": r["api_calls"],
+                    "error": r["error"],
+                    "seconds": round(r["seconds"], 3)
+                }
+                for r in results
+            ],
+            "unique_videos": len(videos),
+            "elapsed_seconds": round(elapsed, 3)
+        }
+    
+    def _fetch_chart_pages(self, region_code: str, limit: int) -> Tuple[List[Dict], int]:
+        # mostPopular already returns snippet and statistics, so walking the
+        # pages is the only cost: one call per 50 videos
+        items = []
+        api_calls = 0
+        page_token = None
+        while len(items) < limit:
+            api_calls += 1
+            response = self._execute(self.youtube.videos().list(
+                part="snippet,statistics",
+                chart="mostPopular",
+                regionCode=region_code,
+                maxResults=min(MAX_RESULTS_PER_PAGE, limit - len(items)),
+                pageToken=page_token
+            ))
+            items.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return items[:limit], api_calls
+    
+    def _fetch_videos_by_id(self, video_ids: List[str]) -> List[Dict]:
+        items = []
+        for start in range(0, len(video_ids), MAX_RESULTS_PER_PAGE):
+            response = self._execute(self.youtube.videos().list(
+                part="statistics,snippet",
+                id=','.join(video_ids[start:start + MAX_RESULTS_PER_PAGE]),
+                maxResults=MAX_RESULTS_PER_PAGE
+            ))
+            items.extend(response.get('items', []))
+        return items
+    
+    def _execute(self, request):
+        # httplib2.Http is not thread-safe, so each worker thread gets its own;
+        # record and replay modes hand out their stand-ins here
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = get_transport().youtube_http()
+        return request.execute(http=http)
+    
+    def _videos_to_dicts(self, items: List[Dict]) -> List[Dict]:
+        docs = [
+            (item['snippet']['title'], item['snippet'].get('description', ''),
+             " ".join(item['snippet'].get('tags', [])))
+            for item in items
+        ]
+        enriched = apply_story_ids(docs, apply_topic_clusters(docs, self.enricher.enrich_batch(docs)))
+        # Charts return the same videos fetch after fetch; only those not
+        # stored yet feed the virality sketches
+        known = {}
+        if items and get_virality_engine() is not None:
+            with session_scope(ReadSessionLocal) as db:
+                known = existing_content_topics(db, "youtube", [item['id'] for item in items])
+        engagement_rates, virality_scores = self._calculate_metrics(
+            items, [item["topic"] for item in enriched], [item['id'] not in known for item in items]
+        )
+        return [
+            self._video_to_dict(item, item_enriched, engagement_rate, virality_score)
+            for item, item_enriched, engagement_rate, virality_score
+            in zip(items, enriched, engagement_rates, virality_scores)
+        ]
+    
+    def _video_to_dict(self, item: Dict, enriched: Dict, engagement_rate: float,
+                       virality_score: float) -> Dict:
+        return {
+            "platform": "youtube",
+            "content_id": item['id'],
+            "title": item['snippet']['title'],
+            "description": item['snippet']['description'][:500],
+            "url": f"https://www.youtube.com/watch?v={item['id']}",
+            "author": item['snippet']['channelTitle'],
+            "score": int(item['statistics'].get('viewCount', 0)),
+            "comments_count": int(item['statistics'].get('commentCount', 0)),
+            "engagement_rate": engagement_rate,
+            "virality_score": virality_score,
+            "tags": item['snippet'].get('tags', [])[:10],  # Limit tags
+            "sentiment": enriched["sentiment"],
+            "sentiment_score": enriched["sentiment_score"],
+            "topic_cluster": enriched["topic"],
+            "story_id": enriched["story_id"],
+            "published_at": self._published_at(item)
+        }
+    
+    async def search_trending_by_keyword(self, keyword: str, days_back: int = 7, limit: int = 25,
+                                         job: Optional[IngestionJob] = None) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._search_trending_by_keyword_sync, keyword, days_back, limit, job
+        )
+    
+    def _search_trending_by_keyword_sync(self, keyword: str, days_back: int, limit: int,
+                                         job: Optional[IngestionJob] = None) -> List[Dict]:
         try:
             # Calculate date range
             published_after = (datetime.now() - timedelta(days=days_back)).isoformat() + "Z"
             
-            # Search for videos
-            search_request = self.youtube.search().list(
-                part="snippet",
-                q=keyword,
-                type="video",
-                order="relevance",
-                publishedAfter=published_after,
-                maxResults=limit
-            )
-            search_response = search_request.execute()
-            
-            # Get video statistics
-            video_ids = [item['id']['videoId'] for item in search_response.get('items', [])]
-            
-            if not video_ids:
-                return []
-            
-            stats_request = self.youtube.videos().list(
-                part="statistics,snippet",
-                id=','.join(video_ids)
-            )
-            stats_response = stats_request.execute()
+            with track_stage(job, "fetch"):
+                # Search for videos
+                video_ids = []
+                page_token = None
+                while len(video_ids) < limit:
+                    search_response = self._execute(self.youtube.search().list(
+                        part="snippet",
+                        q=keyword,
+                        type="video",
+                        order="relevance",
+                        publishedAfter=published_after,
+                        maxResults=min(MAX_RESULTS_PER_PAGE, limit - len(video_ids)),
+                        pageToken=page_token
+                    ))
+                    video_ids.extend(item['id']['videoId'] for item in search_response.get('items', []))
+                    page_token = search_response.get('nextPageToken')
+                    if not page_token:
+                        break
+                
+                if not video_ids:
+                    return []
+                
+                # Get video statistics, 50 ids per call
+                items = self._fetch_videos_by_id(video_ids[:limit])
             
-            videos = []
-            for item in stats_response.get('items', []):
-                video_data = {
-                    "platform": "youtube",
-                    "content_id": item['id'],
-                    "title": item['snippet']['title'],
-                    "description": item['snippet']['description'][:500],
-                    "url": f"https://www.youtube.com/watch?v={item['id']}",
-                    "author": item['snippet']['channelTitle'],
-                    "score": int(item['statistics'].get('viewCount', 0)),
-                    "comments_count": int(item['statistics'].get('commentCount', 0)),
-                    "engagement_rate": self._calculate_engagement_rate(item['statistics']),
-                    "virality_score": self._calculate_virality_score(item),
-                    "tags": item['snippet'].get('tags', [])[:10],
-                    "sentiment": self._analyze_sentiment(item['snippet']['title']),
-                    "topic_cluster": self._categorize_topic(item['snippet'])
-                }
-                videos.append(video_data)
+            with track_stage(job, "enrich"):
+                videos = self._videos_to_dicts(items)
             
-            self._store_trending_content(videos)
+            with track_stage(job, "store"):
+                self._store_trending_content(videos, job)
             logger.info(f"Fetched {len(videos)} videos for keyword: {keyword}")
             return videos
             
@@ -107,6 +307,40 @@ class YouTubeService:
             logger.error(f"Error searching YouTube by keyword: {str(e)}")
             raise e
     
+    def _calculate_metrics(self, items: List[Dict], topics: List[Optional[str]],
+                           new: List[bool]) -> Tuple[List[float], List[float]]:
+        engine = get_virality_engine()
+        if engine is None:
+            virality = [self._calculate_virality_score(item) for item in items]
+        else:
+            now = datetime.now(timezone.utc)
+            virality = engine.score(
+                "youtube",
+                [int(item['statistics'].get('viewCount', 0)) for item in items],
+                [int(item['statistics'].get('commentCount', 0)) for item in items],
+                [int(item['statistics'].get('likeCount', 0)) for item in items],
+                [(now - self._published_at(item)).total_seconds() / 3600 for item in items],
+                topics,
+                observe=new
+            )
+        
+        if not vectorized_available():
+            return [self._calculate_engagement_rate(item['statistics']) for item in items], virality
+        
+        # Same arithmetic as the scalar version below, in the same order
+        views = np.array([int(item['statistics'].get('viewCount', 0)) for item in items], dtype=np.float64)
+        likes = np.array([int(item['statistics'].get('likeCount', 0)) for item in items], dtype=np.float64)
+        comments = np.array([int(item['statistics'].get('commentCount', 0)) for item in items], dtype=np.float64)
+        
+        engagement = np.zeros(len(items))
+        np.divide(likes + (comments * 2), views, out=engagement, where=views != 0)
+        engagement = engagement * 100
+        return engagement.tolist(), virality
+    
+    @staticmethod
+    def _published_at(item: Dict) -> datetime:
+        return datetime.fromisoformat(item['snippet']['publishedAt'].replace('Z', '+00:00'))
+    
     def _calculate_engagement_rate(self, statistics: Dict) -> float:
         views = int(statistics.get('viewCount', 0))
         likes = int(statistics.get('likeCount', 0))
@@ -119,6 +353,7 @@ class YouTubeService:
         return (engagement / views) * 100
     
     def _calculate_virality_score(self, video_item: Dict) -> float:
+        # Fallback when numpy is missing: not comparable with Reddit scores
         stats = video_item['statistics']
         snippet = video_item['snippet']
         
@@ -142,62 +377,14 @@ class YouTubeService:
         
         return virality_score
     
-    def _analyze_sentiment(self, text: str) -> str:
-        positive_words = ["amazing", "incredible", "best", "awesome", "love", "great", "fantastic"]
-        negative_words = ["worst", "terrible", "bad", "awful", "hate", "horrible", "disaster"]
-        
-        text_lower = text.lower()
-        positive_count = sum(1 for word in positive_words if word in text_lower)
-        negative_count = sum(1 for word in negative_words if word in text_lower)
-        
-        if positive_count > negative_count:
-            return "positive"
-        elif negative_count > positive_count:
-            return "negative"
-        else:
-            return "neutral"
-    
-    def _categorize_topic(self, snippet: Dict) -> str:
-        title = snippet.get('title', '').lower()
-        description = snippet.get('description', '').lower()
-        tags = [tag.lower() for tag in snippet.get('tags', [])]
-        
-        content = f"{title} {description} {' '.join(tags)}"
-        
-        categories = {
-            "technology": ["tech", "ai", "software", "coding", "programming", "gadget"],
-            "business": ["business", "startup", "marketing", "entrepreneur", "money"],
-            "lifestyle": ["lifestyle", "health", "fitness", "beauty", "fashion", "food"],
-            "entertainment": ["entertainment", "movie", "music", "comedy", "funny", "celebrity"],
-            "education": ["tutorial", "how to", "learn", "education", "course", "guide"],
-            "gaming": ["gaming", "game", "gameplay", "review", "playthrough"],
-            "travel": ["travel", "vacation", "trip", "destination", "explore"],
-            "sports": ["sports", "football", "basketball", "soccer", "workout", "training"]
-        }
-        
-        for category, keywords in categories.items():
-            if any(keyword in content for keyword in keywords):
-                return category
-        
-        return "general"
-    
-    def _store_trending_content(self, videos: List[Dict]):
-        db = SessionLocal()
+    def _store_trending_content(self, videos: List[Dict], job: Optional[IngestionJob] = None):
         try:
-            for video_data in videos:
-                # Check if already exists
-                existing = db.query(TrendingContent).filter(
-                    TrendingContent.content_id == video_data["content_id"],
-                    TrendingContent.platform == "youtube"
-                ).first()
-                
-                if not existing:
-                    trending_content = TrendingContent(**video_data)
-                    db.add(trending_content)
-            
-            db.commit()
+            write_queue = get_write_queue()
+            write_queue.run(lambda db: bulk_upsert_trending_content(db, videos))
+            write_queue.submit(maybe_compact)
+            if job is not None:
+                job.add_items(fetched=len(videos), stored=len(videos))
         except Exception as e:
-            db.rollback()
             logger.error(f"Error storing trending content: {str(e)}")
-        finally:
-            db.close()
\ No newline at end of file
+            if job is not None:
+                job.add_error(f"Storing failed: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,51 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class StartupReport:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.boot_phases: List[Dict] = []
+        self.deferred_phases: List[Dict] = []
+        self._last_mark = self.started_at
+        self.ready = False
+
+    def mark(self, phase: str):
+        # Boot phases are measured back to back from the previous mark
+        now = time.perf_counter()
+        self.boot_phases.append({"phase": phase, "seconds": round(now - self._last_mark, 4)})
+        self._last_mark = now
+
+    @contextmanager
+    def deferred(self, phase: str):
+        # Work moved off the boot path (lazy clients) is still reported, so a
+        # slow first request can be traced to its cause
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.deferred_phases.append({"phase": phase, "seconds": round(elapsed, 4)})
+            logger.info(f"Deferred startup phase {phase} took {elapsed:.3f}s")
+
+    def finish(self):
+        self.ready = True
+        summary = ", ".join(f"{p['phase']}={p['seconds']:.3f}s" for p in self.boot_phases)
+        logger.info(f"Startup completed in {self.total_seconds():.3f}s ({summary})")
+
+    def total_seconds(self) -> float:
+        return sum(phase["seconds"] for phase in self.boot_phases)
+
+    def as_dict(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "boot_seconds": round(self.total_seconds(), 4),
+            "boot_phases": self.boot_phases,
+            "deferred_phases": self.deferred_phases
+        }
+
+startup_report = StartupReport()
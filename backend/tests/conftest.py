@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The app reads its settings at import time, so the scratch database and
+# the disabled model files are set before any test module imports it
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='signalscout-test-')}/test.db"
+os.environ["STORY_INDEX_PATH"] = ""
+os.environ["TOPIC_MODEL_PATH"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
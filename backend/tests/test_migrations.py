@@ -0,0 +1,38 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import TrendTag
+from services.migrations import LATEST_VERSION, current_version, run_migrations
+from services.trend_analyzer import TrendAnalyzer
+
+# trending_content as it was before the first migration
+PRE_SERIES_SCHEMA = """
+CREATE TABLE trending_content (
+    id INTEGER PRIMARY KEY, platform VARCHAR(50) NOT NULL, content_id VARCHAR(255) NOT NULL,
+    title TEXT NOT NULL, description TEXT, url VARCHAR(512), author VARCHAR(255), score INTEGER,
+    comments_count INTEGER, engagement_rate FLOAT, virality_score FLOAT, tags JSON,
+    sentiment VARCHAR(50), topic_cluster VARCHAR(100),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP, fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+def test_upgrade_backfills_trend_tags(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/pre-series.db")
+    with engine.begin() as connection:
+        connection.execute(text(PRE_SERIES_SCHEMA))
+        for i, tags in enumerate(['["Python", "web"]', '["python"]', '["rust"]', '["Python", "rust"]']):
+            connection.execute(text(
+                "INSERT INTO trending_content (platform, content_id, title, virality_score, tags) "
+                "VALUES ('reddit', :content_id, :title, :virality, :tags)"
+            ), {"content_id": f"post{i}", "title": f"Post {i}", "virality": float(i), "tags": tags})
+
+    run_migrations(engine)
+
+    assert current_version(engine) == LATEST_VERSION
+    with engine.connect() as connection:
+        assert connection.execute(text(f"SELECT COUNT(*) FROM {TrendTag.__tablename__}")).scalar() == 6
+    db = sessionmaker(bind=engine)()
+    try:
+        found = TrendAnalyzer().get_trending_content(db, 50, tags=["python"])
+    finally:
+        db.close()
+    assert sorted(item["title"] for item in found) == ["Post 0", "Post 1", "Post 3"]
@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+import main
+
+def test_subreddit_keys_ignore_case():
+    client = TestClient(main.app)
+    response = client.post("/sources", json={"kind": "subreddit", "key": "Python"})
+    assert response.status_code == 200
+    assert response.json()["source"]["key"] == "python"
+
+    # The same subreddit under another spelling is one source, not two
+    client.post("/sources", json={"kind": "subreddit", "key": "PYTHON"})
+    keys = [source["key"] for source in client.get("/sources").json()["sources"] if source["kind"] == "subreddit"]
+    assert keys == ["python"]
+
+    assert client.delete("/sources/subreddit/python").status_code == 200
+    assert client.delete("/sources/subreddit/Python").status_code == 404